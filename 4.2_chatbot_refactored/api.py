@@ -1,4 +1,5 @@
 import requests
+import json
 import os
 import sys
 
@@ -56,3 +57,46 @@ def call_zhipu_api(messages, model="glm-4-flash"):
     else:
         raise Exception(f"API调用失败: {response.status_code}, {response.text}")
 
+def stream_zhipu_api(messages, model="glm-4-flash"):
+    """
+    以流式方式调用智谱API，逐段返回AI回复
+
+    参数：
+        messages: 对话消息列表，格式：[{"role": "user", "content": "..."}]
+        model: 模型名称，默认为 "glm-4-flash"
+
+    返回：
+        生成器，每次产出一段回复文本
+    """
+    url = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+
+    headers = {
+        "Authorization": ZHIPU_API_KEY,
+        "Content-Type": "application/json"
+    }
+
+    data = {
+        "model": model,
+        "messages": messages,
+        "temperature": 0.5,
+        "stream": True
+    }
+
+    response = requests.post(url, headers=headers, json=data, stream=True)
+
+    if response.status_code != 200:
+        raise Exception(f"API调用失败: {response.status_code}, {response.text}")
+
+    # SSE 响应未声明编码时 requests 默认按 ISO-8859-1 解码
+    response.encoding = 'utf-8'
+    with response:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            payload = line[len('data:'):].strip()
+            if payload == '[DONE]':
+                break
+            chunk = json.loads(payload)
+            delta = chunk['choices'][0].get('delta', {}).get('content')
+            if delta:
+                yield delta
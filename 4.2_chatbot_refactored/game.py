@@ -1,14 +1,14 @@
 import sys
 import os
 
-from api import call_zhipu_api
+from api import call_zhipu_api, stream_zhipu_api
 
 # 导入TTS功能（从上级目录）
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, parent_dir)
 
 try:
-    from xunfei_tts import text_to_speech
+    from xunfei_tts import SpeechPipeline
     TTS_AVAILABLE = True
 except ImportError:
     TTS_AVAILABLE = False
@@ -18,6 +18,9 @@ def play_round(conversation_history, user_input, enable_tts=True):
     """
     进行一轮游戏对话
     
+    启用TTS时以流式方式获取回复，边生成边朗读：
+    每切出一个完整句子就开始合成，播放当前句子时下一句已在合成
+    
     参数：
         conversation_history: 对话历史列表
         user_input: 用户输入
@@ -29,26 +32,55 @@ def play_round(conversation_history, user_input, enable_tts=True):
     # 添加用户消息到历史
     conversation_history.append({"role": "user", "content": user_input})
     
-    # 调用API获取回复
-    result = call_zhipu_api(conversation_history)
-    assistant_reply = result['choices'][0]['message']['content']
+    if enable_tts and TTS_AVAILABLE:
+        assistant_reply = stream_round_with_tts(conversation_history)
+    else:
+        # 调用API获取回复
+        result = call_zhipu_api(conversation_history)
+        assistant_reply = result['choices'][0]['message']['content']
+        
+        # 打印回复
+        print(f"\n🤖 AI回复: {assistant_reply}\n")
     
     # 添加AI回复到历史
     conversation_history.append({"role": "assistant", "content": assistant_reply})
     
-    # 打印回复
-    print(f"\n🤖 AI回复: {assistant_reply}\n")
-    
-    # 使用TTS播放AI的回复（如果启用且可用）
-    if enable_tts and TTS_AVAILABLE:
-        try:
-            print("🔊 正在生成并播放语音，请稍候...")
-            text_to_speech(assistant_reply)
-            print("✅ 语音播放完成\n")
-        except Exception as e:
-            print(f"⚠️ 语音播放失败: {e}")
-            import traceback
-            traceback.print_exc()
-    
     return assistant_reply
 
+def stream_round_with_tts(conversation_history):
+    """
+    流式获取AI回复并同时朗读
+    
+    参数：
+        conversation_history: 对话历史列表（已包含本轮用户消息）
+    
+    返回：
+        完整的AI回复内容
+    """
+    pipeline = None
+    try:
+        pipeline = SpeechPipeline()
+    except Exception as e:
+        print(f"⚠️ 语音播放失败: {e}")
+    
+    print("\n🤖 AI回复: ", end="", flush=True)
+    parts = []
+    try:
+        for delta in stream_zhipu_api(conversation_history):
+            parts.append(delta)
+            print(delta, end="", flush=True)
+            if pipeline is not None:
+                pipeline.feed(delta)
+    finally:
+        print("\n")
+        # 等待剩余句子合成并播放完成（LLM调用出错时也要结束播放线程）
+        if pipeline is not None:
+            try:
+                pipeline.close()
+                print("✅ 语音播放完成\n")
+            except Exception as e:
+                print(f"⚠️ 语音播放失败: {e}")
+                import traceback
+                traceback.print_exc()
+    
+    return "".join(parts)
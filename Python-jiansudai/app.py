@@ -1,23 +1,39 @@
-from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context, send_file
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context, send_file, has_request_context
 from flask_cors import CORS
 import sys
 import os
-import sqlite3
 import json
+import math
 from datetime import datetime
 import traceback
 import time
-from functools import lru_cache
+import csv
+import io
+import threading
+import uuid
+from functools import lru_cache, partial
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 
 # 添加 ren 文件夹到路径（角色模块）
 sys.path.append(os.path.join(os.path.dirname(__file__), 'ren'))
 
 # 导入各个角色模块
 from ren import gcs, ll, aqy, jt, wl, d3
+import zhipu_client
+import physics_engine
+import db
+import write_behind
+import statistics_store
+import llm_cache
+import resilience
+import rate_limiter
+import prompt_registry
+import chat_context
 
 # 导入新功能模块
 try:
+    import role_collaboration
     from role_collaboration import RoleDebateManager, create_debate_visualization_data
     from personalization import get_profile_manager
     from social_features import get_social_manager
@@ -49,157 +65,174 @@ def after_request(response):
 # 数据库初始化
 def init_db():
     """初始化数据库"""
-    conn = sqlite3.connect('simulation_data.db')
-    c = conn.cursor()
-    
-    # 用户选择记录表
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS user_choices (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            vehicle TEXT,
-            bump TEXT,
-            location TEXT,
-            speed REAL,
-            survival_rate REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 角色分析结果表
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS role_analyses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            role_name TEXT,
-            analysis_text TEXT,
-            metadata TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 对话记录表
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            role_name TEXT,
-            user_message TEXT,
-            assistant_message TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 统计数据表
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS statistics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            metric_name TEXT,
-            metric_value TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 角色辩论记录表
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS role_debates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            debate_id TEXT,
-            round_number INTEGER,
-            role_name TEXT,
-            content TEXT,
-            response_to_role TEXT,
-            conflict_points TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 用户画像表
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS user_profiles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT UNIQUE,
-            knowledge_level TEXT,
-            interest_areas TEXT,
-            learning_preferences TEXT,
-            risk_tolerance TEXT,
-            ethical_orientation TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 评论和讨论表
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS comments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            parent_id INTEGER,
-            user_id TEXT,
-            content TEXT,
-            likes INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 分享记录表
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS shares (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            share_code TEXT UNIQUE,
-            share_type TEXT,
-            share_data TEXT,
-            view_count INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 协作学习记录表
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS collaborations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            collaborator_id TEXT,
-            collaboration_type TEXT,
-            content TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    with db.transaction() as c:
+        # 用户选择记录表
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS user_choices (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                vehicle TEXT,
+                bump TEXT,
+                location TEXT,
+                speed REAL,
+                survival_rate REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 角色分析结果表
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS role_analyses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                role_name TEXT,
+                analysis_text TEXT,
+                metadata TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 对话记录表
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                role_name TEXT,
+                user_message TEXT,
+                assistant_message TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 统计数据表
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS statistics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                metric_name TEXT,
+                metric_value TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 角色辩论记录表
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS role_debates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                debate_id TEXT,
+                round_number INTEGER,
+                role_name TEXT,
+                content TEXT,
+                response_to_role TEXT,
+                conflict_points TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 辩论元数据表（流式辩论断线续传用）
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS debates (
+                debate_id TEXT PRIMARY KEY,
+                session_id TEXT,
+                user_choice TEXT,
+                roles TEXT,
+                rounds INTEGER,
+                mode TEXT,
+                status TEXT DEFAULT 'running',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 用户画像表
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS user_profiles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT UNIQUE,
+                knowledge_level TEXT,
+                interest_areas TEXT,
+                learning_preferences TEXT,
+                risk_tolerance TEXT,
+                ethical_orientation TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 评论和讨论表
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS comments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                parent_id INTEGER,
+                user_id TEXT,
+                content TEXT,
+                likes INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 分享记录表
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS shares (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                share_code TEXT UNIQUE,
+                share_type TEXT,
+                share_data TEXT,
+                view_count INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 协作学习记录表
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS collaborations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                collaborator_id TEXT,
+                collaboration_type TEXT,
+                content TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
     
-    conn.commit()
-    conn.close()
+    # 索引等增量结构变更
+    db.migrate()
 
 # ========== LRU缓存实现 ==========
 class LRUCache:
-    """LRU缓存实现"""
+    """LRU缓存实现（线程安全）"""
     def __init__(self, capacity=1000):
         self.cache = OrderedDict()
         self.capacity = capacity
+        self.lock = threading.Lock()
     
     def get(self, key):
         """获取缓存值"""
-        if key in self.cache:
-            # 移动到末尾（最近使用）
-            self.cache.move_to_end(key)
-            return self.cache[key]
-        return None
+        with self.lock:
+            if key in self.cache:
+                # 移动到末尾（最近使用）
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            return None
     
     def put(self, key, value):
         """添加缓存值"""
-        if key in self.cache:
-            # 更新值并移动到末尾
-            self.cache.move_to_end(key)
-        else:
-            # 如果超过容量，删除最旧的项
-            if len(self.cache) >= self.capacity:
-                self.cache.popitem(last=False)
-        self.cache[key] = value
+        with self.lock:
+            if key in self.cache:
+                # 更新值并移动到末尾
+                self.cache.move_to_end(key)
+            else:
+                # 如果超过容量，删除最旧的项
+                if len(self.cache) >= self.capacity:
+                    self.cache.popitem(last=False)
+            self.cache[key] = value
     
     def clear(self):
         """清空缓存"""
-        self.cache.clear()
+        with self.lock:
+            self.cache.clear()
 
 # 创建全局缓存实例
 chart_data_cache = LRUCache(capacity=1000)
@@ -215,20 +248,307 @@ ROLES = {
     'designer': {'module': d3, 'name': '可视化设计师'}
 }
 
+# 角色提示词注册表：启动时加载一次（优先使用 prompt_versions.db 中的活动版本），切换活动版本时自动重新加载
+role_prompts = prompt_registry.PromptRegistry(ROLES).load()
+
 def get_role_personality(role_key):
-    """获取角色人格设定"""
+    """获取角色人格设定（未知角色返回 None）"""
+    return role_prompts.get(role_key)
+
+# 上游调用的限流优先级：交互类接口先于批量类接口出队，其余接口为普通优先级
+ROUTE_PRIORITIES = {
+    '/api/chat': rate_limiter.PRIORITY_INTERACTIVE,
+    '/api/learning/path': rate_limiter.PRIORITY_BATCH,
+    '/api/debate': rate_limiter.PRIORITY_BATCH,
+}
+
+def request_priority():
+    """当前请求对应的限流优先级（不在请求上下文中时为普通优先级）"""
+    if has_request_context():
+        return ROUTE_PRIORITIES.get(request.path, rate_limiter.PRIORITY_NORMAL)
+    return rate_limiter.PRIORITY_NORMAL
+
+def call_role_api(role_key, messages, model="glm-4-flash", temperature=0.5, use_cache=False, deadline=None, priority=None):
+    """
+    调用角色API
+    
+    相同 (角色, 模型, 温度, 消息) 的并发调用合并为一次上游请求，共享结果或异常；
+    use_cache=True 时还会直接返回缓存结果，只用于提示词完全由离散参数决定的接口，
+    失败的调用不会被缓存；deadline 为整个调用（含重试）的截止时间（time.monotonic() 时间戳）；
+    priority 为限流排队优先级，为None时按当前请求的接口确定
+    """
     if role_key not in ROLES:
-        return None
+        raise ValueError(f"Invalid role: {role_key}")
     role_module = ROLES[role_key]['module']
-    role_name = ROLES[role_key]['name']
-    return role_module.roles(role_name)
+    if priority is None:
+        priority = request_priority()
+    
+    cache = llm_cache.get_llm_cache()
+    cache_key = cache.make_key(role_key, model, temperature, messages)
+    if use_cache:
+        response = cache.get(cache_key)
+        if response is not None:
+            return response
+    
+    def fetch():
+        response = role_module.call_zhipu_api(
+            messages, model=model, temperature=temperature, deadline=deadline, priority=priority
+        )
+        if use_cache:
+            cache.put(cache_key, response)
+        return response
+    
+    return llm_cache.get_single_flight().do(cache_key, fetch, deadline)
 
-def call_role_api(role_key, messages):
-    """调用角色API"""
+def stream_role_api(role_key, messages, deadline=None, priority=None):
+    """以流式方式调用角色API，逐步返回生成的文本片段（priority 为None时按当前请求的接口确定）"""
     if role_key not in ROLES:
         raise ValueError(f"Invalid role: {role_key}")
-    role_module = ROLES[role_key]['module']
-    return role_module.call_zhipu_api(messages)
+    if priority is None:
+        priority = request_priority()
+    return zhipu_client.stream_zhipu_api(messages, deadline=deadline, priority=priority)
+
+# ========== 多角色并发分析 ==========
+
+# 参与 /api/analyze 的角色（按返回顺序）
+ANALYZE_ROLES = ['ethicist', 'safety', 'physicist', 'traffic']
+# 单个角色的分析截止时间（秒），超时的角色返回错误，不影响其他角色
+ANALYZE_ROLE_TIMEOUT = float(os.getenv('ANALYZE_ROLE_TIMEOUT', '45'))
+# 角色分析线程池：各角色的 LLM 调用并发执行，请求耗时取决于最慢的角色
+analyze_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ANALYZE_MAX_WORKERS', '32')),
+    thread_name_prefix='analyze'
+)
+
+def _build_ethicist_result(analysis, vehicle, location, speed, survival_rate):
+    """伦理学家：计算正义度"""
+    # 计算正义度 - 修正逻辑：学校门口应该是忽视学生安全，降低分数
+    social_justice = 50
+    personal_responsibility = 50
+    
+    # 地点影响社会正义（学校门口 = 忽视学生安全 = 降低分数）
+    if location == '学校门口':
+        # 在学校门口进行实验本身就是忽视学生安全的行为
+        social_justice -= 40  # 严重降低社会正义
+        personal_responsibility -= 30  # 降低个人责任
+        if speed >= 50:
+            # 高速更严重
+            social_justice -= 20
+            personal_responsibility -= 15
+    elif location == '山地滑坡':
+        # 选择极端危险地点 = 极度忽视安全
+        social_justice -= 50
+        personal_responsibility -= 40
+    elif location == '普通跑道':
+        # 选择安全测试环境 = 体现责任意识
+        social_justice += 15
+        personal_responsibility += 10
+    
+    # 速度影响个人责任（速度越高，责任越低）
+    if speed >= 70:
+        personal_responsibility -= 25
+        social_justice -= 15
+    elif speed >= 50:
+        personal_responsibility -= 15
+        social_justice -= 10
+    elif speed < 30:
+        personal_responsibility += 15
+        social_justice += 10
+    
+    # 车辆类型影响社会正义（豪华车可能体现资源浪费）
+    if vehicle == '豪华轿车':
+        social_justice -= 10
+    elif vehicle == '节能型小型车':
+        social_justice += 10
+    
+    result = {
+        'analysis': analysis,
+        'role': '伦理学家',
+        'social_justice': min(100, max(0, social_justice)),
+        'personal_responsibility': min(100, max(0, personal_responsibility))
+    }
+    
+    print(f"[伦理学家分析] 地点={location}, 速度={speed}km/h")
+    print(f"[伦理学家分析] 计算正义度: 社会正义={result['social_justice']}, 个人责任={result['personal_responsibility']}")
+    print(f"[伦理学家分析] 分析内容预览: {analysis[:200]}...")
+    return result
+
+def _build_safety_result(analysis, vehicle, location, speed, survival_rate):
+    """安全员：风险等级与建议"""
+    risk_level = 'low' if survival_rate >= 80 else ('medium' if survival_rate >= 60 else 'high')
+    recommendations = []
+    if speed >= 50:
+        recommendations.append('建议降低速度以提高安全性')
+    if survival_rate < 60:
+        recommendations.append('当前参数组合存在较高风险')
+    if not recommendations:
+        recommendations.append('当前参数组合相对安全')
+    
+    return {
+        'analysis': analysis,
+        'role': '安全员',
+        'risk_level': risk_level,
+        'recommendations': recommendations
+    }
+
+def _build_physicist_result(analysis, vehicle, location, speed, survival_rate):
+    """物理学家：计算物理参数"""
+    v0 = speed / 3.6  # m/s
+    max_acceleration = v0 * 2 + 5  # 简化的加速度计算
+    impact_force = v0 * 1000 + 2000  # 简化的冲击力计算
+    
+    return {
+        'analysis': analysis,
+        'role': '物理学家',
+        'max_acceleration': round(max_acceleration, 2),
+        'impact_force': round(impact_force, 0),
+        'velocity': round(v0, 2)
+    }
+
+def _build_traffic_result(analysis, vehicle, location, speed, survival_rate):
+    """交通工程师：道路设计评分"""
+    return {
+        'analysis': analysis,
+        'role': '交通工程师',
+        'road_design_score': min(100, max(0, 50 + (survival_rate - 50) * 0.4))
+    }
+
+ANALYZE_RESULT_BUILDERS = {
+    'ethicist': _build_ethicist_result,
+    'safety': _build_safety_result,
+    'physicist': _build_physicist_result,
+    'traffic': _build_traffic_result
+}
+
+def save_user_choice(session_id, vehicle, bump, location, speed, survival_rate):
+    """保存用户选择，并更新统计数据"""
+    with db.transaction() as c:
+        c.execute('''
+            INSERT INTO user_choices (session_id, vehicle, bump, location, speed, survival_rate)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (session_id, vehicle, bump, location, speed, survival_rate))
+    statistics_store.get_statistics_store().record_choice(vehicle, location, speed, survival_rate)
+
+def build_analyze_query(vehicle, bump, location, speed, survival_rate):
+    """构建 /api/analyze 的分析查询 - 明确伦理问题"""
+    location_ethical_issue = ""
+    if location == "学校门口":
+        location_ethical_issue = "⚠️ 重要伦理问题：用户选择在学校门口进行高速实验，这是对弱势群体（学生）安全的忽视。学校门口是儿童和青少年聚集的地方，任何高速驾驶实验都会严重威胁他们的生命安全。这反映了个人便利与公共安全责任的严重冲突。"
+    elif location == "山地滑坡":
+        location_ethical_issue = "⚠️ 极高风险：用户选择了极端危险的地点，这体现了对自身和他人安全的极度忽视。"
+    elif location == "普通跑道":
+        location_ethical_issue = "用户选择了相对安全的测试环境，体现了对风险控制的考虑。"
+    
+    user_query = f"""
+用户在《飞跃减速带》实验中选择：
+- 车辆：{vehicle}
+- 减速带：{bump}
+- 地点：{location}
+- 速度：{speed} km/h
+- 幸存率：{survival_rate}%
+
+【重要伦理问题】
+{location_ethical_issue}
+
+【分析要求】
+请基于你的专业角度，深入分析这个选择背后的伦理意义：
+1. **地点选择的伦理含义**：选择{location}作为实验地点，特别是如果速度较高，这反映了什么伦理问题？
+   - 如果地点是"学校门口"：这体现了对弱势群体（学生）安全的忽视，是严重的伦理问题，应该降低社会正义和个人责任评分
+   - 如果地点是"山地滑坡"：这体现了对极端风险的追求，是对安全的极度忽视
+2. **速度选择的伦理含义**：速度{speed} km/h的选择反映了什么价值观？
+3. **综合伦理评估**：这个选择组合体现了什么样的伦理倾向？
+
+请给出深刻、准确的专业分析，明确指出伦理问题，不要美化或回避问题。
+"""
+    return user_query
+
+def collect_analyze_results(session_id, outcomes):
+    """
+    汇总各角色的分析结果并保存成功的结果
+    
+    Args:
+        outcomes: {role_key: 结果字典，未在截止时间内完成的角色为 None}
+    """
+    results = {}
+    for role_key, result in outcomes.items():
+        if result is None:
+            # 超时的角色不取消其他角色，只返回错误
+            results[role_key] = {
+                'error': f'{ROLES[role_key]["name"]}分析超时（{ANALYZE_ROLE_TIMEOUT:g}秒）',
+                'timeout': True
+            }
+            continue
+        
+        results[role_key] = result
+        if 'error' in result:
+            continue
+        
+        # 保存分析结果
+        try:
+            write_behind.record_role_analysis(session_id, role_key, result['analysis'], json.dumps(result))
+        except Exception as e:
+            results[role_key] = {'error': str(e), 'traceback': traceback.format_exc()}
+    return results
+
+def run_role_analysis(role_key, user_query, vehicle, location, speed, survival_rate, deadline=None):
+    """在线程池中执行单个角色的分析，异常作为该角色的错误结果返回"""
+    try:
+        messages = [
+            {"role": "system", "content": get_role_personality(role_key)},
+            {"role": "user", "content": user_query}
+        ]
+        response = call_role_api(role_key, messages, deadline=deadline)
+        analysis = response['choices'][0]['message']['content']
+        return ANALYZE_RESULT_BUILDERS[role_key](analysis, vehicle, location, speed, survival_rate)
+    except Exception as e:
+        return {'error': str(e), 'traceback': traceback.format_exc()}
+
+def build_role_messages(role_key, query):
+    """角色人格设定 + 用户查询"""
+    return [
+        {"role": "system", "content": get_role_personality(role_key)},
+        {"role": "user", "content": query}
+    ]
+
+def build_chat_messages(role, message, history, session_id=None):
+    """构建 /api/chat 的消息列表（按 token 预算保留最近的历史，更早的对话压缩为摘要）"""
+    # 获取角色人格设定
+    role_personality = get_role_personality(role)
+    return chat_context.get_context_manager().build(role_personality, history, message, session_id, role)
+
+def build_physics_explanation_messages(vehicle, bump, location, weather, speed, result_data):
+    """物理学家只负责解释已经算好的结果"""
+    query = f"""
+请作为物理学家，用2-3句话向用户解释以下弹簧-质量-阻尼系统模型的计算结果（数值已经计算完成，不要重新计算或修改）：
+
+【输入参数】
+- 车辆类型：{vehicle}
+- 减速带类型：{bump}
+- 地点：{location}
+- 天气条件：{weather}
+- 初始速度：{speed} km/h
+
+【计算结果】
+{json.dumps(result_data, ensure_ascii=False, indent=2)}
+"""
+    return [
+        {"role": "system", "content": get_role_personality('physicist')},
+        {"role": "user", "content": query}
+    ]
+
+def save_physics_calculation(session_id, vehicle, bump, location, speed, result_data, analysis_text):
+    """保存物理计算结果（失败只记录警告）"""
+    try:
+        write_behind.record_role_analysis(session_id, 'physicist_calculation', analysis_text, json.dumps({
+            'type': 'physics_calculation',
+            'vehicle': vehicle,
+            'bump': bump,
+            'speed': speed,
+            'location': location,
+            'result': result_data
+        }))
+    except Exception as db_error:
+        print(f"警告：保存计算结果到数据库失败: {db_error}")
 
 # ========== API 路由 ==========
 
@@ -254,9 +574,30 @@ def health_check():
     return jsonify({
         'status': 'ok',
         'message': '服务器运行正常',
-        'timestamp': datetime.now().isoformat()
+        'timestamp': datetime.now().isoformat(),
+        'persistence': write_behind.get_writer().stats(),
+        'circuit_breakers': resilience.breaker_states(),
+        'rate_limits': rate_limiter.limiter_states(),
+        'prompt_versions': dict(role_prompts.versions())
     }), 200
 
+@app.route('/api/cache/stats', methods=['GET', 'OPTIONS'])
+def get_cache_stats():
+    """缓存统计 - LLM响应缓存的命中/未命中计数、并发请求合并计数及对话摘要缓存统计"""
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', '*')
+        response.headers.add('Access-Control-Allow-Methods', '*')
+        return response, 200
+    return jsonify({
+        'success': True,
+        'llm_cache': llm_cache.get_llm_cache().stats(),
+        'single_flight': llm_cache.get_single_flight().stats(),
+        'async_single_flight': llm_cache.get_async_single_flight().stats(),
+        'chat_context': chat_context.get_context_manager().stats()
+    })
+
 @app.route('/api/analyze', methods=['POST', 'OPTIONS'])
 def analyze():
     """分析用户选择，返回多角色分析结果"""
@@ -276,220 +617,26 @@ def analyze():
         survival_rate = data.get('survival_rate', 0)
         
         # 保存用户选择到数据库
-        conn = sqlite3.connect('simulation_data.db')
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO user_choices (session_id, vehicle, bump, location, speed, survival_rate)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (session_id, vehicle, bump, location, speed, survival_rate))
-        conn.commit()
-        conn.close()
+        save_user_choice(session_id, vehicle, bump, location, speed, survival_rate)
         
         # 构建分析查询 - 明确伦理问题
-        location_ethical_issue = ""
-        if location == "学校门口":
-            location_ethical_issue = "⚠️ 重要伦理问题：用户选择在学校门口进行高速实验，这是对弱势群体（学生）安全的忽视。学校门口是儿童和青少年聚集的地方，任何高速驾驶实验都会严重威胁他们的生命安全。这反映了个人便利与公共安全责任的严重冲突。"
-        elif location == "山地滑坡":
-            location_ethical_issue = "⚠️ 极高风险：用户选择了极端危险的地点，这体现了对自身和他人安全的极度忽视。"
-        elif location == "普通跑道":
-            location_ethical_issue = "用户选择了相对安全的测试环境，体现了对风险控制的考虑。"
-        
-        user_query = f"""
-用户在《飞跃减速带》实验中选择：
-- 车辆：{vehicle}
-- 减速带：{bump}
-- 地点：{location}
-- 速度：{speed} km/h
-- 幸存率：{survival_rate}%
-
-【重要伦理问题】
-{location_ethical_issue}
-
-【分析要求】
-请基于你的专业角度，深入分析这个选择背后的伦理意义：
-1. **地点选择的伦理含义**：选择{location}作为实验地点，特别是如果速度较高，这反映了什么伦理问题？
-   - 如果地点是"学校门口"：这体现了对弱势群体（学生）安全的忽视，是严重的伦理问题，应该降低社会正义和个人责任评分
-   - 如果地点是"山地滑坡"：这体现了对极端风险的追求，是对安全的极度忽视
-2. **速度选择的伦理含义**：速度{speed} km/h的选择反映了什么价值观？
-3. **综合伦理评估**：这个选择组合体现了什么样的伦理倾向？
-
-请给出深刻、准确的专业分析，明确指出伦理问题，不要美化或回避问题。
-"""
-        
-        results = {}
+        user_query = build_analyze_query(vehicle, bump, location, speed, survival_rate)
         
-        # 伦理学家分析
-        try:
-            ethicist_personality = get_role_personality('ethicist')
-            messages = [
-                {"role": "system", "content": ethicist_personality},
-                {"role": "user", "content": user_query}
-            ]
-            response = call_role_api('ethicist', messages)
-            ethicist_analysis = response['choices'][0]['message']['content']
-            
-            # 计算正义度 - 修正逻辑：学校门口应该是忽视学生安全，降低分数
-            social_justice = 50
-            personal_responsibility = 50
-            
-            # 地点影响社会正义（学校门口 = 忽视学生安全 = 降低分数）
-            if location == '学校门口':
-                # 在学校门口进行实验本身就是忽视学生安全的行为
-                social_justice -= 40  # 严重降低社会正义
-                personal_responsibility -= 30  # 降低个人责任
-                if speed >= 50:
-                    # 高速更严重
-                    social_justice -= 20
-                    personal_responsibility -= 15
-            elif location == '山地滑坡':
-                # 选择极端危险地点 = 极度忽视安全
-                social_justice -= 50
-                personal_responsibility -= 40
-            elif location == '普通跑道':
-                # 选择安全测试环境 = 体现责任意识
-                social_justice += 15
-                personal_responsibility += 10
-            
-            # 速度影响个人责任（速度越高，责任越低）
-            if speed >= 70:
-                personal_responsibility -= 25
-                social_justice -= 15
-            elif speed >= 50:
-                personal_responsibility -= 15
-                social_justice -= 10
-            elif speed < 30:
-                personal_responsibility += 15
-                social_justice += 10
-            
-            # 车辆类型影响社会正义（豪华车可能体现资源浪费）
-            if vehicle == '豪华轿车':
-                social_justice -= 10
-            elif vehicle == '节能型小型车':
-                social_justice += 10
-            
-            results['ethicist'] = {
-                'analysis': ethicist_analysis,
-                'role': '伦理学家',
-                'social_justice': min(100, max(0, social_justice)),
-                'personal_responsibility': min(100, max(0, personal_responsibility))
-            }
-            
-            print(f"[伦理学家分析] 地点={location}, 速度={speed}km/h")
-            print(f"[伦理学家分析] 计算正义度: 社会正义={results['ethicist']['social_justice']}, 个人责任={results['ethicist']['personal_responsibility']}")
-            print(f"[伦理学家分析] 分析内容预览: {ethicist_analysis[:200]}...")
-            
-            # 保存分析结果
-            conn = sqlite3.connect('simulation_data.db')
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO role_analyses (session_id, role_name, analysis_text, metadata)
-                VALUES (?, ?, ?, ?)
-            ''', (session_id, 'ethicist', ethicist_analysis, json.dumps(results['ethicist'])))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            results['ethicist'] = {'error': str(e), 'traceback': traceback.format_exc()}
-        
-        # 安全员分析
-        try:
-            safety_personality = get_role_personality('safety')
-            messages = [
-                {"role": "system", "content": safety_personality},
-                {"role": "user", "content": user_query}
-            ]
-            response = call_role_api('safety', messages)
-            safety_analysis = response['choices'][0]['message']['content']
-            
-            risk_level = 'low' if survival_rate >= 80 else ('medium' if survival_rate >= 60 else 'high')
-            recommendations = []
-            if speed >= 50:
-                recommendations.append('建议降低速度以提高安全性')
-            if survival_rate < 60:
-                recommendations.append('当前参数组合存在较高风险')
-            if not recommendations:
-                recommendations.append('当前参数组合相对安全')
-            
-            results['safety'] = {
-                'analysis': safety_analysis,
-                'role': '安全员',
-                'risk_level': risk_level,
-                'recommendations': recommendations
-            }
-            
-            # 保存分析结果
-            conn = sqlite3.connect('simulation_data.db')
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO role_analyses (session_id, role_name, analysis_text, metadata)
-                VALUES (?, ?, ?, ?)
-            ''', (session_id, 'safety', safety_analysis, json.dumps(results['safety'])))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            results['safety'] = {'error': str(e), 'traceback': traceback.format_exc()}
-        
-        # 物理学家分析
-        try:
-            physicist_personality = get_role_personality('physicist')
-            messages = [
-                {"role": "system", "content": physicist_personality},
-                {"role": "user", "content": user_query}
-            ]
-            response = call_role_api('physicist', messages)
-            physicist_analysis = response['choices'][0]['message']['content']
-            
-            # 计算物理参数
-            v0 = speed / 3.6  # m/s
-            max_acceleration = v0 * 2 + 5  # 简化的加速度计算
-            impact_force = v0 * 1000 + 2000  # 简化的冲击力计算
-            
-            results['physicist'] = {
-                'analysis': physicist_analysis,
-                'role': '物理学家',
-                'max_acceleration': round(max_acceleration, 2),
-                'impact_force': round(impact_force, 0),
-                'velocity': round(v0, 2)
-            }
-            
-            # 保存分析结果
-            conn = sqlite3.connect('simulation_data.db')
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO role_analyses (session_id, role_name, analysis_text, metadata)
-                VALUES (?, ?, ?, ?)
-            ''', (session_id, 'physicist', physicist_analysis, json.dumps(results['physicist'])))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            results['physicist'] = {'error': str(e), 'traceback': traceback.format_exc()}
+        # 各角色并发分析，所有角色共享同一截止时间（同时传给上游调用，重试不会超出）
+        deadline = time.monotonic() + ANALYZE_ROLE_TIMEOUT
+        futures = {
+            role_key: analyze_executor.submit(
+                run_role_analysis, role_key, user_query, vehicle, location, speed, survival_rate, deadline
+            )
+            for role_key in ANALYZE_ROLES
+        }
+        wait(futures.values(), timeout=max(0, deadline - time.monotonic()))
         
-        # 交通工程师分析
-        try:
-            traffic_personality = get_role_personality('traffic')
-            messages = [
-                {"role": "system", "content": traffic_personality},
-                {"role": "user", "content": user_query}
-            ]
-            response = call_role_api('traffic', messages)
-            traffic_analysis = response['choices'][0]['message']['content']
-            
-            results['traffic'] = {
-                'analysis': traffic_analysis,
-                'role': '交通工程师',
-                'road_design_score': min(100, max(0, 50 + (survival_rate - 50) * 0.4))
-            }
-            
-            # 保存分析结果
-            conn = sqlite3.connect('simulation_data.db')
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO role_analyses (session_id, role_name, analysis_text, metadata)
-                VALUES (?, ?, ?, ?)
-            ''', (session_id, 'traffic', traffic_analysis, json.dumps(results['traffic'])))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            results['traffic'] = {'error': str(e), 'traceback': traceback.format_exc()}
+        outcomes = {
+            role_key: future.result() if future.done() else None
+            for role_key, future in futures.items()
+        }
+        results = collect_analyze_results(session_id, outcomes)
         
         return jsonify({
             'success': True,
@@ -523,33 +670,14 @@ def chat():
         if role not in ROLES:
             return jsonify({'error': 'Invalid role'}), 400
         
-        # 获取角色人格设定
-        role_personality = get_role_personality(role)
-        
-        # 构建消息列表
-        messages = [{"role": "system", "content": role_personality}]
-        
-        # 添加历史对话（限制最近10轮）
-        if history:
-            recent_history = history[-20:]  # 最近20条消息（10轮对话）
-            messages.extend(recent_history)
-        
-        # 添加当前用户消息
-        messages.append({"role": "user", "content": message})
+        messages = build_chat_messages(role, message, history, session_id)
         
         # 调用API
         response = call_role_api(role, messages)
         assistant_reply = response['choices'][0]['message']['content']
         
         # 保存对话记录
-        conn = sqlite3.connect('simulation_data.db')
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO conversations (session_id, role_name, user_message, assistant_message)
-            VALUES (?, ?, ?, ?)
-        ''', (session_id, role, message, assistant_reply))
-        conn.commit()
-        conn.close()
+        write_behind.record_conversation(session_id, role, message, assistant_reply)
         
         return jsonify({
             'success': True,
@@ -604,7 +732,7 @@ def advanced_simulation():
             {"role": "user", "content": query}
         ]
         
-        response = call_role_api('physicist', messages)
+        response = call_role_api('physicist', messages, use_cache=not data.get('no_cache', False))
         physics_analysis = response['choices'][0]['message']['content']
         
         return jsonify({
@@ -636,23 +764,20 @@ def generate_report():
         session_id = data.get('session_id')
         
         # 从数据库获取所有分析结果
-        conn = sqlite3.connect('simulation_data.db')
-        c = conn.cursor()
-        
-        # 获取用户选择
-        c.execute('''
-            SELECT * FROM user_choices WHERE session_id = ? ORDER BY created_at DESC LIMIT 1
-        ''', (session_id,))
-        choice = c.fetchone()
-        
-        # 获取所有角色分析
-        c.execute('''
-            SELECT role_name, analysis_text, metadata FROM role_analyses 
-            WHERE session_id = ? ORDER BY created_at
-        ''', (session_id,))
-        analyses = c.fetchall()
-        
-        conn.close()
+        with db.connection() as conn:
+            c = conn.cursor()
+            # 获取用户选择
+            c.execute('''
+                SELECT * FROM user_choices WHERE session_id = ? ORDER BY created_at DESC LIMIT 1
+            ''', (session_id,))
+            choice = c.fetchone()
+            
+            # 获取所有角色分析
+            c.execute('''
+                SELECT role_name, analysis_text, metadata FROM role_analyses 
+                WHERE session_id = ? ORDER BY created_at
+            ''', (session_id,))
+            analyses = c.fetchall()
         
         if not choice:
             return jsonify({'error': 'Session not found'}), 404
@@ -698,46 +823,9 @@ def get_statistics():
         response.headers.add('Access-Control-Allow-Methods', '*')
         return response, 200
     try:
-        conn = sqlite3.connect('simulation_data.db')
-        c = conn.cursor()
-        
-        # 总模拟次数
-        c.execute('SELECT COUNT(*) FROM user_choices')
-        total_simulations = c.fetchone()[0]
-        
-        # 平均速度
-        c.execute('SELECT AVG(speed) FROM user_choices WHERE speed > 0')
-        avg_speed = c.fetchone()[0] or 0
-        
-        # 平均幸存率
-        c.execute('SELECT AVG(survival_rate) FROM user_choices WHERE survival_rate > 0')
-        avg_survival = c.fetchone()[0] or 0
-        
-        # 最受欢迎的车辆
-        c.execute('''
-            SELECT vehicle, COUNT(*) as count FROM user_choices 
-            GROUP BY vehicle ORDER BY count DESC LIMIT 1
-        ''')
-        popular_vehicle = c.fetchone()
-        
-        # 最受欢迎的地点
-        c.execute('''
-            SELECT location, COUNT(*) as count FROM user_choices 
-            GROUP BY location ORDER BY count DESC LIMIT 1
-        ''')
-        popular_location = c.fetchone()
-        
-        conn.close()
-        
         return jsonify({
             'success': True,
-            'statistics': {
-                'total_simulations': total_simulations,
-                'average_speed': round(avg_speed, 2),
-                'average_survival_rate': round(avg_survival, 2),
-                'popular_vehicle': popular_vehicle[0] if popular_vehicle else None,
-                'popular_location': popular_location[0] if popular_location else None
-            }
+            'statistics': statistics_store.get_statistics_store().snapshot()
         })
         
     except Exception as e:
@@ -756,23 +844,20 @@ def get_history(session_id):
         return response, 200
     """获取会话历史"""
     try:
-        conn = sqlite3.connect('simulation_data.db')
-        c = conn.cursor()
-        
-        # 获取用户选择
-        c.execute('''
-            SELECT * FROM user_choices WHERE session_id = ? ORDER BY created_at
-        ''', (session_id,))
-        choices = c.fetchall()
-        
-        # 获取对话记录
-        c.execute('''
-            SELECT role_name, user_message, assistant_message, created_at 
-            FROM conversations WHERE session_id = ? ORDER BY created_at
-        ''', (session_id,))
-        conversations = c.fetchall()
-        
-        conn.close()
+        with db.connection() as conn:
+            c = conn.cursor()
+            # 获取用户选择
+            c.execute('''
+                SELECT * FROM user_choices WHERE session_id = ? ORDER BY created_at
+            ''', (session_id,))
+            choices = c.fetchall()
+            
+            # 获取对话记录
+            c.execute('''
+                SELECT role_name, user_message, assistant_message, created_at 
+                FROM conversations WHERE session_id = ? ORDER BY created_at
+            ''', (session_id,))
+            conversations = c.fetchall()
         
         return jsonify({
             'success': True,
@@ -847,7 +932,7 @@ def recommend():
             {"role": "user", "content": query}
         ]
         
-        response = call_role_api('physicist', messages)
+        response = call_role_api('physicist', messages, use_cache=not data.get('no_cache', False))
         recommendation = response['choices'][0]['message']['content']
         
         return jsonify({
@@ -863,24 +948,9 @@ def recommend():
             'traceback': traceback.format_exc()
         }), 500
 
-@app.route('/api/risk/assess', methods=['POST', 'OPTIONS'])
-def assess_risk():
-    """实时风险评估与预警 - 评估用户当前选择的危险程度"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
-        return response, 200
-    try:
-        data = request.json
-        speed = data.get('speed', 0)
-        vehicle = data.get('vehicle')
-        bump = data.get('bump')
-        location = data.get('location')
-        
-        # 构建风险评估查询
-        query = f"""
+def build_risk_query(vehicle, bump, location, speed):
+    """构建风险评估查询"""
+    return f"""
 用户即将选择：
 - 车辆：{vehicle}
 - 减速带：{bump}
@@ -894,31 +964,40 @@ def assess_risk():
 
 请用专业且易懂的语言回答。
 """
+
+def parse_risk_level(risk_assessment):
+    """从评估文本中提取风险等级（简单解析）"""
+    if '极高' in risk_assessment or '10' in risk_assessment or '9' in risk_assessment:
+        return 'extreme'
+    elif '高' in risk_assessment or '7' in risk_assessment or '8' in risk_assessment:
+        return 'high'
+    elif '中' in risk_assessment or '4' in risk_assessment or '5' in risk_assessment or '6' in risk_assessment:
+        return 'medium'
+    elif '低' in risk_assessment or '1' in risk_assessment or '2' in risk_assessment or '3' in risk_assessment:
+        return 'low'
+    return 'unknown'
+
+@app.route('/api/risk/assess', methods=['POST', 'OPTIONS'])
+def assess_risk():
+    """实时风险评估与预警 - 评估用户当前选择的危险程度"""
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        return response, 200
+    try:
+        data = request.json
+        messages = build_role_messages('safety', build_risk_query(
+            data.get('vehicle'), data.get('bump'), data.get('location'), data.get('speed', 0)
+        ))
         
-        # 调用安全员角色
-        safety_personality = get_role_personality('safety')
-        messages = [
-            {"role": "system", "content": safety_personality},
-            {"role": "user", "content": query}
-        ]
-        
-        response = call_role_api('safety', messages)
+        response = call_role_api('safety', messages, use_cache=not data.get('no_cache', False))
         risk_assessment = response['choices'][0]['message']['content']
         
-        # 尝试提取风险等级（简单解析）
-        risk_level = 'unknown'
-        if '极高' in risk_assessment or '10' in risk_assessment or '9' in risk_assessment:
-            risk_level = 'extreme'
-        elif '高' in risk_assessment or '7' in risk_assessment or '8' in risk_assessment:
-            risk_level = 'high'
-        elif '中' in risk_assessment or '4' in risk_assessment or '5' in risk_assessment or '6' in risk_assessment:
-            risk_level = 'medium'
-        elif '低' in risk_assessment or '1' in risk_assessment or '2' in risk_assessment or '3' in risk_assessment:
-            risk_level = 'low'
-        
         return jsonify({
             'success': True,
-            'risk_level': risk_level,
+            'risk_level': parse_risk_level(risk_assessment),
             'assessment': risk_assessment,
             'timestamp': datetime.now().isoformat()
         })
@@ -930,21 +1009,12 @@ def assess_risk():
             'traceback': traceback.format_exc()
         }), 500
 
-@app.route('/api/learning/path', methods=['POST', 'OPTIONS'])
-def generate_learning_path():
-    """个性化学习路径生成 - 基于用户选择模式生成学习路径"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
-        return response, 200
-    try:
-        data = request.json
-        user_choices = data.get('choices', [])
-        session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
-        
-        query = f"""
+# 参与学习路径生成的角色
+LEARNING_PATH_ROLES = ['physicist', 'ethicist', 'safety']
+
+def build_learning_path_query(user_choices):
+    """构建学习路径查询"""
+    return f"""
 用户的选择模式：
 {json.dumps(user_choices, ensure_ascii=False, indent=2)}
 
@@ -961,32 +1031,35 @@ def generate_learning_path():
 
 请用清晰的结构化格式输出。
 """
+
+@app.route('/api/learning/path', methods=['POST', 'OPTIONS'])
+def generate_learning_path():
+    """个性化学习路径生成 - 基于用户选择模式生成学习路径"""
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        return response, 200
+    try:
+        data = request.json
+        user_choices = data.get('choices', [])
+        session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
+        
+        query = build_learning_path_query(user_choices)
         
         # 综合多个角色视角
         learning_paths = {}
-        roles_to_query = ['physicist', 'ethicist', 'safety']
         
-        for role in roles_to_query:
+        for role in LEARNING_PATH_ROLES:
             try:
-                role_personality = get_role_personality(role)
-                messages = [
-                    {"role": "system", "content": role_personality},
-                    {"role": "user", "content": query}
-                ]
-                response = call_role_api(role, messages)
+                response = call_role_api(role, build_role_messages(role, query))
                 learning_paths[role] = response['choices'][0]['message']['content']
             except Exception as e:
                 learning_paths[role] = {'error': str(e)}
         
         # 保存学习路径
-        conn = sqlite3.connect('simulation_data.db')
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO role_analyses (session_id, role_name, analysis_text, metadata)
-            VALUES (?, ?, ?, ?)
-        ''', (session_id, 'learning_path', json.dumps(learning_paths), json.dumps({'type': 'learning_path'})))
-        conn.commit()
-        conn.close()
+        write_behind.record_role_analysis(session_id, 'learning_path', json.dumps(learning_paths), json.dumps({'type': 'learning_path'}))
         
         return jsonify({
             'success': True,
@@ -1048,7 +1121,7 @@ def generate_report_title():
             {"role": "user", "content": query}
         ]
         
-        response = call_role_api('designer', messages)
+        response = call_role_api('designer', messages, use_cache=not data.get('no_cache', False))
         titles_text = response['choices'][0]['message']['content']
         
         # 简单解析标题（可以后续优化）
@@ -1082,29 +1155,20 @@ def generate_report_title():
             'traceback': traceback.format_exc()
         }), 500
 
-@app.route('/api/debate', methods=['POST', 'OPTIONS'])
-def generate_debate():
-    """多角色辩论生成 - 让多个角色就用户的选择进行辩论"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
-        return response, 200
-    try:
-        data = request.json
-        user_choice = data.get('choice', {})
-        session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
-        
-        choice_text = f"""
+# /api/debate 的参与角色（各自独立给出三轮观点）
+SIMPLE_DEBATE_ROLES = ['ethicist', 'safety', 'physicist']
+
+def build_debate_query(user_choice):
+    """构建 /api/debate 的辩论查询"""
+    choice_text = f"""
 - 车辆：{user_choice.get('vehicle', '未知')}
 - 减速带：{user_choice.get('bump', '未知')}
 - 地点：{user_choice.get('location', '未知')}
 - 速度：{user_choice.get('speed', 0)} km/h
 - 幸存率：{user_choice.get('survival_rate', 0)}%
 """
-        
-        query = f"""
+    
+    return f"""
 用户选择了：
 {choice_text}
 
@@ -1115,18 +1179,28 @@ def generate_debate():
 
 请用清晰的结构，每轮用"【第X轮】"标注。
 """
+
+@app.route('/api/debate', methods=['POST', 'OPTIONS'])
+def generate_debate():
+    """多角色辩论生成 - 让多个角色就用户的选择进行辩论"""
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        return response, 200
+    try:
+        data = request.json
+        user_choice = data.get('choice', {})
+        session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
+        
+        query = build_debate_query(user_choice)
         
         debate = {}
-        roles = ['ethicist', 'safety', 'physicist']
         
-        for role in roles:
+        for role in SIMPLE_DEBATE_ROLES:
             try:
-                role_personality = get_role_personality(role)
-                messages = [
-                    {"role": "system", "content": role_personality},
-                    {"role": "user", "content": query}
-                ]
-                response = call_role_api(role, messages)
+                response = call_role_api(role, build_role_messages(role, query))
                 debate[role] = {
                     'role_name': ROLES[role]['name'],
                     'content': response['choices'][0]['message']['content']
@@ -1138,14 +1212,7 @@ def generate_debate():
                 }
         
         # 保存辩论记录
-        conn = sqlite3.connect('simulation_data.db')
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO role_analyses (session_id, role_name, analysis_text, metadata)
-            VALUES (?, ?, ?, ?)
-        ''', (session_id, 'debate', json.dumps(debate), json.dumps({'type': 'debate'})))
-        conn.commit()
-        conn.close()
+        write_behind.record_role_analysis(session_id, 'debate', json.dumps(debate), json.dumps({'type': 'debate'}))
         
         return jsonify({
             'success': True,
@@ -1160,6 +1227,250 @@ def generate_debate():
             'traceback': traceback.format_exc()
         }), 500
 
+# 流式辩论的默认角色和最大轮数
+DEBATE_ROLES = ['ethicist', 'safety', 'physicist', 'traffic']
+MAX_DEBATE_ROUNDS = int(os.getenv('MAX_DEBATE_ROUNDS', '5'))
+
+def create_debate(session_id, user_choice, roles, rounds, mode):
+    """创建辩论记录，返回 debate_id"""
+    debate_id = f"debate_{uuid.uuid4().hex[:16]}"
+    with db.transaction() as c:
+        c.execute('''
+            INSERT INTO debates (debate_id, session_id, user_choice, roles, rounds, mode)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (debate_id, session_id, json.dumps(user_choice, ensure_ascii=False), json.dumps(roles), rounds, mode))
+    return debate_id
+
+def load_debate(debate_id):
+    """读取辩论元数据和已完成的陈述，不存在时返回 None"""
+    role_keys = {info['name']: key for key, info in ROLES.items()}
+    with db.connection() as conn:
+        row = conn.execute('''
+            SELECT session_id, user_choice, roles, rounds, mode, status FROM debates WHERE debate_id = ?
+        ''', (debate_id,)).fetchone()
+        if row is None:
+            return None
+        statements = conn.execute('''
+            SELECT round_number, role_name, content, created_at FROM role_debates
+            WHERE debate_id = ? ORDER BY round_number
+        ''', (debate_id,)).fetchall()
+    session_id, user_choice, roles, rounds, mode, status = row
+    return {
+        'session_id': session_id,
+        'user_choice': json.loads(user_choice),
+        'roles': json.loads(roles),
+        'rounds': rounds,
+        'mode': mode,
+        'status': status,
+        'completed': [
+            {
+                'role': role_keys.get(role_name, role_name),
+                'role_name': role_name,
+                'round': round_number,
+                'content': content,
+                'timestamp': created_at
+            }
+            for round_number, role_name, content, created_at in statements
+        ]
+    }
+
+def save_debate_statement(debate_id, session_id, statement, participants):
+    """保存一条辩论陈述（同一轮同一角色只保存一次）"""
+    response_to = None
+    if statement['round'] > 1:
+        response_to = '、'.join(name for name in participants if name != statement['role_name'])
+    with db.transaction() as c:
+        c.execute('''
+            INSERT OR IGNORE INTO role_debates (session_id, debate_id, round_number, role_name, content, response_to_role)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (session_id, debate_id, statement['round'], statement['role_name'], statement['content'], response_to))
+        c.execute('UPDATE debates SET updated_at = CURRENT_TIMESTAMP WHERE debate_id = ?', (debate_id,))
+
+def finish_debate(debate_id):
+    """标记辩论已完成"""
+    with db.transaction() as c:
+        c.execute('''
+            UPDATE debates SET status = 'completed', updated_at = CURRENT_TIMESTAMP WHERE debate_id = ?
+        ''', (debate_id,))
+
+# 正在生成的辩论（进程内）：同一个 debate_id 同时只有一个生成过程，
+# 客户端断开后仍在进行的陈述结束前，续传请求被拒绝（否则会重复调用LLM，重复的陈述也不会被保存）
+_active_debates = set()
+_active_debates_lock = threading.Lock()
+DEBATE_ACTIVE_ERROR = '辩论仍在生成中，请稍后再续传'
+
+def claim_debate(debate_id):
+    """登记辩论的生成过程，已有生成过程时返回 False"""
+    with _active_debates_lock:
+        if debate_id in _active_debates:
+            return False
+        _active_debates.add(debate_id)
+        return True
+
+def release_debate(debate_id):
+    """辩论的生成过程（包括客户端断开后仍在进行的陈述）已全部结束"""
+    with _active_debates_lock:
+        _active_debates.discard(debate_id)
+
+class DebateRequestError(ValueError):
+    """流式辩论请求参数错误（status 为响应状态码）"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def prepare_debate_stream(data):
+    """
+    解析 /api/debate/stream 请求：传入 debate_id 时读取已有辩论（断线续传），否则校验参数并创建新辩论
+    
+    Returns:
+        {'debate_id', 'session_id', 'user_choice', 'roles', 'rounds', 'mode', 'completed', 'participants'}
+    
+    Raises:
+        DebateRequestError: 参数错误（400）、辩论不存在（404）或仍在生成中（409）
+    """
+    debate_id = data.get('debate_id')
+    if debate_id:
+        # 断线续传：已完成的陈述直接重放，不重新生成
+        with _active_debates_lock:
+            active = debate_id in _active_debates
+        if active:
+            raise DebateRequestError(DEBATE_ACTIVE_ERROR, 409)
+        debate = load_debate(debate_id)
+        if debate is None:
+            raise DebateRequestError(f'辩论不存在: {debate_id}', 404)
+        del debate['status']
+    else:
+        session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
+        user_choice = data.get('choice', {})
+        roles = data.get('roles') or DEBATE_ROLES
+        invalid = [role for role in roles if role not in ROLES]
+        if invalid:
+            raise DebateRequestError(f'Invalid role: {", ".join(map(str, invalid))}')
+        rounds = min(max(int(data.get('rounds', 3)), 1), MAX_DEBATE_ROUNDS)
+        mode = data.get('mode') or role_collaboration.DEBATE_MODE
+        if mode not in ('parallel', 'sequential'):
+            raise DebateRequestError(f'Invalid debate mode: {mode}')
+        debate = {
+            'session_id': session_id,
+            'user_choice': user_choice,
+            'roles': roles,
+            'rounds': rounds,
+            'mode': mode,
+            'completed': []
+        }
+        debate_id = create_debate(session_id, user_choice, roles, rounds, mode)
+    debate['debate_id'] = debate_id
+    debate['participants'] = [ROLES[role]['name'] for role in debate['roles']]
+    return debate
+
+def debate_sse_event(event):
+    """格式化为 SSE 数据行"""
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+def debate_start_event(debate):
+    """流式辩论的开始事件"""
+    return {
+        'type': 'start',
+        'debate_id': debate['debate_id'],
+        'session_id': debate['session_id'],
+        'participants': debate['participants'],
+        'rounds': debate['rounds'],
+        'mode': debate['mode'],
+        'resumed': bool(debate['completed'])
+    }
+
+def debate_output_event(debate_id, event):
+    """把 stream_interactive_debate 的事件转换为推送给客户端的事件（complete 转为带可视化数据的 done）"""
+    if event['type'] == 'complete':
+        return {
+            'type': 'done',
+            'debate_id': debate_id,
+            'debate': event['debate'],
+            'visualization': create_debate_visualization_data(event['debate'])
+        }
+    return dict(event, debate_id=debate_id)
+
+@app.route('/api/debate/stream', methods=['POST', 'OPTIONS'])
+def stream_debate():
+    """多角色辩论（流式输出）- 每条陈述（或其token）生成后立即推送，按轮次和角色标注；传入 debate_id 可断线续传"""
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        return response, 200
+    
+    if not NEW_FEATURES_ENABLED:
+        return jsonify({'error': '角色协作功能未启用'}), 503
+    
+    try:
+        data = request.json or {}
+        try:
+            debate = prepare_debate_stream(data)
+        except DebateRequestError as e:
+            return jsonify({'success': False, 'error': str(e)}), e.status
+        debate_id = debate['debate_id']
+        stream_tokens = data.get('stream_tokens', True)  # 是否逐token推送
+        
+        # 工作线程中没有请求上下文，限流优先级在这里确定
+        priority = request_priority()
+        manager = RoleDebateManager(partial(call_role_api, priority=priority), get_role_personality, ROLES)
+        stream_func = None
+        if stream_tokens:
+            stream_func = lambda role, messages: stream_role_api(role, messages, priority=priority)
+        
+        def on_statement(statement):
+            save_debate_statement(debate_id, debate['session_id'], statement, debate['participants'])
+        
+        def generate():
+            # 检查和登记之间可能有另一个续传请求开始生成，这里再原子地登记一次
+            if not claim_debate(debate_id):
+                yield debate_sse_event({'type': 'error', 'debate_id': debate_id, 'error': DEBATE_ACTIVE_ERROR})
+                return
+            events = None
+            try:
+                if data.get('debate_id'):
+                    # 登记前原生成过程可能刚保存了新的陈述
+                    debate['completed'] = load_debate(debate_id)['completed']
+                yield debate_sse_event(debate_start_event(debate))
+                events = manager.stream_interactive_debate(
+                    debate['user_choice'], debate['roles'], debate['rounds'], debate['mode'],
+                    completed=debate['completed'], stream_func=stream_func, on_statement=on_statement,
+                    on_finished=lambda: release_debate(debate_id)
+                )
+                for event in events:
+                    if event['type'] == 'complete':
+                        finish_debate(debate_id)
+                    yield debate_sse_event(debate_output_event(debate_id, event))
+            except Exception as e:
+                yield debate_sse_event({'type': 'error', 'debate_id': debate_id, 'error': str(e)})
+            finally:
+                # 已开始的陈述结束后由 on_finished 解除登记；生成器尚未开始时直接解除
+                if events is None:
+                    release_debate(debate_id)
+                else:
+                    events.close()
+        
+        response_obj = Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Headers': '*',
+                'Access-Control-Allow-Methods': '*'
+            }
+        )
+        return response_obj
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
 @app.route('/api/questions/generate', methods=['POST', 'OPTIONS'])
 def generate_questions():
     """智能问题生成器 - 基于用户选择生成引导性思考问题"""
@@ -1225,7 +1536,7 @@ def generate_questions():
             {"role": "user", "content": query}
         ]
         
-        response = call_role_api(role, messages)
+        response = call_role_api(role, messages, use_cache=not data.get('no_cache', False))
         questions_text = response['choices'][0]['message']['content']
         
         # 解析问题（简单提取）
@@ -1261,9 +1572,22 @@ def generate_questions():
             'traceback': traceback.format_exc()
         }), 500
 
+# 速度参数的有效范围（km/h）
+MAX_SPEED = float(os.getenv('MAX_SPEED', '200'))
+
+def parse_speed(value, name='speed'):
+    """解析速度参数（km/h），不是有限数字或不在 [0, MAX_SPEED] 内时抛出 ValueError"""
+    try:
+        speed = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} 必须是数字: {value!r}')
+    if not math.isfinite(speed) or not 0 <= speed <= MAX_SPEED:
+        raise ValueError(f'{name} 必须在 0-{MAX_SPEED:g} km/h 之间: {value!r}')
+    return speed
+
 @app.route('/api/physics/calculate', methods=['POST', 'OPTIONS'])
 def physics_calculate():
-    """物理学家计算模拟结果 - 计算幸存率、最大加速度、弹跳高度等（支持流式输出）"""
+    """物理学家计算模拟结果 - 服务器端物理模型计算幸存率、最大加速度、弹跳高度等（支持流式输出）"""
     if request.method == 'OPTIONS':
         response = jsonify({})
         response.headers.add('Access-Control-Allow-Origin', '*')
@@ -1276,174 +1600,51 @@ def physics_calculate():
             return jsonify({
                 'success': False,
                 'error': '请求数据为空'
-            }), 400
-        
-        vehicle = data.get('vehicle', '未知')
-        bump = data.get('bump', '未知')
-        location = data.get('location', '未知')
-        weather = data.get('weather', '晴')  # 天气条件
-        speed = float(data.get('speed', 0))
-        stream = data.get('stream', True)  # 默认使用流式输出
-        
-        # 构建计算查询，要求物理学家基于物理公式计算
-        speed_mps = speed / 3.6 if speed > 0 else 0
-        query = f"""
-请作为物理学家，基于弹簧-质量-阻尼系统模型，计算以下参数组合的物理结果：
-
-【输入参数】
-- 车辆类型：{vehicle}
-- 减速带类型：{bump}
-- 地点：{location}
-- 天气条件：{weather}
-- 初始速度：{speed} km/h ({speed_mps:.2f} m/s)
-
-【计算要求】
-请严格按照物理公式计算，并返回JSON格式的结果：
-
-1. **最大加速度** (maxAcceleration, 单位: m/s²)
-   - 使用公式：a_max = (F₀/m) + (ω_n² × x_max)
-   - 其中：ω_n = √(k/m)，x_max = (F₀/k) × [1 + exp(-ζω_n t_pass)]
-
-2. **最大位移** (maxDisplacement, 单位: m)
-   - 使用公式：x_max = (F₀/k) × [1 + exp(-ζω_n t_pass)]
-
-3. **速度变化** (velocityChange, 单位: m/s)
-   - 计算车辆通过减速带时的速度变化量
-
-4. **弹跳高度** (bounceHeight, 单位: m)
-   - 使用公式：h = max(0, (x_max - H) × 0.5)
-   - 其中H是减速带高度
-
-5. **通过时间** (t_pass, 单位: s)
-   - t_pass = L / v₀，其中L是减速带长度
-
-6. **自然频率** (omega_n, 单位: rad/s)
-   - ω_n = √(k/m)
-
-7. **阻尼比** (zeta, 无量纲)
-   - ζ = c/(2√(km))
-
-8. **幸存率** (survivalRate, 单位: %, 范围: 0-100)
-   - 基于以下标准评估：
-     * 最大加速度 > 3g (29.4 m/s²) → 高风险，幸存率 < 40%
-     * 最大加速度 2g-3g (19.6-29.4 m/s²) → 中风险，幸存率 40-60%
-     * 最大加速度 1g-2g (9.8-19.6 m/s²) → 低风险，幸存率 60-80%
-     * 最大加速度 < 1g (9.8 m/s²) → 安全，幸存率 > 80%
-   - 同时考虑弹跳高度：弹跳高度 > 0.1m → 降低幸存率10-20%
-   - 考虑速度：速度 > 50 km/h → 降低幸存率5-15%
-
-【输出格式】
-请严格按照以下JSON格式返回，不要添加任何其他文字说明：
-
-{{
-    "maxAcceleration": 数值,
-    "maxDisplacement": 数值,
-    "velocityChange": 数值,
-    "bounceHeight": 数值,
-    "t_pass": 数值,
-    "omega_n": 数值,
-    "zeta": 数值,
-    "survivalRate": 数值,
-    "result": "安全通过" 或 "可能通过" 或 "危险" 或 "极危险",
-    "calculation_steps": "简要说明计算步骤（1-2句话）"
-}}
-
-请确保所有数值都是基于物理公式的精确计算，不要随意估算。
-"""
+            }), 400
+        
+        vehicle = data.get('vehicle', '未知')
+        bump = data.get('bump', '未知')
+        location = data.get('location', '未知')
+        weather = data.get('weather', '晴')  # 天气条件
+        try:
+            speed = parse_speed(data.get('speed', 0))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        stream = data.get('stream', True)  # 默认使用流式输出
+        explain = data.get('explain', False)  # 是否需要物理学家的文字解释（会调用LLM）
+        session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
+        
+        # 物理结果由服务器端模型直接计算（与前端 calculateSurvivalRate 完全一致），不依赖LLM
+        result_data = physics_engine.simulate(vehicle, bump, location, speed)
+        if result_data is None:
+            return jsonify({
+                'success': False,
+                'error': f'参数错误: 未知的车辆类型或减速带类型（{vehicle} / {bump}）'
+            }), 400
+        
+        def build_explanation_messages():
+            return build_physics_explanation_messages(vehicle, bump, location, weather, speed, result_data)
+        
+        def save_calculation(analysis_text):
+            save_physics_calculation(session_id, vehicle, bump, location, speed, result_data, analysis_text)
         
-        # 调用物理学家角色
         if stream:
-            # 流式输出模式
+            # 流式输出模式：计算结果立即发送，需要解释时再转发LLM生成的token
             def generate():
                 try:
-                    physicist_personality = get_role_personality('physicist')
-                    if not physicist_personality:
-                        yield f"data: {json.dumps({'type': 'error', 'error': '无法获取物理学家角色设定'})}\n\n"
-                        return
-                    
-                    messages = [
-                        {"role": "system", "content": physicist_personality},
-                        {"role": "user", "content": query}
-                    ]
-                    
-                    # 发送开始信号
                     yield f"data: {json.dumps({'type': 'start', 'message': '开始计算...'})}\n\n"
-                    time.sleep(0.8)  # 增加到0.8秒
-                    
-                    yield f"data: {json.dumps({'type': 'progress', 'step': '建立物理模型', 'progress': 20})}\n\n"
-                    time.sleep(1.2)  # 增加到1.2秒，让用户明显看到
-                    
-                    yield f"data: {json.dumps({'type': 'progress', 'step': '推导公式', 'progress': 40})}\n\n"
-                    time.sleep(1.2)  # 增加到1.2秒
+                    for key, value in result_data.items():
+                        yield f"data: {json.dumps({'type': 'result', 'key': key, 'value': value})}\n\n"
+                    yield f"data: {json.dumps({'type': 'complete', 'physics': result_data})}\n\n"
                     
-                    yield f"data: {json.dumps({'type': 'progress', 'step': '进行计算', 'progress': 60})}\n\n"
-                    time.sleep(0.8)  # 在API调用前给用户看到进度
-                    
-                    # 调用API（这里会阻塞，但我们已经显示了进度）
-                    response = call_role_api('physicist', messages)
-                    if not response or 'choices' not in response or len(response['choices']) == 0:
-                        yield f"data: {json.dumps({'type': 'error', 'error': 'API返回数据格式错误'})}\n\n"
-                        return
-                    
-                    yield f"data: {json.dumps({'type': 'progress', 'step': '验证结果', 'progress': 80})}\n\n"
-                    time.sleep(0.8)
-                    
-                    result_text = response['choices'][0]['message']['content']
-                    if not result_text:
-                        yield f"data: {json.dumps({'type': 'error', 'error': 'API返回的计算结果为空'})}\n\n"
-                        return
+                    explanation = ''
+                    if explain:
+                        for delta in stream_role_api('physicist', build_explanation_messages()):
+                            explanation += delta
+                            yield f"data: {json.dumps({'type': 'explanation', 'content': delta})}\n\n"
+                        yield f"data: {json.dumps({'type': 'done'})}\n\n"
                     
-                    # 尝试从返回文本中提取JSON
-                    import re
-                    json_match = re.search(r'\{[\s\S]*\}', result_text)
-                    if json_match:
-                        result_data = json.loads(json_match.group())
-                        
-                        # 逐步发送计算结果，大幅增加延迟让用户明显看到逐步显示
-                        yield f"data: {json.dumps({'type': 'result', 'key': 'maxAcceleration', 'value': result_data.get('maxAcceleration', 0)})}\n\n"
-                        time.sleep(0.8)  # 增加到0.8秒
-                        yield f"data: {json.dumps({'type': 'result', 'key': 'maxDisplacement', 'value': result_data.get('maxDisplacement', 0)})}\n\n"
-                        time.sleep(0.6)
-                        yield f"data: {json.dumps({'type': 'result', 'key': 'velocityChange', 'value': result_data.get('velocityChange', 0)})}\n\n"
-                        time.sleep(0.6)
-                        yield f"data: {json.dumps({'type': 'result', 'key': 'bounceHeight', 'value': result_data.get('bounceHeight', 0)})}\n\n"
-                        time.sleep(0.8)  # 弹跳高度是重要结果，延迟更长
-                        yield f"data: {json.dumps({'type': 'result', 'key': 't_pass', 'value': result_data.get('t_pass', 0)})}\n\n"
-                        time.sleep(0.5)
-                        yield f"data: {json.dumps({'type': 'result', 'key': 'omega_n', 'value': result_data.get('omega_n', 0)})}\n\n"
-                        time.sleep(0.5)
-                        yield f"data: {json.dumps({'type': 'result', 'key': 'zeta', 'value': result_data.get('zeta', 0)})}\n\n"
-                        time.sleep(0.6)
-                        yield f"data: {json.dumps({'type': 'result', 'key': 'survivalRate', 'value': result_data.get('survivalRate', 0)})}\n\n"
-                        time.sleep(1.0)  # 幸存率是最重要的，延迟最长（1秒）
-                        yield f"data: {json.dumps({'type': 'result', 'key': 'result', 'value': result_data.get('result', '未知')})}\n\n"
-                        time.sleep(0.5)
-                        
-                        # 发送完整结果
-                        yield f"data: {json.dumps({'type': 'complete', 'physics': result_data})}\n\n"
-                        
-                        # 保存计算结果（异步，不阻塞）
-                        try:
-                            session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
-                            conn = sqlite3.connect('simulation_data.db')
-                            c = conn.cursor()
-                            c.execute('''
-                                INSERT INTO role_analyses (session_id, role_name, analysis_text, metadata)
-                                VALUES (?, ?, ?, ?)
-                            ''', (session_id, 'physicist_calculation', result_text, json.dumps({
-                                'type': 'physics_calculation',
-                                'vehicle': vehicle,
-                                'bump': bump,
-                                'speed': speed,
-                                'location': location,
-                                'result': result_data
-                            })))
-                            conn.commit()
-                            conn.close()
-                        except Exception as db_error:
-                            print(f"警告：保存计算结果到数据库失败: {db_error}")
-                    else:
-                        yield f"data: {json.dumps({'type': 'error', 'error': '无法从返回结果中提取JSON数据'})}\n\n"
+                    save_calculation(explanation or result_data['calculation_steps'])
                 except Exception as e:
                     yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
             
@@ -1460,67 +1661,30 @@ def physics_calculate():
             )
             return response_obj
         else:
-            # 非流式输出模式（原有逻辑）
-            try:
-                physicist_personality = get_role_personality('physicist')
-                if not physicist_personality:
-                    raise ValueError("无法获取物理学家角色设定")
-                
-                messages = [
-                    {"role": "system", "content": physicist_personality},
-                    {"role": "user", "content": query}
-                ]
-                
-                response = call_role_api('physicist', messages)
-                if not response or 'choices' not in response or len(response['choices']) == 0:
-                    raise ValueError("API返回数据格式错误")
-                
-                result_text = response['choices'][0]['message']['content']
-                if not result_text:
-                    raise ValueError("API返回的计算结果为空")
-                
-                # 尝试从返回文本中提取JSON
-                import re
-                json_match = re.search(r'\{[\s\S]*\}', result_text)
-                if json_match:
-                    result_data = json.loads(json_match.group())
-                else:
-                    raise ValueError("无法从返回结果中提取JSON数据")
-                    
-            except Exception as api_error:
-                return jsonify({
-                    'success': False,
-                    'error': f'物理学家计算API调用失败: {str(api_error)}',
-                    'traceback': traceback.format_exc()
-                }), 500
+            # 非流式输出模式
+            explanation = None
+            if explain:
+                try:
+                    response = call_role_api('physicist', build_explanation_messages())
+                    explanation = response['choices'][0]['message']['content']
+                except Exception as api_error:
+                    return jsonify({
+                        'success': False,
+                        'error': f'物理学家解释API调用失败: {str(api_error)}',
+                        'traceback': traceback.format_exc()
+                    }), 500
             
-            # 保存计算结果
-            try:
-                session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
-                conn = sqlite3.connect('simulation_data.db')
-                c = conn.cursor()
-                c.execute('''
-                    INSERT INTO role_analyses (session_id, role_name, analysis_text, metadata)
-                    VALUES (?, ?, ?, ?)
-                ''', (session_id, 'physicist_calculation', result_text, json.dumps({
-                    'type': 'physics_calculation',
-                    'vehicle': vehicle,
-                    'bump': bump,
-                    'speed': speed,
-                    'location': location,
-                    'result': result_data
-                })))
-                conn.commit()
-                conn.close()
-            except Exception as db_error:
-                print(f"警告：保存计算结果到数据库失败: {db_error}")
+            save_calculation(explanation or result_data['calculation_steps'])
             
-            return jsonify({
+            result = {
                 'success': True,
                 'physics': result_data,
                 'role': '物理学家',
                 'timestamp': datetime.now().isoformat()
-            })
+            }
+            if explanation is not None:
+                result['explanation'] = explanation
+            return jsonify(result)
         
     except Exception as e:
         return jsonify({
@@ -1529,9 +1693,13 @@ def physics_calculate():
             'traceback': traceback.format_exc()
         }), 500
 
-@app.route('/api/physics/analyze', methods=['POST', 'OPTIONS'])
-def physics_analyze():
-    """物理学家公式分析 - 运用物理公式详细分析模拟结果"""
+# 参数扫描的最大网格点数（防止单个请求占用过多内存；按每点每字段约20字节JSON估算，默认上限的单字段响应约4MB）
+MAX_SWEEP_POINTS = int(os.getenv('MAX_SWEEP_POINTS', '200000'))
+SWEEP_FIELDS = ['survivalRate', 'maxAcceleration', 'maxDisplacement', 'velocityChange', 'bounceHeight']
+
+@app.route('/api/physics/sweep', methods=['POST', 'OPTIONS'])
+def physics_sweep():
+    """参数扫描 - 一次向量化计算 车辆 × 减速带 × 地点 × 速度 网格上的幸存率，并给出各类推荐组合"""
     if request.method == 'OPTIONS':
         response = jsonify({})
         response.headers.add('Access-Control-Allow-Origin', '*')
@@ -1539,131 +1707,183 @@ def physics_analyze():
         response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
         return response, 200
     try:
-        # 打印请求信息用于调试
-        print(f"[物理学家分析] 请求方法: {request.method}")
-        print(f"[物理学家分析] Content-Type: {request.content_type}")
-        print(f"[物理学家分析] 请求数据长度: {len(request.data) if request.data else 0}")
-        print(f"[物理学家分析] 原始请求数据: {request.data[:500] if request.data else 'None'}")
-        
-        # 尝试多种方式获取数据
-        data = None
-        if request.is_json:
-            data = request.json
-        else:
-            # 如果不是JSON格式，尝试手动解析
-            try:
-                if request.data:
-                    data = json.loads(request.data.decode('utf-8'))
-                else:
-                    # 尝试从form数据获取
-                    data = request.form.to_dict()
-            except Exception as parse_error:
-                print(f"[物理学家分析] JSON解析失败: {parse_error}")
-                return jsonify({
-                    'success': False,
-                    'error': f'数据格式错误: {str(parse_error)}',
-                    'content_type': request.content_type,
-                    'data_preview': str(request.data[:200]) if request.data else 'None'
-                }), 400
+        data = request.json or {}
+        
+        vehicles = data.get('vehicles') or list(physics_engine.VEHICLE_PARAMS)
+        bumps = data.get('bumps') or list(physics_engine.SPEED_BUMP_PARAMS)
+        locations = data.get('locations') or list(physics_engine.LOCATION_FACTORS)
+        weathers = data.get('weathers') or list(physics_engine.WEATHER_FRICTION_FACTORS)
+        fields = data.get('fields') or ['survivalRate']
+        recommend_targets = data.get('recommend', False)
+        if recommend_targets is True:
+            recommend_targets = list(physics_engine.RECOMMENDATION_TARGETS)
+        recommend_targets = recommend_targets or []
+        
+        axes = [vehicles, bumps, locations, weathers, fields, recommend_targets]
+        if not all(isinstance(axis, list) for axis in axes):
+            return jsonify({'success': False, 'error': 'vehicles、bumps、locations、weathers、fields、recommend 必须是数组'}), 400
+        unknown = (
+            [v for v in vehicles if v not in physics_engine.VEHICLE_PARAMS] +
+            [b for b in bumps if b not in physics_engine.SPEED_BUMP_PARAMS] +
+            [l for l in locations if l not in physics_engine.LOCATION_FACTORS] +
+            [w for w in weathers if w not in physics_engine.WEATHER_FRICTION_FACTORS] +
+            [f for f in fields if f not in SWEEP_FIELDS] +
+            [t for t in recommend_targets if t not in physics_engine.RECOMMENDATION_TARGETS]
+        )
+        if unknown:
+            return jsonify({'success': False, 'error': f'未知参数: {unknown}'}), 400
         
-        if not data:
+        # 先算出网格大小并检查上限，再生成速度列表
+        try:
+            if 'speeds' in data:
+                if not isinstance(data['speeds'], list):
+                    raise TypeError('speeds 必须是数组')
+                count = len(data['speeds'])
+            else:
+                speed_min = parse_speed(data.get('speed_min', 10), 'speed_min')
+                speed_max = parse_speed(data.get('speed_max', 70), 'speed_max')
+                speed_step = float(data.get('speed_step', 1))
+                if not math.isfinite(speed_step) or speed_step <= 0 or speed_max < speed_min:
+                    return jsonify({'success': False, 'error': '速度范围参数错误'}), 400
+                count = math.floor((speed_max - speed_min) / speed_step + 0.5) + 1
+            test_speed = parse_speed(data.get('test_speed', 50), 'test_speed')
+        except (TypeError, ValueError, OverflowError) as e:
+            return jsonify({'success': False, 'error': f'速度参数错误: {e}'}), 400
+        
+        points = len(vehicles) * len(bumps) * len(locations) * count
+        if points > MAX_SWEEP_POINTS:
             return jsonify({
                 'success': False,
-                'error': '请求数据为空',
-                'content_type': request.content_type,
-                'has_data': bool(request.data)
+                'error': f'网格点数 {points} 超过上限 {MAX_SWEEP_POINTS}'
             }), 400
         
-        # 打印接收到的数据用于调试
-        print(f"[物理学家分析] 接收到的数据: {json.dumps(data, ensure_ascii=False, indent=2)}")
-        
-        vehicle = data.get('vehicle', '未知')
-        bump = data.get('bump', '未知')
-        location = data.get('location', '未知')
-        weather = data.get('weather', '晴')  # 天气条件
-        speed = float(data.get('speed', 0))
-        survival_rate = float(data.get('survival_rate', 0))
-        physics_data = data.get('physics', {})  # 前端计算的物理数据
+        try:
+            if 'speeds' in data:
+                speeds = [parse_speed(s, 'speeds') for s in data['speeds']]
+            else:
+                speeds = [speed_min + i * speed_step for i in range(count)]
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': f'速度参数错误: {e}'}), 400
         
-        print(f"[物理学家分析] 解析后的参数: vehicle={vehicle}, bump={bump}, location={location}, weather={weather}, speed={speed}, survival_rate={survival_rate}")
-        print(f"[物理学家分析] physics_data: {json.dumps(physics_data, ensure_ascii=False, indent=2)}")
+        grid = physics_engine.survival_rate_grid(speeds, vehicles, bumps, locations)
         
-        # 验证数据完整性
-        if not physics_data or len(physics_data) == 0:
-            print("[警告] physics_data 为空或未提供！")
-        else:
-            print(f"[物理学家分析] 数据验证:")
-            print(f"  - maxAcceleration: {physics_data.get('maxAcceleration', '缺失')}")
-            print(f"  - maxDisplacement: {physics_data.get('maxDisplacement', '缺失')}")
-            print(f"  - velocityChange: {physics_data.get('velocityChange', '缺失')}")
-            print(f"  - bounceHeight: {physics_data.get('bounceHeight', '缺失')}")
-            print(f"  - t_pass: {physics_data.get('t_pass', '缺失')}")
-            print(f"  - omega_n: {physics_data.get('omega_n', '缺失')}")
-            print(f"  - zeta: {physics_data.get('zeta', '缺失')}")
-        
-        # 安全获取物理数据，处理 None 值
-        def safe_get_float(d, key, default=0):
-            value = d.get(key, default)
-            try:
-                return float(value) if value is not None else default
-            except (ValueError, TypeError):
-                return default
-        
-        max_acceleration = safe_get_float(physics_data, 'maxAcceleration', 0)
-        max_displacement = safe_get_float(physics_data, 'maxDisplacement', 0)
-        velocity_change = safe_get_float(physics_data, 'velocityChange', 0)
-        bounce_height = safe_get_float(physics_data, 'bounceHeight', 0)
-        t_pass = safe_get_float(physics_data, 't_pass', 0)
-        omega_n = safe_get_float(physics_data, 'omega_n', 0)
-        zeta = safe_get_float(physics_data, 'zeta', 0)
-        
-        # 构建详细的物理分析查询
-        speed_mps = speed / 3.6 if speed > 0 else 0
-        
-        # ========== 动态上下文适应 ==========
-        # 根据用户选择动态调整分析深度和重点
-        if survival_rate < 40:
-            urgency_level = "极高风险"
-            analysis_depth = "非常详细"
-            safety_emphasis = "强烈"
-            focus_areas = "安全评估、风险分析、物理极限"
-            analysis_priority = "请特别关注安全风险，详细分析为什么这个速度/参数组合会导致如此低的幸存率，并强烈警告用户。"
-        elif survival_rate < 60:
-            urgency_level = "高风险"
-            analysis_depth = "详细"
-            safety_emphasis = "中等"
-            focus_areas = "安全评估、参数影响分析"
-            analysis_priority = "请重点关注安全因素，分析参数对安全性的影响，并提醒用户注意风险。"
-        elif survival_rate < 80:
-            urgency_level = "中等风险"
-            analysis_depth = "标准"
-            safety_emphasis = "提醒"
-            focus_areas = "物理过程分析、参数优化"
-            analysis_priority = "请进行标准的物理分析，适当提醒安全因素，并分析如何优化参数。"
-        else:
-            urgency_level = "相对安全"
-            analysis_depth = "标准"
-            safety_emphasis = "提醒"
-            focus_areas = "物理过程分析、参数优化、性能分析"
-            analysis_priority = "请进行标准的物理分析，可以更多关注物理过程和参数优化。"
-        
-        # 根据速度调整分析重点
-        if speed > 80:
-            speed_focus = "请特别关注高速情况下的动力学特性，分析高速通过减速带的物理极限和风险。"
-        elif speed > 50:
-            speed_focus = "请关注中高速情况下的动力学特性，分析参数对系统响应的影响。"
-        else:
-            speed_focus = "请关注低速情况下的动力学特性，分析为什么速度较低时系统响应较小。"
+        # 推荐组合（对应前端 calculateRecommendation）
+        recommendations = {
+            target: physics_engine.recommend(target, test_speed, weathers)
+            for target in recommend_targets
+        }
         
-        # 根据地点调整分析重点
-        if location == "山地滑坡":
-            location_focus = "请特别关注山地滑坡环境下的极端风险，详细分析为什么这种环境下幸存率会大幅降低，并强烈警告用户。"
-        elif location == "普通跑道":
-            location_focus = "请关注普通跑道环境下的动力学特性，分析这种相对安全环境下的物理过程。"
-        else:
-            location_focus = "请关注当前环境下的动力学特性，分析环境因素对系统的影响。"
+        return jsonify({
+            'success': True,
+            # 幸存率模型与天气无关，天气只参与推荐评分
+            'axes': {
+                'vehicles': grid['vehicles'],
+                'bumps': grid['bumps'],
+                'locations': grid['locations'],
+                'speeds': grid['speeds'].tolist()
+            },
+            'shape': list(grid['survivalRate'].shape),
+            'points': points,
+            'grid': {field: grid[field].tolist() for field in fields},
+            'recommendations': recommendations
+        })
         
-        query = f"""
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+def build_physics_analysis_messages(data):
+    """构建 /api/physics/analyze 的消息列表（根据幸存率、速度和地点动态调整分析深度和重点）"""
+    vehicle = data.get('vehicle', '未知')
+    bump = data.get('bump', '未知')
+    location = data.get('location', '未知')
+    weather = data.get('weather', '晴')  # 天气条件
+    speed = parse_speed(data.get('speed', 0))
+    survival_rate = float(data.get('survival_rate', 0))
+    physics_data = data.get('physics', {})  # 前端计算的物理数据
+    
+    print(f"[物理学家分析] 解析后的参数: vehicle={vehicle}, bump={bump}, location={location}, weather={weather}, speed={speed}, survival_rate={survival_rate}")
+    print(f"[物理学家分析] physics_data: {json.dumps(physics_data, ensure_ascii=False, indent=2)}")
+    
+    # 验证数据完整性
+    if not physics_data or len(physics_data) == 0:
+        print("[警告] physics_data 为空或未提供！")
+    else:
+        print(f"[物理学家分析] 数据验证:")
+        print(f"  - maxAcceleration: {physics_data.get('maxAcceleration', '缺失')}")
+        print(f"  - maxDisplacement: {physics_data.get('maxDisplacement', '缺失')}")
+        print(f"  - velocityChange: {physics_data.get('velocityChange', '缺失')}")
+        print(f"  - bounceHeight: {physics_data.get('bounceHeight', '缺失')}")
+        print(f"  - t_pass: {physics_data.get('t_pass', '缺失')}")
+        print(f"  - omega_n: {physics_data.get('omega_n', '缺失')}")
+        print(f"  - zeta: {physics_data.get('zeta', '缺失')}")
+    
+    # 安全获取物理数据，处理 None 值
+    def safe_get_float(d, key, default=0):
+        value = d.get(key, default)
+        try:
+            return float(value) if value is not None else default
+        except (ValueError, TypeError):
+            return default
+    
+    max_acceleration = safe_get_float(physics_data, 'maxAcceleration', 0)
+    max_displacement = safe_get_float(physics_data, 'maxDisplacement', 0)
+    velocity_change = safe_get_float(physics_data, 'velocityChange', 0)
+    bounce_height = safe_get_float(physics_data, 'bounceHeight', 0)
+    t_pass = safe_get_float(physics_data, 't_pass', 0)
+    omega_n = safe_get_float(physics_data, 'omega_n', 0)
+    zeta = safe_get_float(physics_data, 'zeta', 0)
+    
+    # 构建详细的物理分析查询
+    speed_mps = speed / 3.6 if speed > 0 else 0
+    
+    # ========== 动态上下文适应 ==========
+    # 根据用户选择动态调整分析深度和重点
+    if survival_rate < 40:
+        urgency_level = "极高风险"
+        analysis_depth = "非常详细"
+        safety_emphasis = "强烈"
+        focus_areas = "安全评估、风险分析、物理极限"
+        analysis_priority = "请特别关注安全风险，详细分析为什么这个速度/参数组合会导致如此低的幸存率，并强烈警告用户。"
+    elif survival_rate < 60:
+        urgency_level = "高风险"
+        analysis_depth = "详细"
+        safety_emphasis = "中等"
+        focus_areas = "安全评估、参数影响分析"
+        analysis_priority = "请重点关注安全因素，分析参数对安全性的影响，并提醒用户注意风险。"
+    elif survival_rate < 80:
+        urgency_level = "中等风险"
+        analysis_depth = "标准"
+        safety_emphasis = "提醒"
+        focus_areas = "物理过程分析、参数优化"
+        analysis_priority = "请进行标准的物理分析，适当提醒安全因素，并分析如何优化参数。"
+    else:
+        urgency_level = "相对安全"
+        analysis_depth = "标准"
+        safety_emphasis = "提醒"
+        focus_areas = "物理过程分析、参数优化、性能分析"
+        analysis_priority = "请进行标准的物理分析，可以更多关注物理过程和参数优化。"
+    
+    # 根据速度调整分析重点
+    if speed > 80:
+        speed_focus = "请特别关注高速情况下的动力学特性，分析高速通过减速带的物理极限和风险。"
+    elif speed > 50:
+        speed_focus = "请关注中高速情况下的动力学特性，分析参数对系统响应的影响。"
+    else:
+        speed_focus = "请关注低速情况下的动力学特性，分析为什么速度较低时系统响应较小。"
+    
+    # 根据地点调整分析重点
+    if location == "山地滑坡":
+        location_focus = "请特别关注山地滑坡环境下的极端风险，详细分析为什么这种环境下幸存率会大幅降低，并强烈警告用户。"
+    elif location == "普通跑道":
+        location_focus = "请关注普通跑道环境下的动力学特性，分析这种相对安全环境下的物理过程。"
+    else:
+        location_focus = "请关注当前环境下的动力学特性，分析环境因素对系统的影响。"
+    
+    query = f"""
 请作为物理学家，运用物理公式详细分析以下模拟结果：
 
 【情境感知分析 - 动态调整】
@@ -1785,20 +2005,104 @@ def physics_analyze():
 
 请用清晰的结构、完整的公式、详细的推导过程来展示你的分析。使用LaTeX格式表示公式（如：$F = ma$），并确保每个步骤都有清晰的说明。
 """
+    
+    physicist_personality = get_role_personality('physicist')
+    if not physicist_personality:
+        raise ValueError("无法获取物理学家角色设定")
+    
+    return [
+        {"role": "system", "content": physicist_personality},
+        {"role": "user", "content": query}
+    ]
+
+def save_physics_analysis(data, physics_analysis):
+    """保存物理学家分析结果（如果失败不影响返回结果）"""
+    try:
+        session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
+        write_behind.record_role_analysis(session_id, 'physicist_detailed', physics_analysis, json.dumps({
+            'type': 'physics_analysis',
+            'vehicle': data.get('vehicle', '未知'),
+            'bump': data.get('bump', '未知'),
+            'speed': float(data.get('speed', 0)),
+            'survival_rate': float(data.get('survival_rate', 0))
+        }))
+    except Exception as db_error:
+        # 数据库保存失败不影响API返回，只记录错误
+        print(f"警告：保存分析结果到数据库失败: {db_error}")
+
+# 模拟流式输出：分析文本的分块大小（字符）和推送间隔（秒）
+ANALYSIS_STREAM_CHUNK_SIZE = 40
+ANALYSIS_STREAM_START_DELAY = 0.5
+ANALYSIS_STREAM_CHUNK_DELAY = 0.3
+
+def analysis_stream_chunks(physics_analysis):
+    """把分析文本切成 chunk 事件（带进度百分比）"""
+    total_length = len(physics_analysis)
+    sent_length = 0
+    while sent_length < total_length:
+        chunk = physics_analysis[sent_length:sent_length + ANALYSIS_STREAM_CHUNK_SIZE]
+        sent_length += len(chunk)
+        yield {'type': 'chunk', 'content': chunk, 'progress': min(100, int(sent_length * 100 / total_length))}
+
+@app.route('/api/physics/analyze', methods=['POST', 'OPTIONS'])
+def physics_analyze():
+    """物理学家公式分析 - 运用物理公式详细分析模拟结果"""
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        return response, 200
+    try:
+        # 打印请求信息用于调试
+        print(f"[物理学家分析] 请求方法: {request.method}")
+        print(f"[物理学家分析] Content-Type: {request.content_type}")
+        print(f"[物理学家分析] 请求数据长度: {len(request.data) if request.data else 0}")
+        print(f"[物理学家分析] 原始请求数据: {request.data[:500] if request.data else 'None'}")
+        
+        # 尝试多种方式获取数据
+        data = None
+        if request.is_json:
+            data = request.json
+        else:
+            # 如果不是JSON格式，尝试手动解析
+            try:
+                if request.data:
+                    data = json.loads(request.data.decode('utf-8'))
+                else:
+                    # 尝试从form数据获取
+                    data = request.form.to_dict()
+            except Exception as parse_error:
+                print(f"[物理学家分析] JSON解析失败: {parse_error}")
+                return jsonify({
+                    'success': False,
+                    'error': f'数据格式错误: {str(parse_error)}',
+                    'content_type': request.content_type,
+                    'data_preview': str(request.data[:200]) if request.data else 'None'
+                }), 400
+        
+        if not data:
+            return jsonify({
+                'success': False,
+                'error': '请求数据为空',
+                'content_type': request.content_type,
+                'has_data': bool(request.data)
+            }), 400
+        
+        # 打印接收到的数据用于调试
+        print(f"[物理学家分析] 接收到的数据: {json.dumps(data, ensure_ascii=False, indent=2)}")
+        
+        try:
+            parse_speed(data.get('speed', 0))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        messages = build_physics_analysis_messages(data)
         
         # 调用物理学家角色
         try:
-            physicist_personality = get_role_personality('physicist')
-            if not physicist_personality:
-                raise ValueError("无法获取物理学家角色设定")
-            
-            messages = [
-                {"role": "system", "content": physicist_personality},
-                {"role": "user", "content": query}
-            ]
-            
             # 检查是否请求流式输出
-            stream = request.json.get('stream', False)
+            stream = data.get('stream', False)
             
             if stream:
                 # 流式输出模式
@@ -1814,24 +2118,14 @@ def physics_analyze():
                             yield f"data: {json.dumps({'error': 'API返回的分析内容为空'})}\n\n"
                             return
                         
-                        # 将分析文本分块发送（模拟流式输出）
-                        chunk_size = 40  # 每次发送40个字符（减少块大小，让显示更平滑）
-                        total_length = len(physics_analysis)
-                        sent_length = 0
-                        
                         # 发送开始信号
-                        yield f"data: {json.dumps({'type': 'start', 'total': total_length})}\n\n"
-                        time.sleep(0.5)
+                        yield f"data: {json.dumps({'type': 'start', 'total': len(physics_analysis)})}\n\n"
+                        time.sleep(ANALYSIS_STREAM_START_DELAY)
                         
-                        # 分块发送内容
-                        while sent_length < total_length:
-                            chunk = physics_analysis[sent_length:sent_length + chunk_size]
-                            sent_length += len(chunk)
-                            
-                            yield f"data: {json.dumps({'type': 'chunk', 'content': chunk, 'progress': min(100, int(sent_length * 100 / total_length))})}\n\n"
-                            
-                            # 大幅增加延迟，让用户明显看到逐步显示
-                            time.sleep(0.3)  # 300ms延迟，让用户明显看到逐步显示的效果
+                        # 将分析文本分块发送（模拟流式输出），让用户明显看到逐步显示
+                        for chunk_event in analysis_stream_chunks(physics_analysis):
+                            yield f"data: {json.dumps(chunk_event)}\n\n"
+                            time.sleep(ANALYSIS_STREAM_CHUNK_DELAY)
                         
                         # 发送完成信号
                         yield f"data: {json.dumps({'type': 'done'})}\n\n"
@@ -1867,26 +2161,7 @@ def physics_analyze():
                 'traceback': traceback.format_exc()
             }), 500
         
-        # 保存分析结果（如果失败不影响返回结果）
-        try:
-            session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
-            conn = sqlite3.connect('simulation_data.db')
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO role_analyses (session_id, role_name, analysis_text, metadata)
-                VALUES (?, ?, ?, ?)
-            ''', (session_id, 'physicist_detailed', physics_analysis, json.dumps({
-                'type': 'physics_analysis',
-                'vehicle': vehicle,
-                'bump': bump,
-                'speed': speed,
-                'survival_rate': survival_rate
-            })))
-            conn.commit()
-            conn.close()
-        except Exception as db_error:
-            # 数据库保存失败不影响API返回，只记录错误
-            print(f"警告：保存分析结果到数据库失败: {db_error}")
+        save_physics_analysis(data, physics_analysis)
         
         return jsonify({
             'success': True,
@@ -2038,19 +2313,12 @@ function update{chart_function_name}() {{
         # 保存设计方案
         try:
             session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
-            conn = sqlite3.connect('simulation_data.db')
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO role_analyses (session_id, role_name, analysis_text, metadata)
-                VALUES (?, ?, ?, ?)
-            ''', (session_id, 'designer_chart', design_code, json.dumps({
+            write_behind.record_role_analysis(session_id, 'designer_chart', design_code, json.dumps({
                 'type': 'chart_design',
                 'chart_type': chart_type,
                 'user_data': user_data,
                 'physics_data': physics_data
-            })))
-            conn.commit()
-            conn.close()
+            }))
         except Exception as db_error:
             print(f"警告：保存设计方案到数据库失败: {db_error}")
         
@@ -2073,6 +2341,211 @@ function update{chart_function_name}() {{
             'traceback': error_traceback
         }), 500
 
+# ========== 图表数据 API ==========
+
+# 批量分析/导出的最大数据点数
+MAX_BATCH_POINTS = int(os.getenv('MAX_BATCH_POINTS', '10000'))
+
+def normalize_chart_params(data):
+    """
+    规范化图表参数：只保留该图表类型依赖的参数，作为缓存键
+
+    Returns:
+        (chart_type, params)；参数无效时抛出 ValueError
+    """
+    chart_type = data.get('chart_type', 'heatmap')
+    if chart_type not in physics_engine.CHART_SERIES:
+        raise ValueError(f'未知的图表类型: {chart_type}')
+    
+    values = {
+        'vehicle': data.get('vehicle', '节能型小型车'),
+        'bump': data.get('bump', '橡胶减速带'),
+        'location': data.get('location', '学校门口'),
+        'speed': round(parse_speed(data.get('speed', 0)), 2)
+    }
+    if values['vehicle'] not in physics_engine.VEHICLE_PARAMS:
+        raise ValueError(f'未知的车辆类型: {values["vehicle"]}')
+    if values['bump'] not in physics_engine.SPEED_BUMP_PARAMS:
+        raise ValueError(f'未知的减速带类型: {values["bump"]}')
+    
+    _, param_names, _ = physics_engine.CHART_SERIES[chart_type]
+    return chart_type, {name: values[name] for name in param_names}
+
+def get_chart_rows(chart_type, params):
+    """获取图表数据（LRU缓存，键为规范化后的参数），返回 (rows, 是否命中缓存)"""
+    cache_key = (chart_type,) + tuple(params.values())
+    rows = chart_data_cache.get(cache_key)
+    if rows is not None:
+        return rows, True
+    series_func = physics_engine.CHART_SERIES[chart_type][0]
+    rows = list(series_func(*params.values()))
+    chart_data_cache.put(cache_key, rows)
+    return rows, False
+
+def normalize_points(points):
+    """规范化批量数据点，返回 (vehicle, bump, location, speed) 元组列表；参数无效时抛出 ValueError"""
+    if not isinstance(points, list) or not points:
+        raise ValueError('points 必须是非空列表')
+    if len(points) > MAX_BATCH_POINTS:
+        raise ValueError(f'数据点数量 {len(points)} 超过上限 {MAX_BATCH_POINTS}')
+    return [
+        (p.get('vehicle'), p.get('bump'), p.get('location', '学校门口'), round(parse_speed(p.get('speed', 0)), 2))
+        for p in points
+    ]
+
+def analyze_point_cached(point):
+    """单个数据点的分析结果（LRU缓存）"""
+    row = analysis_cache.get(point)
+    if row is None:
+        row = physics_engine.analyze_point(*point)
+        analysis_cache.put(point, row)
+    return row
+
+@app.route('/api/charts/data', methods=['POST', 'OPTIONS'])
+def get_chart_data():
+    """获取图表数据 - 服务器端按物理模型计算图表数据（支持缓存）"""
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        return response, 200
+    try:
+        data = request.json or {}
+        try:
+            chart_type, params = normalize_chart_params(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        rows, cached = get_chart_rows(chart_type, params)
+        
+        return jsonify({
+            'success': True,
+            'chart_type': chart_type,
+            'params': params,
+            'data': rows,
+            'cached': cached
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+@app.route('/api/charts/batch-analysis', methods=['POST', 'OPTIONS'])
+def batch_analyze_chart_points():
+    """批量分析图表数据点 - 一次请求分析多个参数组合"""
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        return response, 200
+    try:
+        data = request.json or {}
+        try:
+            points = normalize_points(data.get('points'))
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        results = [analyze_point_cached(point) for point in points]
+        
+        valid = [r for r in results if 'error' not in r]
+        survival_rates = [r['survivalRate'] for r in valid]
+        distribution = {}
+        for r in valid:
+            distribution[r['result']] = distribution.get(r['result'], 0) + 1
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'summary': {
+                'total': len(results),
+                'valid': len(valid),
+                'average_survival_rate': round(sum(survival_rates) / len(survival_rates), 2) if survival_rates else None,
+                'min_survival_rate': min(survival_rates) if survival_rates else None,
+                'max_survival_rate': max(survival_rates) if survival_rates else None,
+                'result_distribution': distribution
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+@app.route('/api/charts/export', methods=['POST', 'OPTIONS'])
+def export_chart_data():
+    """导出图表数据（CSV/JSON）- 逐行流式输出，不在内存中拼接完整文件"""
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        return response, 200
+    try:
+        data = request.json or {}
+        export_format = data.get('format', 'csv').lower()
+        if export_format not in ('csv', 'json'):
+            return jsonify({'success': False, 'error': f'不支持的导出格式: {export_format}'}), 400
+        
+        # 参数在开始输出前校验完毕，数据行在输出时才逐行生成
+        try:
+            if 'points' in data:
+                points = normalize_points(data['points'])
+                fields = physics_engine.POINT_FIELDS + ('error',)
+                rows = (analyze_point_cached(point) for point in points)
+                name = 'batch_analysis'
+            else:
+                chart_type, params = normalize_chart_params(data)
+                fields = physics_engine.CHART_SERIES[chart_type][2]
+                cache_key = (chart_type,) + tuple(params.values())
+                rows = chart_data_cache.get(cache_key) or physics_engine.CHART_SERIES[chart_type][0](*params.values())
+                name = chart_type
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        def generate_csv():
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+            buffer.write('﻿')  # BOM，保证 Excel 正确识别中文
+            writer.writeheader()
+            yield buffer.getvalue()
+            for row in rows:
+                buffer.seek(0)
+                buffer.truncate(0)
+                writer.writerow(row)
+                yield buffer.getvalue()
+        
+        def generate_json():
+            yield '['
+            for i, row in enumerate(rows):
+                yield (',' if i else '') + json.dumps(row, ensure_ascii=False)
+            yield ']'
+        
+        filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+        return Response(
+            stream_with_context(generate_csv() if export_format == 'csv' else generate_json()),
+            mimetype='text/csv' if export_format == 'csv' else 'application/json',
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Headers': '*',
+                'Access-Control-Allow-Methods': '*'
+            }
+        )
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
 # ========== 个性化功能 API ==========
 
 @app.route('/api/profile/<session_id>', methods=['GET', 'OPTIONS'])
@@ -2425,6 +2898,8 @@ def compare_sessions():
 
 # 初始化数据库
 init_db()
+# 从 user_choices 重建统计数据
+statistics_store.get_statistics_store()
 
 if __name__ == '__main__':
     print("=" * 50)
@@ -2437,12 +2912,14 @@ if __name__ == '__main__':
     print("  POST /api/simulation/advanced - 高级物理模拟")
     print("  POST /api/report/generate - 生成报告")
     print("  GET  /api/statistics - 获取统计数据")
+    print("  GET  /api/cache/stats - LLM响应缓存与请求合并统计")
     print("  GET  /api/history/<session_id> - 获取会话历史")
     print("  POST /api/recommend - 智能参数推荐")
     print("  POST /api/risk/assess - 实时风险评估")
     print("  POST /api/learning/path - 个性化学习路径")
     print("  POST /api/report/title - 智能报告标题生成")
     print("  POST /api/debate - 多角色辩论生成（增强版）")
+    print("  POST /api/debate/stream - 多角色辩论（流式输出，支持按 debate_id 续传）")
     print("  POST /api/questions/generate - 智能问题生成")
     print("  GET  /api/profile/<session_id> - 获取用户画像")
     print("  POST /api/profile/analyze - 分析用户画像")
@@ -2456,6 +2933,7 @@ if __name__ == '__main__':
     print("  POST /api/collaborate/compare - 比较两个会话")
     print("  POST /api/physics/calculate - 物理学家计算模拟结果")
     print("  POST /api/physics/analyze - 物理学家公式分析（支持流式输出）")
+    print("  POST /api/physics/sweep - 参数扫描（向量化批量计算幸存率）")
     print("  POST /api/design/chart - 可视化设计师设计图表")
     print("  POST /api/charts/data - 获取图表数据（支持缓存）")
     print("  POST /api/charts/batch-analysis - 批量分析图表数据点")
@@ -0,0 +1,666 @@
+"""
+异步服务模式（ASGI）
+调用智谱AI的主要接口和所有 SSE 接口由 Quart 异步路由处理（见 ASYNC_PATHS）：等待上游响应时不占用线程，
+单个进程可以同时挂起大量请求；其余接口交给 app.py 中的 Flask 应用，在线程池中并发执行
+（AsyncioWSGIMiddleware，线程数见 WSGI_MAX_THREADS）。
+接口路径和 JSON 格式与 app.py 完全一致。
+
+启动方式：
+    hypercorn asgi_app:application --bind 0.0.0.0:5001
+"""
+import os
+import json
+import time
+import asyncio
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, request, jsonify, Response, has_request_context
+from hypercorn.middleware import AsyncioWSGIMiddleware
+
+import app as flask_module
+import async_zhipu_client
+import llm_cache
+import physics_engine
+import rate_limiter
+import role_collaboration
+import write_behind
+from app import (
+    ROLES, ANALYZE_ROLES, ANALYZE_ROLE_TIMEOUT, ANALYZE_RESULT_BUILDERS, ROUTE_PRIORITIES,
+    LEARNING_PATH_ROLES, SIMPLE_DEBATE_ROLES, NEW_FEATURES_ENABLED,
+    ANALYSIS_STREAM_START_DELAY, ANALYSIS_STREAM_CHUNK_DELAY, DebateRequestError,
+    get_role_personality, save_user_choice, build_analyze_query, collect_analyze_results,
+    build_chat_messages, build_physics_explanation_messages, save_physics_calculation,
+    build_role_messages, build_risk_query, parse_risk_level, build_learning_path_query, build_debate_query,
+    prepare_debate_stream, debate_sse_event, debate_start_event, debate_output_event,
+    save_debate_statement, finish_debate, load_debate, claim_debate, release_debate, DEBATE_ACTIVE_ERROR,
+    build_physics_analysis_messages, save_physics_analysis, analysis_stream_chunks, parse_speed
+)
+
+app = Quart(__name__)
+# SSE 响应持续时间取决于上游生成速度，不设置响应超时
+app.config['RESPONSE_TIMEOUT'] = None
+
+# 由异步路由处理的接口，其余 HTTP 请求交给 Flask 应用
+ASYNC_PATHS = frozenset({
+    '/api/analyze', '/api/chat', '/api/physics/calculate', '/api/physics/analyze',
+    '/api/risk/assess', '/api/learning/path', '/api/debate', '/api/debate/stream'
+})
+# Flask 接口（以及 asyncio.to_thread）使用的线程数上限
+WSGI_MAX_THREADS = int(os.getenv('WSGI_MAX_THREADS', '64'))
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': '*',
+    'Access-Control-Allow-Methods': '*'
+}
+
+
+@app.after_request
+async def after_request(response):
+    """为所有响应添加CORS头"""
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers.add('Access-Control-Allow-Headers', '*')
+    response.headers.add('Access-Control-Allow-Methods', '*')
+    response.headers.add('Access-Control-Allow-Credentials', 'false')
+    return response
+
+
+@app.before_serving
+async def configure_executor():
+    """替换事件循环的默认线程池：AsyncioWSGIMiddleware 在其中运行 Flask 请求，每个请求独占一个线程"""
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=WSGI_MAX_THREADS, thread_name_prefix='wsgi')
+    )
+
+
+@app.after_serving
+async def close_client():
+    """关闭共享的 HTTP 连接池"""
+    await async_zhipu_client.aclose()
+
+
+def preflight_response():
+    """OPTIONS 预检响应"""
+    response = jsonify({})
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+    return response, 200
+
+
+def request_priority():
+    """当前请求对应的限流优先级（与 app.request_priority 一致）"""
+    if has_request_context():
+        return ROUTE_PRIORITIES.get(request.path, rate_limiter.PRIORITY_NORMAL)
+    return rate_limiter.PRIORITY_NORMAL
+
+
+async def call_role_api(role_key, messages, model="glm-4-flash", temperature=0.5, use_cache=False, deadline=None, priority=None):
+    """
+    调用角色API（异步版本，语义与 app.call_role_api 一致）
+
+    与同步路由共用同一个响应缓存；并发合并使用 AsyncSingleFlight
+    """
+    if role_key not in ROLES:
+        raise ValueError(f"Invalid role: {role_key}")
+    role_module = ROLES[role_key]['module']
+    if priority is None:
+        priority = request_priority()
+
+    cache = llm_cache.get_llm_cache()
+    cache_key = cache.make_key(role_key, model, temperature, messages)
+    if use_cache:
+        # 启用持久化时读取会访问 SQLite，放到线程中执行
+        response = await asyncio.to_thread(cache.get, cache_key) if cache.db_path else cache.get(cache_key)
+        if response is not None:
+            return response
+
+    # 角色模块对消息的预处理（如交通工程师截断历史消息）
+    trim_messages = getattr(role_module, 'trim_messages', None)
+    if trim_messages is not None:
+        messages = trim_messages(messages)
+
+    async def fetch():
+        response = await async_zhipu_client.call_zhipu_api(
+            messages, model=model, temperature=temperature, deadline=deadline, priority=priority
+        )
+        if use_cache:
+            if cache.db_path:
+                await asyncio.to_thread(cache.put, cache_key, response)
+            else:
+                cache.put(cache_key, response)
+        return response
+
+    return await llm_cache.get_async_single_flight().do(cache_key, fetch)
+
+
+def stream_role_api(role_key, messages, deadline=None, priority=None):
+    """以流式方式调用角色API（异步生成器，priority 为None时按当前请求的接口确定）"""
+    if role_key not in ROLES:
+        raise ValueError(f"Invalid role: {role_key}")
+    if priority is None:
+        priority = request_priority()
+    return async_zhipu_client.stream_zhipu_api(messages, deadline=deadline, priority=priority)
+
+
+async def run_role_analysis(role_key, user_query, vehicle, location, speed, survival_rate, deadline=None):
+    """执行单个角色的分析，异常作为该角色的错误结果返回"""
+    try:
+        messages = [
+            {"role": "system", "content": get_role_personality(role_key)},
+            {"role": "user", "content": user_query}
+        ]
+        response = await call_role_api(role_key, messages, deadline=deadline)
+        analysis = response['choices'][0]['message']['content']
+        return ANALYZE_RESULT_BUILDERS[role_key](analysis, vehicle, location, speed, survival_rate)
+    except Exception as e:
+        return {'error': str(e), 'traceback': traceback.format_exc()}
+
+
+# ========== API 路由 ==========
+
+@app.route('/api/analyze', methods=['POST', 'OPTIONS'])
+async def analyze():
+    """分析用户选择，返回多角色分析结果"""
+    if request.method == 'OPTIONS':
+        return preflight_response()
+    try:
+        data = await request.get_json()
+        session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
+        vehicle = data.get('vehicle')
+        bump = data.get('bump')
+        location = data.get('location')
+        speed = data.get('speed', 0)
+        survival_rate = data.get('survival_rate', 0)
+
+        # 保存用户选择到数据库
+        await asyncio.to_thread(save_user_choice, session_id, vehicle, bump, location, speed, survival_rate)
+
+        user_query = build_analyze_query(vehicle, bump, location, speed, survival_rate)
+
+        # 各角色并发分析，共享同一截止时间；超时的角色被取消并返回错误
+        deadline = time.monotonic() + ANALYZE_ROLE_TIMEOUT
+        tasks = {
+            role_key: asyncio.create_task(
+                run_role_analysis(role_key, user_query, vehicle, location, speed, survival_rate, deadline)
+            )
+            for role_key in ANALYZE_ROLES
+        }
+        done, pending = await asyncio.wait(tasks.values(), timeout=max(0, deadline - time.monotonic()))
+        for task in pending:
+            task.cancel()
+
+        # 超时、被取消或异常结束的角色都按未完成处理
+        outcomes = {
+            role_key: task.result() if task in done and not task.cancelled() and task.exception() is None else None
+            for role_key, task in tasks.items()
+        }
+        # 写入可能同步落盘（write_behind 为 sync 模式或队列已满），不在事件循环中执行
+        results = await asyncio.to_thread(collect_analyze_results, session_id, outcomes)
+
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'results': results
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+@app.route('/api/chat', methods=['POST', 'OPTIONS'])
+async def chat():
+    """与特定角色对话"""
+    if request.method == 'OPTIONS':
+        return preflight_response()
+    try:
+        data = await request.get_json()
+        session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
+        role = data.get('role')
+        message = data.get('message')
+        history = data.get('history', [])
+
+        if role not in ROLES:
+            return jsonify({'error': 'Invalid role'}), 400
+
+        messages = build_chat_messages(role, message, history, session_id)
+
+        response = await call_role_api(role, messages)
+        assistant_reply = response['choices'][0]['message']['content']
+
+        # 保存对话记录
+        await asyncio.to_thread(write_behind.record_conversation, session_id, role, message, assistant_reply)
+
+        return jsonify({
+            'success': True,
+            'response': assistant_reply,
+            'role': ROLES[role]['name']
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+@app.route('/api/physics/calculate', methods=['POST', 'OPTIONS'])
+async def physics_calculate():
+    """物理学家计算模拟结果（支持流式输出）"""
+    if request.method == 'OPTIONS':
+        return preflight_response()
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({
+                'success': False,
+                'error': '请求数据为空'
+            }), 400
+
+        vehicle = data.get('vehicle', '未知')
+        bump = data.get('bump', '未知')
+        location = data.get('location', '未知')
+        weather = data.get('weather', '晴')
+        try:
+            speed = parse_speed(data.get('speed', 0))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        stream = data.get('stream', True)
+        explain = data.get('explain', False)
+        session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
+
+        result_data = physics_engine.simulate(vehicle, bump, location, speed)
+        if result_data is None:
+            return jsonify({
+                'success': False,
+                'error': f'参数错误: 未知的车辆类型或减速带类型（{vehicle} / {bump}）'
+            }), 400
+
+        def build_explanation_messages():
+            return build_physics_explanation_messages(vehicle, bump, location, weather, speed, result_data)
+
+        def save_calculation(analysis_text):
+            save_physics_calculation(session_id, vehicle, bump, location, speed, result_data, analysis_text)
+
+        if stream:
+            # 流式输出模式：计算结果立即发送，需要解释时再转发LLM生成的token
+            async def generate():
+                try:
+                    yield f"data: {json.dumps({'type': 'start', 'message': '开始计算...'})}\n\n"
+                    for key, value in result_data.items():
+                        yield f"data: {json.dumps({'type': 'result', 'key': key, 'value': value})}\n\n"
+                    yield f"data: {json.dumps({'type': 'complete', 'physics': result_data})}\n\n"
+
+                    explanation = ''
+                    if explain:
+                        async for delta in explanation_stream:
+                            explanation += delta
+                            yield f"data: {json.dumps({'type': 'explanation', 'content': delta})}\n\n"
+                        yield f"data: {json.dumps({'type': 'done'})}\n\n"
+
+                    await asyncio.to_thread(save_calculation, explanation or result_data['calculation_steps'])
+                except Exception as e:
+                    yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+
+            # 在请求上下文中创建上游流（限流优先级取决于当前接口）
+            explanation_stream = stream_role_api('physicist', build_explanation_messages()) if explain else None
+            response_obj = Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+            response_obj.timeout = None
+            return response_obj
+        else:
+            explanation = None
+            if explain:
+                try:
+                    response = await call_role_api('physicist', build_explanation_messages())
+                    explanation = response['choices'][0]['message']['content']
+                except Exception as api_error:
+                    return jsonify({
+                        'success': False,
+                        'error': f'物理学家解释API调用失败: {str(api_error)}',
+                        'traceback': traceback.format_exc()
+                    }), 500
+
+            await asyncio.to_thread(save_calculation, explanation or result_data['calculation_steps'])
+
+            result = {
+                'success': True,
+                'physics': result_data,
+                'role': '物理学家',
+                'timestamp': datetime.now().isoformat()
+            }
+            if explanation is not None:
+                result['explanation'] = explanation
+            return jsonify(result)
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+@app.route('/api/risk/assess', methods=['POST', 'OPTIONS'])
+async def assess_risk():
+    """实时风险评估与预警 - 评估用户当前选择的危险程度"""
+    if request.method == 'OPTIONS':
+        return preflight_response()
+    try:
+        data = await request.get_json()
+        messages = build_role_messages('safety', build_risk_query(
+            data.get('vehicle'), data.get('bump'), data.get('location'), data.get('speed', 0)
+        ))
+
+        response = await call_role_api('safety', messages, use_cache=not data.get('no_cache', False))
+        risk_assessment = response['choices'][0]['message']['content']
+
+        return jsonify({
+            'success': True,
+            'risk_level': parse_risk_level(risk_assessment),
+            'assessment': risk_assessment,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+async def query_roles(role_keys, query):
+    """多个角色并发回答同一查询，失败的角色返回 {'error': ...}"""
+    async def ask(role):
+        try:
+            response = await call_role_api(role, build_role_messages(role, query))
+            return response['choices'][0]['message']['content']
+        except Exception as e:
+            return e
+
+    answers = await asyncio.gather(*(ask(role) for role in role_keys))
+    return dict(zip(role_keys, answers))
+
+
+@app.route('/api/learning/path', methods=['POST', 'OPTIONS'])
+async def generate_learning_path():
+    """个性化学习路径生成 - 基于用户选择模式生成学习路径"""
+    if request.method == 'OPTIONS':
+        return preflight_response()
+    try:
+        data = await request.get_json()
+        user_choices = data.get('choices', [])
+        session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
+
+        # 综合多个角色视角（并发请求）
+        answers = await query_roles(LEARNING_PATH_ROLES, build_learning_path_query(user_choices))
+        learning_paths = {
+            role: {'error': str(answer)} if isinstance(answer, Exception) else answer
+            for role, answer in answers.items()
+        }
+
+        # 保存学习路径
+        await asyncio.to_thread(write_behind.record_role_analysis, session_id, 'learning_path', json.dumps(learning_paths), json.dumps({'type': 'learning_path'}))
+
+        return jsonify({
+            'success': True,
+            'learning_path': learning_paths,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+@app.route('/api/debate', methods=['POST', 'OPTIONS'])
+async def generate_debate():
+    """多角色辩论生成 - 让多个角色就用户的选择进行辩论"""
+    if request.method == 'OPTIONS':
+        return preflight_response()
+    try:
+        data = await request.get_json()
+        user_choice = data.get('choice', {})
+        session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
+
+        answers = await query_roles(SIMPLE_DEBATE_ROLES, build_debate_query(user_choice))
+        debate = {}
+        for role, answer in answers.items():
+            if isinstance(answer, Exception):
+                debate[role] = {'role_name': ROLES[role]['name'], 'error': str(answer)}
+            else:
+                debate[role] = {'role_name': ROLES[role]['name'], 'content': answer}
+
+        # 保存辩论记录
+        await asyncio.to_thread(write_behind.record_role_analysis, session_id, 'debate', json.dumps(debate), json.dumps({'type': 'debate'}))
+
+        return jsonify({
+            'success': True,
+            'debate': debate,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+@app.route('/api/debate/stream', methods=['POST', 'OPTIONS'])
+async def stream_debate():
+    """多角色辩论（流式输出）- 每条陈述（或其token）生成后立即推送；传入 debate_id 可断线续传"""
+    if request.method == 'OPTIONS':
+        return preflight_response()
+
+    if not NEW_FEATURES_ENABLED:
+        return jsonify({'error': '角色协作功能未启用'}), 503
+
+    try:
+        data = await request.get_json() or {}
+        try:
+            # 读取或创建辩论记录会访问 SQLite，放到线程中执行
+            debate = await asyncio.to_thread(prepare_debate_stream, data)
+        except DebateRequestError as e:
+            return jsonify({'success': False, 'error': str(e)}), e.status
+        debate_id = debate['debate_id']
+        stream_tokens = data.get('stream_tokens', True)  # 是否逐token推送
+
+        # 陈述在独立任务中生成，限流优先级在这里确定
+        priority = request_priority()
+
+        async def call_func(role, messages):
+            return await call_role_api(role, messages, priority=priority)
+
+        stream_func = None
+        if stream_tokens:
+            stream_func = lambda role, messages: stream_role_api(role, messages, priority=priority)
+
+        def on_statement(statement):
+            save_debate_statement(debate_id, debate['session_id'], statement, debate['participants'])
+
+        manager = role_collaboration.RoleDebateManager(call_func, get_role_personality, ROLES)
+
+        async def generate():
+            # 检查和登记之间可能有另一个续传请求开始生成，这里再原子地登记一次
+            if not claim_debate(debate_id):
+                yield debate_sse_event({'type': 'error', 'debate_id': debate_id, 'error': DEBATE_ACTIVE_ERROR})
+                return
+            events = None
+            try:
+                if data.get('debate_id'):
+                    # 登记前原生成过程可能刚保存了新的陈述
+                    debate['completed'] = (await asyncio.to_thread(load_debate, debate_id))['completed']
+                yield debate_sse_event(debate_start_event(debate))
+                events = manager.astream_interactive_debate(
+                    debate['user_choice'], debate['roles'], debate['rounds'], debate['mode'],
+                    completed=debate['completed'], stream_func=stream_func, on_statement=on_statement,
+                    on_finished=lambda: release_debate(debate_id)
+                )
+                async for event in events:
+                    if event['type'] == 'complete':
+                        await asyncio.to_thread(finish_debate, debate_id)
+                    yield debate_sse_event(debate_output_event(debate_id, event))
+            except Exception as e:
+                yield debate_sse_event({'type': 'error', 'debate_id': debate_id, 'error': str(e)})
+            finally:
+                # 已开始的陈述结束后由 on_finished 解除登记；生成器尚未开始时直接解除
+                if events is None:
+                    release_debate(debate_id)
+                else:
+                    await events.aclose()
+
+        response_obj = Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+        response_obj.timeout = None
+        return response_obj
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+@app.route('/api/physics/analyze', methods=['POST', 'OPTIONS'])
+async def physics_analyze():
+    """物理学家公式分析 - 运用物理公式详细分析模拟结果"""
+    if request.method == 'OPTIONS':
+        return preflight_response()
+    try:
+        # 尝试多种方式获取数据
+        raw_data = await request.get_data()
+        if request.is_json:
+            data = await request.get_json()
+        else:
+            # 如果不是JSON格式，尝试手动解析
+            try:
+                if raw_data:
+                    data = json.loads(raw_data.decode('utf-8'))
+                else:
+                    # 尝试从form数据获取
+                    data = (await request.form).to_dict()
+            except Exception as parse_error:
+                return jsonify({
+                    'success': False,
+                    'error': f'数据格式错误: {str(parse_error)}',
+                    'content_type': request.content_type,
+                    'data_preview': str(raw_data[:200]) if raw_data else 'None'
+                }), 400
+
+        if not data:
+            return jsonify({
+                'success': False,
+                'error': '请求数据为空',
+                'content_type': request.content_type,
+                'has_data': bool(raw_data)
+            }), 400
+
+        try:
+            parse_speed(data.get('speed', 0))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        messages = build_physics_analysis_messages(data)
+
+        if data.get('stream', False):
+            # 流式输出模式：完整分析返回后分块推送
+            async def generate():
+                try:
+                    response = await call_role_api('physicist', messages)
+                    if not response or 'choices' not in response or len(response['choices']) == 0:
+                        yield f"data: {json.dumps({'error': 'API返回数据格式错误'})}\n\n"
+                        return
+
+                    physics_analysis = response['choices'][0]['message']['content']
+                    if not physics_analysis:
+                        yield f"data: {json.dumps({'error': 'API返回的分析内容为空'})}\n\n"
+                        return
+
+                    yield f"data: {json.dumps({'type': 'start', 'total': len(physics_analysis)})}\n\n"
+                    await asyncio.sleep(ANALYSIS_STREAM_START_DELAY)
+
+                    for chunk_event in analysis_stream_chunks(physics_analysis):
+                        yield f"data: {json.dumps(chunk_event)}\n\n"
+                        await asyncio.sleep(ANALYSIS_STREAM_CHUNK_DELAY)
+
+                    yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                except Exception as e:
+                    yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+
+            response_obj = Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+            response_obj.timeout = None
+            return response_obj
+
+        try:
+            response = await call_role_api('physicist', messages)
+            if not response or 'choices' not in response or len(response['choices']) == 0:
+                raise ValueError("API返回数据格式错误")
+
+            physics_analysis = response['choices'][0]['message']['content']
+            if not physics_analysis:
+                raise ValueError("API返回的分析内容为空")
+        except Exception as api_error:
+            return jsonify({
+                'success': False,
+                'error': f'物理学家分析API调用失败: {str(api_error)}',
+                'traceback': traceback.format_exc()
+            }), 500
+
+        await asyncio.to_thread(save_physics_analysis, data, physics_analysis)
+
+        return jsonify({
+            'success': True,
+            'analysis': physics_analysis,
+            'role': '物理学家',
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+# ========== ASGI 入口 ==========
+
+# Flask 请求在事件循环的默认线程池中执行（见 configure_executor），互不阻塞
+flask_asgi_app = AsyncioWSGIMiddleware(flask_module.app)
+
+async def application(scope, receive, send):
+    """ASGI 入口：异步接口交给 Quart，其余 HTTP 请求交给 Flask；lifespan 事件由 Quart 处理"""
+    if scope['type'] == 'http' and scope['path'] not in ASYNC_PATHS:
+        await flask_asgi_app(scope, receive, send)
+    else:
+        await app(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import hypercorn.asyncio
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = ['0.0.0.0:5001']
+    print("=" * 50)
+    print("飞跃减速带实验系统 - 后端服务器（异步模式）")
+    print("=" * 50)
+    print("服务器启动在: http://localhost:5001")
+    print("异步接口: " + ", ".join(sorted(ASYNC_PATHS)))
+    print(f"其余接口由 Flask 应用处理（线程池 {WSGI_MAX_THREADS} 个线程），见 app.py")
+    print("=" * 50)
+    asyncio.run(hypercorn.asyncio.serve(application, config))
@@ -0,0 +1,186 @@
+"""
+智谱AI 异步客户端模块
+供 asgi_app.py 使用：基于 httpx.AsyncClient 的连接池，等待上游响应时不占用线程。
+重试、截止时间、熔断和限流与同步客户端（zhipu_client.py）共用同一套配置和状态
+"""
+import json
+import asyncio
+
+import httpx
+
+import resilience
+import rate_limiter
+from zhipu_client import (
+    ZHIPU_API_KEY, ZHIPU_API_URL, CONNECT_TIMEOUT, READ_TIMEOUT, POOL_MAXSIZE, _raise_api_error
+)
+
+_client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """获取共享的 AsyncClient（需在事件循环中调用）"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            headers={
+                "Authorization": ZHIPU_API_KEY,
+                "Content-Type": "application/json"
+            },
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=POOL_MAXSIZE),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+        )
+    return _client
+
+
+async def aclose():
+    """关闭共享的 AsyncClient"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def call_zhipu_api(messages, model="glm-4-flash", temperature=0.5, deadline=None, priority=None):
+    """
+    调用智谱AI对话补全接口（异步）
+
+    Args:
+        messages: 消息列表
+        model: 模型名称
+        temperature: 采样温度
+        deadline: 截止时间（time.monotonic() 时间戳，含限流排队和重试），为None时使用默认时长
+        priority: 限流排队优先级（见 rate_limiter），为None时为普通优先级
+
+    Returns:
+        API返回的JSON数据
+    """
+    data = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature
+    }
+    if deadline is None:
+        deadline = resilience.make_deadline()
+
+    response = await _post_with_retry(data, deadline, priority=priority)
+    return response.json()
+
+
+async def stream_zhipu_api(messages, model="glm-4-flash", temperature=0.5, deadline=None, priority=None):
+    """
+    以流式方式调用智谱AI对话补全接口（异步生成器）
+
+    Yields:
+        模型逐步生成的文本片段
+    """
+    data = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "stream": True
+    }
+    if deadline is None:
+        deadline = resilience.make_deadline()
+
+    response = await _post_with_retry(data, deadline, stream=True, priority=priority)
+    breaker = resilience.get_breaker(model)
+    # 并发名额一直占用到流式输出结束
+    try:
+        async for line in response.aiter_lines():
+            if not line or not line.startswith('data:'):
+                continue
+            payload = line[len('data:'):].strip()
+            if payload == '[DONE]':
+                break
+            chunk = json.loads(payload)
+            choices = chunk.get('choices') or []
+            if not choices:
+                continue
+            content = choices[0].get('delta', {}).get('content')
+            if content:
+                yield content
+    except httpx.TimeoutException:
+        breaker.record_failure()
+        raise Exception("API请求超时，请稍后重试")
+    except httpx.HTTPError as e:
+        breaker.record_failure()
+        raise Exception(f"网络请求失败: {str(e)}")
+    finally:
+        try:
+            await response.aclose()
+        finally:
+            rate_limiter.get_limiter(model).release()
+
+
+async def _post_with_retry(data, deadline, stream=False, priority=None):
+    """
+    发送请求：429/5xx/超时/连接错误时退避重试，直到成功、重试次数用完或到达截止时间
+    （与 zhipu_client._post_with_retry 的策略一致，每次尝试单独获取限流令牌和并发名额）
+
+    Returns:
+        状态码为200的响应；stream=True 时响应体尚未读取，由调用方关闭并归还并发名额
+    """
+    client = get_client()
+    breaker = resilience.get_breaker(data["model"])
+    limiter = rate_limiter.get_limiter(data["model"])
+    priority = rate_limiter.PRIORITY_NORMAL if priority is None else priority
+
+    attempt = 0
+    while True:
+        if resilience.remaining(deadline) <= 0:
+            raise resilience.DeadlineExceededError("API请求超时，请稍后重试")
+
+        await limiter.acquire_async(priority, deadline)
+        keep_slot = False
+        probe = None
+        try:
+            # 先取得限流名额再占用熔断器的探测名额，排队被拒绝时不会占住 half_open
+            probe = breaker.before_call()
+            # 排队也计入截止时间
+            left = resilience.remaining(deadline)
+            if left <= 0:
+                raise resilience.DeadlineExceededError("API请求超时，请稍后重试")
+            retry_after = None
+            try:
+                request = client.build_request(
+                    "POST",
+                    ZHIPU_API_URL,
+                    json=data,
+                    timeout=httpx.Timeout(min(READ_TIMEOUT, left), connect=min(CONNECT_TIMEOUT, left))
+                )
+                response = await client.send(request, stream=stream)
+            except httpx.TimeoutException:
+                breaker.record_failure()
+                error = Exception("API请求超时，请稍后重试")
+            except httpx.HTTPError as e:
+                breaker.record_failure()
+                error = Exception(f"网络请求失败: {str(e)}")
+            else:
+                if response.status_code == 200:
+                    breaker.record_success()
+                    keep_slot = stream
+                    return response
+                if stream:
+                    await response.aread()
+                    await response.aclose()
+                if response.status_code not in resilience.RETRYABLE_STATUS:
+                    # 其他 4xx 是请求本身的问题，说明上游可用
+                    breaker.record_success()
+                    _raise_api_error(response)
+                breaker.record_failure()
+                retry_after = resilience.parse_retry_after(response.headers.get('Retry-After'))
+                try:
+                    _raise_api_error(response)
+                except Exception as e:
+                    error = e
+        finally:
+            # 截止时间到达、被取消等没有记录结果的退出，归还探测名额
+            breaker.release_probe(probe)
+            if not keep_slot:
+                limiter.release()
+
+        attempt += 1
+        delay = resilience.backoff_delay(attempt, retry_after)
+        if attempt > resilience.MAX_RETRIES or delay >= resilience.remaining(deadline):
+            raise error
+        await asyncio.sleep(delay)
@@ -0,0 +1,283 @@
+"""
+对话上下文管理模块
+按 token 预算组装 /api/chat 的消息列表：系统提示词 + 早前对话摘要 + 最近的历史消息 + 当前消息。
+历史从最近的消息开始保留，放不下的早前消息压缩为抽取式摘要（每条取首句）并入系统提示词；
+摘要按 (session_id, 角色) 缓存，历史增长时只处理新移出窗口的消息（按已摘要的消息数和首末两条消息的指纹
+判断缓存是否仍对应当前历史，不重新计算整段历史的哈希）。
+token 数为估算值（中日韩字符按 1 个 token，其余非空白字符按 4 个字符 1 个 token），偏保守
+"""
+import os
+import re
+import json
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# 单次请求的 token 预算（系统提示词 + 摘要 + 历史 + 当前消息）
+CHAT_CONTEXT_BUDGET = int(os.getenv('CHAT_CONTEXT_BUDGET', '8000'))
+# 早前对话摘要的 token 上限
+CHAT_SUMMARY_BUDGET = int(os.getenv('CHAT_SUMMARY_BUDGET', '400'))
+# 摘要中每条消息保留的最大字符数
+CHAT_SUMMARY_LINE_CHARS = int(os.getenv('CHAT_SUMMARY_LINE_CHARS', '60'))
+# 缓存摘要的会话数上限
+CHAT_SUMMARY_CACHE_SIZE = int(os.getenv('CHAT_SUMMARY_CACHE_SIZE', '5000'))
+
+# 每条消息的格式开销（role 标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+# 当前消息至少保留的 token 数（系统提示词过长、预算不足时）
+MIN_MESSAGE_TOKENS = 256
+
+_CJK_RE = re.compile(r'[⺀-鿿가-힯豈-﫿＀-￯　-〿]')
+_SPACE_RE = re.compile(r'\s')
+_SENTENCE_END_RE = re.compile(r'[。！？!?\n]|\.(?:\s|$)')
+
+SUMMARY_HEADER = '【早前对话摘要】'
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    other = len(text) - cjk - len(_SPACE_RE.findall(text))
+    return cjk + math.ceil(other / 4)
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """估算单条消息的 token 数"""
+    return estimate_tokens(message.get('content', '')) + MESSAGE_OVERHEAD_TOKENS
+
+
+def clip_to_tokens(text: str, max_tokens: int) -> str:
+    """截取文本开头，使其不超过 max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # 二分查找能放下的最长前缀
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + '…'
+
+
+def normalize_history(history) -> List[Dict[str, str]]:
+    """只保留 user/assistant 且内容为字符串的消息（历史由客户端提供）"""
+    messages = []
+    for item in history or []:
+        if not isinstance(item, dict):
+            continue
+        role = item.get('role')
+        content = item.get('content')
+        if role in ('user', 'assistant') and isinstance(content, str) and content:
+            messages.append({'role': role, 'content': content})
+    return messages
+
+
+def summarize_message(message: Dict[str, str]) -> str:
+    """抽取式摘要：取消息的首句"""
+    content = ' '.join(message['content'].split())
+    match = _SENTENCE_END_RE.search(content)
+    sentence = content[:match.end()].strip() if match else content
+    if len(sentence) > CHAT_SUMMARY_LINE_CHARS:
+        sentence = sentence[:CHAT_SUMMARY_LINE_CHARS] + '…'
+    speaker = '用户' if message['role'] == 'user' else '助手'
+    return f"{speaker}：{sentence}"
+
+
+def _fingerprint(message: Dict[str, str]) -> str:
+    payload = json.dumps([message['role'], message['content']], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _prefix_fingerprint(messages: List[Dict[str, str]], count: int):
+    """messages[:count] 的指纹：消息数 + 首末两条消息的指纹（与前缀长度无关的常数开销）"""
+    if count == 0:
+        return (0, None, None)
+    return (count, _fingerprint(messages[0]), _fingerprint(messages[count - 1]))
+
+
+def trim_to_budget(messages: List[Dict[str, Any]], budget: int = CHAT_CONTEXT_BUDGET) -> List[Dict[str, Any]]:
+    """
+    按 token 预算截取已组装好的消息列表：保留开头的系统消息和最后一条消息，
+    其余从最近的消息开始保留到预算用完（供直接传入完整历史的调用方使用，不生成摘要）
+    """
+    if len(messages) <= 2:
+        return messages
+    head = messages[:1] if messages[0].get('role') == 'system' else []
+    history = messages[len(head):-1]
+    available = budget - sum(message_tokens(m) for m in head) - message_tokens(messages[-1])
+    start = ChatContextManager._window_start(history, available)
+    if start == 0:
+        return messages
+    return head + history[start:] + messages[-1:]
+
+
+class ChatContextManager:
+    """按 token 预算组装对话上下文，并缓存各会话的早前对话摘要"""
+
+    def __init__(self, budget: int = CHAT_CONTEXT_BUDGET, summary_budget: int = CHAT_SUMMARY_BUDGET,
+                 cache_size: int = CHAT_SUMMARY_CACHE_SIZE):
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self.cache_size = cache_size
+        self._summaries = OrderedDict()  # (session_id, 角色) -> (已摘要部分的指纹, 摘要行, 是否截断)
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0, 'trimmed': 0, 'message_clipped': 0,
+            'summary_hits': 0, 'summary_extended': 0, 'summary_rebuilt': 0
+        }
+
+    def build(self, system_prompt: str, history, message: str, session_id: Optional[str] = None,
+              role: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        组装消息列表，估算的总 token 数不超过预算
+        （系统提示词过长、剩余预算不足 MIN_MESSAGE_TOKENS 时，当前消息仍保留 MIN_MESSAGE_TOKENS）
+
+        Args:
+            system_prompt: 角色人格设定
+            history: 客户端提供的历史消息
+            message: 当前用户消息
+            session_id: 会话ID，用于缓存摘要
+            role: 角色，与 session_id 一起作为摘要缓存的键
+
+        Returns:
+            消息列表
+        """
+        history = normalize_history(history)
+        system_tokens = estimate_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        available = self.budget - system_tokens
+
+        # 当前消息过长时截断，保证请求大小有上限
+        message = message or ''
+        clipped = False
+        max_message_tokens = max(MIN_MESSAGE_TOKENS, available - MESSAGE_OVERHEAD_TOKENS)
+        if estimate_tokens(message) > max_message_tokens:
+            message = clip_to_tokens(message, max_message_tokens)
+            clipped = True
+        available -= estimate_tokens(message) + MESSAGE_OVERHEAD_TOKENS
+
+        start = self._window_start(history, available)
+        if start > 0:
+            # 需要摘要时为摘要预留空间后重新选择
+            summary_reserve = self.summary_budget + estimate_tokens(SUMMARY_HEADER) + 2
+            start = max(start, self._window_start(history, available - summary_reserve))
+            # 窗口从用户消息开始，避免以孤立的助手回复开头
+            while start < len(history) and history[start]['role'] != 'user':
+                start += 1
+
+        summary = ''
+        if start > 0:
+            # 摘要只能使用窗口之外的剩余预算（当前消息很长时可能不足 summary_budget）
+            remaining = available - sum(message_tokens(m) for m in history[start:])
+            summary_limit = min(self.summary_budget, remaining - estimate_tokens(SUMMARY_HEADER) - 2)
+            summary = self._summary(session_id, role, history[:start], summary_limit)
+
+        system_content = system_prompt
+        if summary:
+            system_content = f"{system_prompt}\n\n{SUMMARY_HEADER}\n{summary}"
+        messages = [{'role': 'system', 'content': system_content}]
+        messages.extend(history[start:])
+        messages.append({'role': 'user', 'content': message})
+
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['trimmed'] += start > 0
+            self._stats['message_clipped'] += clipped
+        return messages
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息"""
+        with self._lock:
+            return dict(
+                self._stats,
+                cached_sessions=len(self._summaries),
+                budget=self.budget,
+                summary_budget=self.summary_budget
+            )
+
+    @staticmethod
+    def _window_start(history, available):
+        """从最近的消息往前累加，返回能放进 available 的最早下标"""
+        used = 0
+        start = len(history)
+        while start > 0:
+            cost = message_tokens(history[start - 1])
+            if used + cost > available:
+                break
+            used += cost
+            start -= 1
+        return start
+
+    def _summary(self, session_id, role, dropped, limit):
+        """早前消息的摘要，不超过 limit 个 token；缓存命中时只为新移出窗口的消息生成摘要行"""
+        key = (session_id, role) if session_id else None
+        cached = None
+        if key is not None:
+            with self._lock:
+                cached = self._summaries.get(key)
+                if cached is not None:
+                    self._summaries.move_to_end(key)
+
+        stat = 'summary_rebuilt'
+        lines = None
+        truncated = False
+        if cached is not None:
+            fingerprint, cached_lines, truncated = cached
+            count = fingerprint[0]
+            if count <= len(dropped) and _prefix_fingerprint(dropped, count) == fingerprint:
+                lines = cached_lines + [summarize_message(m) for m in dropped[count:]]
+                stat = 'summary_hits' if count == len(dropped) else 'summary_extended'
+        if lines is None:
+            lines = [summarize_message(m) for m in dropped]
+            truncated = False
+
+        # 只保留能放进摘要预算的最近若干行
+        kept = _fit_lines(lines, self.summary_budget)
+        truncated = truncated or len(kept) < len(lines)
+
+        with self._lock:
+            self._stats[stat] += 1
+            if key is not None:
+                self._summaries[key] = (_prefix_fingerprint(dropped, len(dropped)), kept, truncated)
+                self._summaries.move_to_end(key)
+                while len(self._summaries) > self.cache_size:
+                    self._summaries.popitem(last=False)
+
+        # 缓存按 summary_budget 保存，本次输出再按剩余预算截取
+        output = _fit_lines(kept, limit) if limit < self.summary_budget else kept
+        if not output:
+            return ''
+        return ('……\n' if truncated or len(output) < len(kept) else '') + '\n'.join(output)
+
+
+def _fit_lines(lines: List[str], limit: int) -> List[str]:
+    """从最后一行往前保留，总 token 数（每行另加 1）不超过 limit"""
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > limit:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+# 全局实例
+_context_manager = None
+_context_manager_lock = threading.Lock()
+
+def get_context_manager() -> ChatContextManager:
+    """获取对话上下文管理器实例（单例）"""
+    global _context_manager
+    if _context_manager is None:
+        with _context_manager_lock:
+            if _context_manager is None:
+                _context_manager = ChatContextManager()
+    return _context_manager
@@ -0,0 +1,205 @@
+"""
+SQLite 数据库连接模块
+进程内共享的连接池：连接只打开一次（WAL 模式、synchronous=NORMAL、busy_timeout），
+按需借出、用完归还，替代每条语句都 connect/commit/close 的写法
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = 'simulation_data.db'
+
+# 写锁冲突时的等待时间（毫秒）
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+# 每个数据库保留的空闲连接数上限，超出的连接归还时直接关闭
+POOL_MAX_IDLE = int(os.getenv('SQLITE_POOL_MAX_IDLE', '16'))
+
+
+class ConnectionPool:
+    """单个数据库文件的连接池"""
+    
+    def __init__(self, db_path: str, max_idle: int = POOL_MAX_IDLE):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+    
+    def _open(self) -> sqlite3.Connection:
+        """打开新连接并设置 PRAGMA"""
+        # check_same_thread=False：连接会被不同的请求线程先后借用（同一时刻只属于一个线程）
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        # WAL：读不阻塞写、写不阻塞读
+        conn.execute('PRAGMA journal_mode=WAL')
+        # WAL 模式下 NORMAL 只在检查点时 fsync，不再每次提交都 fsync
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        return conn
+    
+    def acquire(self) -> sqlite3.Connection:
+        """借出一个连接"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._open()
+    
+    def release(self, conn: sqlite3.Connection):
+        """归还连接；未提交的事务会被回滚，避免长期占用写锁"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+    
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str = DB_PATH) -> ConnectionPool:
+    """获取数据库文件对应的连接池（单例）"""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path)
+        return pool
+
+
+@contextmanager
+def connection(db_path: str = DB_PATH):
+    """借用连接（用于只读查询），退出时自动归还"""
+    pool = get_pool(db_path)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+@contextmanager
+def transaction(db_path: str = DB_PATH):
+    """
+    在事务中执行写操作，正常退出时提交，异常时回滚
+
+    Yields:
+        游标对象
+    """
+    with connection(db_path) as conn:
+        try:
+            yield conn.cursor()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+# ========== 数据库迁移 ==========
+
+# 按 session_id 查询、按 created_at 排序的表
+SESSION_TABLES = ('user_choices', 'role_analyses', 'conversations', 'comments', 'collaborations', 'role_debates')
+
+# 迁移列表：按顺序执行，已执行到的版本号记录在 PRAGMA user_version
+MIGRATIONS = [
+    # 1: 会话查询的复合索引
+    [f'CREATE INDEX IF NOT EXISTS idx_{table}_session_created ON {table} (session_id, created_at)'
+     for table in SESSION_TABLES],
+    # 2: 流式辩论按 debate_id 续传，同一轮同一角色只保存一条陈述
+    ['CREATE UNIQUE INDEX IF NOT EXISTS idx_role_debates_debate_round_role '
+     'ON role_debates (debate_id, round_number, role_name)'],
+]
+
+# 热点查询：用于 EXPLAIN QUERY PLAN 检查，(名称, SQL, 期望使用的索引)
+HOT_QUERIES = [
+    ('generate_report.user_choices',
+     'SELECT * FROM user_choices WHERE session_id = ? ORDER BY created_at DESC LIMIT 1',
+     'idx_user_choices_session_created'),
+    ('get_history.user_choices',
+     'SELECT * FROM user_choices WHERE session_id = ? ORDER BY created_at',
+     'idx_user_choices_session_created'),
+    ('analyze_user_profile',
+     'SELECT vehicle, bump, location, speed, survival_rate FROM user_choices '
+     'WHERE session_id = ? ORDER BY created_at DESC LIMIT 50',
+     'idx_user_choices_session_created'),
+    ('generate_report.role_analyses',
+     'SELECT role_name, analysis_text, metadata FROM role_analyses WHERE session_id = ? ORDER BY created_at',
+     'idx_role_analyses_session_created'),
+    ('get_history.conversations',
+     'SELECT role_name, user_message, assistant_message, created_at FROM conversations '
+     'WHERE session_id = ? ORDER BY created_at',
+     'idx_conversations_session_created'),
+    ('get_comments',
+     'SELECT id, parent_id, user_id, content, likes, created_at FROM comments '
+     'WHERE session_id = ? ORDER BY created_at DESC LIMIT ?',
+     'idx_comments_session_created'),
+    ('get_collaborations',
+     'SELECT id, collaborator_id, collaboration_type, content, created_at FROM collaborations '
+     'WHERE session_id = ? ORDER BY created_at DESC',
+     'idx_collaborations_session_created'),
+    ('role_debates',
+     'SELECT round_number, role_name, content FROM role_debates WHERE session_id = ? ORDER BY created_at',
+     'idx_role_debates_session_created'),
+    ('load_debate',
+     'SELECT round_number, role_name, content, created_at FROM role_debates '
+     'WHERE debate_id = ? ORDER BY round_number',
+     'idx_role_debates_debate_round_role'),
+]
+
+
+def migrate(db_path: str = DB_PATH) -> int:
+    """
+    执行尚未执行的迁移（需在建表之后调用）
+
+    Returns:
+        迁移后的版本号
+    """
+    with transaction(db_path) as c:
+        version = c.execute('PRAGMA user_version').fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for sql in statements:
+                c.execute(sql)
+            c.execute(f'PRAGMA user_version = {number}')
+        return max(version, len(MIGRATIONS))
+
+
+def check_query_plans(db_path: str = DB_PATH):
+    """
+    用 EXPLAIN QUERY PLAN 检查热点查询是否走索引
+
+    Returns:
+        [{'query', 'index', 'ok', 'plan'}]；ok 要求使用了期望的索引且不需要额外排序
+    """
+    report = []
+    with connection(db_path) as conn:
+        for name, sql, index in HOT_QUERIES:
+            params = (None,) * sql.count('?')
+            plan = [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+            uses_index = any(index in detail for detail in plan)
+            needs_sort = any('TEMP B-TREE' in detail for detail in plan)
+            report.append({
+                'query': name,
+                'index': index,
+                'ok': uses_index and not needs_sort,
+                'plan': plan
+            })
+    return report
+
+
+if __name__ == '__main__':
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    print(f"数据库版本: {migrate(path)}")
+    failed = 0
+    for item in check_query_plans(path):
+        failed += not item['ok']
+        print(f"[{'OK' if item['ok'] else 'FAIL'}] {item['query']}: {' | '.join(item['plan'])}")
+    sys.exit(1 if failed else 0)
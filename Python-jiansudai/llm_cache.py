@@ -0,0 +1,322 @@
+"""
+LLM 响应缓存模块
+以 (角色, 模型, 温度, 规范化后的消息) 的哈希为键缓存对话补全结果：
+内存中按 LRU 淘汰并设置 TTL，可选 SQLite 持久化（LLM_CACHE_DB）使缓存在重启后仍然有效；
+同一个键的并发调用合并为一次上游请求（SingleFlight）
+"""
+import os
+import json
+import asyncio
+import copy
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import db
+import resilience
+
+# 内存缓存条目上限
+LLM_CACHE_CAPACITY = int(os.getenv('LLM_CACHE_CAPACITY', '2000'))
+# 缓存有效期（秒）
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', '86400'))
+# 持久化数据库路径，为空时只使用内存缓存
+LLM_CACHE_DB = os.getenv('LLM_CACHE_DB', '')
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[List[str]]:
+    """规范化消息：只保留 role/content，并合并内容中的连续空白"""
+    return [
+        [message.get('role', ''), ' '.join(str(message.get('content', '')).split())]
+        for message in messages
+    ]
+
+
+class LLMResponseCache:
+    """带 TTL 的 LRU 缓存，可选 SQLite 持久化"""
+
+    def __init__(self, capacity: int = LLM_CACHE_CAPACITY, ttl: float = LLM_CACHE_TTL,
+                 db_path: Optional[str] = LLM_CACHE_DB or None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()  # key -> (过期时间, 响应)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'disk_hits': 0, 'evictions': 0, 'expired': 0}
+        if self.db_path:
+            self._init_db()
+
+    @staticmethod
+    def make_key(role: str, model: str, temperature: float, messages: List[Dict[str, Any]]) -> str:
+        """计算缓存键"""
+        payload = json.dumps(
+            [role, model, float(temperature), normalize_messages(messages)],
+            ensure_ascii=False, separators=(',', ':')
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """获取缓存的响应（返回副本），未命中或已过期时返回 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, response = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return copy.deepcopy(response)
+                del self._entries[key]
+                self._stats['expired'] += 1
+
+        entry = self._load(key, now) if self.db_path else None
+        with self._lock:
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            self._stats['disk_hits'] += 1
+            self._remember(key, *entry)
+        return copy.deepcopy(entry[1])
+
+    def put(self, key: str, response: Dict[str, Any]):
+        """写入缓存"""
+        expires_at = time.time() + self.ttl
+        response = copy.deepcopy(response)
+        with self._lock:
+            self._remember(key, expires_at, response)
+        if self.db_path:
+            self._store(key, expires_at, response)
+
+    def clear(self):
+        """清空缓存（包括持久化数据）"""
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with db.transaction(self.db_path) as c:
+                c.execute('DELETE FROM llm_cache')
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0
+        stats['capacity'] = self.capacity
+        stats['ttl'] = self.ttl
+        stats['persistent'] = bool(self.db_path)
+        return stats
+
+    def _remember(self, key, expires_at, response):
+        """写入内存（调用方持有锁）"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        elif len(self._entries) >= self.capacity:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+        self._entries[key] = (expires_at, response)
+
+    # ========== SQLite 持久化 ==========
+
+    def _init_db(self):
+        with db.transaction(self.db_path) as c:
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT,
+                    expires_at REAL
+                )
+            ''')
+            # 启动时清理过期条目
+            c.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (time.time(),))
+
+    def _load(self, key, now):
+        try:
+            with db.connection(self.db_path) as conn:
+                row = conn.execute(
+                    'SELECT response, expires_at FROM llm_cache WHERE cache_key = ? AND expires_at > ?',
+                    (key, now)
+                ).fetchone()
+        except Exception as e:
+            print(f"警告：读取LLM缓存失败: {e}")
+            return None
+        if row is None:
+            return None
+        return row[1], json.loads(row[0])
+
+    def _store(self, key, expires_at, response):
+        try:
+            with db.transaction(self.db_path) as c:
+                c.execute('''
+                    INSERT OR REPLACE INTO llm_cache (cache_key, response, expires_at)
+                    VALUES (?, ?, ?)
+                ''', (key, json.dumps(response, ensure_ascii=False), expires_at))
+        except Exception as e:
+            print(f"警告：写入LLM缓存失败: {e}")
+
+
+class _InFlightCall:
+    """进行中的上游调用"""
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """请求合并：同一个键同时只有一个上游调用，其余调用方等待并共享其结果或异常"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'collapsed': 0, 'errors_shared': 0}
+
+    def do(self, key: str, func, deadline: Optional[float] = None):
+        """
+        执行 func()；若同一个键已有调用在进行中，则等待它完成
+        deadline 为等待的截止时间（time.monotonic() 时间戳），到达时抛出 DeadlineExceededError
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _InFlightCall()
+                self._stats['calls'] += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self._stats['collapsed'] += 1
+                leader = False
+
+        if not leader:
+            timeout = None if deadline is None else resilience.remaining(deadline)
+            if not call.event.wait(timeout):
+                with self._lock:
+                    call.waiters -= 1
+                raise resilience.DeadlineExceededError("API请求超时，请稍后重试")
+            if call.error is not None:
+                raise call.error
+            # 每个调用方拿到独立的副本
+            return copy.deepcopy(call.result)
+
+        try:
+            result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            try:
+                with self._lock:
+                    del self._calls[key]
+                    waiters = call.waiters
+                    if call.error is not None:
+                        self._stats['errors_shared'] += waiters
+                if call.error is None and waiters:
+                    # 发起方可能修改自己拿到的结果，先复制一份再交给等待的调用方
+                    call.result = copy.deepcopy(result)
+            finally:
+                call.event.set()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计：calls 为实际上游调用数，collapsed 为被合并的调用数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight 的异步版本（供 asgi_app.py 使用，只在事件循环线程中调用）
+    发起调用的任务（leader）被取消时，调用随之取消；等待中的调用方不会继承这个取消，
+    其中一个接替发起调用，其余继续等待它
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._stats = {'calls': 0, 'collapsed': 0, 'errors_shared': 0, 'takeovers': 0}
+
+    async def do(self, key: str, func):
+        """执行 await func()；若同一个键已有调用在进行中，则等待它完成"""
+        retried = False
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            self._stats['collapsed'] += 1
+            try:
+                # shield：等待方被取消时不影响进行中的调用
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled() and not _cancelling():
+                    # leader 被取消（不是当前任务被取消）：重新检查，由最先醒来的等待方接替发起调用
+                    retried = True
+                    continue
+                raise
+            except BaseException:
+                self._stats['errors_shared'] += 1
+                raise
+            return copy.deepcopy(result)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self._stats['calls'] += 1
+        if retried:
+            self._stats['takeovers'] += 1
+        try:
+            result = await func()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有等待方时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计（字段与 SingleFlight.stats 一致，另有 takeovers：leader 被取消后由等待方接替的次数）"""
+        return dict(self._stats, in_flight=len(self._calls))
+
+
+def _cancelling() -> bool:
+    """当前任务是否有未处理的取消请求（Python 3.11 之前无法判断，视为没有）"""
+    task = asyncio.current_task()
+    return bool(task is not None and getattr(task, 'cancelling', lambda: 0)())
+
+
+# 全局实例
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMResponseCache:
+    """获取LLM响应缓存实例（单例）"""
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMResponseCache()
+    return _llm_cache
+
+
+_single_flight = SingleFlight()
+
+def get_single_flight() -> SingleFlight:
+    """获取请求合并实例（单例）"""
+    return _single_flight
+
+
+_async_single_flight = AsyncSingleFlight()
+
+def get_async_single_flight() -> AsyncSingleFlight:
+    """获取异步请求合并实例（单例）"""
+    return _async_single_flight
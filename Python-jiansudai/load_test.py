@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+端到端压测脚本
+按目标 RPS（开环，按固定间隔发出请求，不等待前一个请求完成）驱动
+/api/analyze、/api/chat、/api/debate、/api/physics/calculate，
+输出 JSON 格式的 p50/p95/p99 延迟、吞吐量和上游调用次数，便于不同版本之间对比。
+
+两种用法：
+1. 压测已经启动的后端（上游调用次数需要后端指向 mock_zhipu_server.py，并通过 --upstream-stats 指定其统计地址）：
+    python load_test.py --base-url http://localhost:5001 --upstream-stats http://127.0.0.1:5101/stats
+2. 自动启动模拟智谱AI服务和后端（在临时目录中运行，不会写入仓库中的数据库）：
+    python load_test.py --spawn flask --rps 20 --duration 30 --output result.json
+    python load_test.py --spawn asgi --rps 200 --latency lognormal:1.5,0.5
+
+延迟从计划发送时间开始计算，客户端来不及发出的请求也会计入延迟（避免协同遗漏）
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import mock_zhipu_server
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+VEHICLES = ['节能型小型车', '高性能跑车', '全尺寸SUV', '豪华轿车', '大卡车']
+BUMPS = ['橡胶减速带', '金属减速带', '泡沫减速带', '水压减速带']
+LOCATIONS = ['学校门口', '森林', '历史遗迹附近', '普通跑道', '山地滑坡']
+CHAT_ROLES = ['engineer', 'ethicist', 'safety', 'traffic', 'physicist', 'designer']
+CHAT_MESSAGES = ['这个速度安全吗？', '为什么在学校门口测试有问题？', '减速带的高度会带来什么影响？']
+
+ENDPOINTS = {
+    'analyze': '/api/analyze',
+    'chat': '/api/chat',
+    'debate': '/api/debate',
+    'physics': '/api/physics/calculate',
+}
+
+
+def random_choice(rng):
+    """随机的实验参数"""
+    return {
+        'vehicle': rng.choice(VEHICLES),
+        'bump': rng.choice(BUMPS),
+        'location': rng.choice(LOCATIONS),
+        'speed': rng.choice([20, 30, 40, 50, 60, 70, 80]),
+        'survival_rate': rng.randint(10, 95)
+    }
+
+
+def build_payload(endpoint, rng, stream=False):
+    """构建请求体"""
+    session_id = f"loadtest_{rng.getrandbits(48):012x}"
+    choice = random_choice(rng)
+    if endpoint == 'analyze':
+        return dict(choice, session_id=session_id)
+    if endpoint == 'chat':
+        return {
+            'session_id': session_id,
+            'role': rng.choice(CHAT_ROLES),
+            'message': rng.choice(CHAT_MESSAGES),
+            'history': []
+        }
+    if endpoint == 'debate':
+        return {'session_id': session_id, 'choice': choice}
+    # physics：需要物理学家解释时才会调用上游
+    return {
+        'session_id': session_id,
+        'vehicle': choice['vehicle'],
+        'bump': choice['bump'],
+        'location': choice['location'],
+        'speed': choice['speed'],
+        'stream': stream,
+        'explain': True
+    }
+
+
+def parse_mix(mix):
+    """解析接口权重，如 "analyze=1,chat=2,debate=1,physics=1" """
+    weights = {}
+    for item in mix.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"未知的接口: {name}（可选: {', '.join(ENDPOINTS)}）")
+        weights[name] = float(weight) if weight else 1.0
+    if not weights:
+        raise ValueError("至少需要一个接口")
+    return weights
+
+
+def percentile(sorted_values, p):
+    """最近秩百分位数"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, elapsed):
+    """汇总一组请求结果"""
+    latencies = sorted(s['latency_ms'] for s in samples)
+    ok = sum(1 for s in samples if s['ok'])
+    status_codes = {}
+    for s in samples:
+        status_codes[str(s['status'])] = status_codes.get(str(s['status']), 0) + 1
+    return {
+        'requests': len(samples),
+        'ok': ok,
+        'failed': len(samples) - ok,
+        'throughput_rps': round(ok / elapsed, 2) if elapsed > 0 else 0,
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'mean': round(sum(latencies) / len(latencies), 1) if latencies else None,
+            'max': latencies[-1] if latencies else None
+        },
+        'status_codes': status_codes
+    }
+
+
+class LoadTest:
+    """开环压测：调度线程按计划时间提交请求，线程池负责发送"""
+
+    def __init__(self, base_url, rps, duration, weights, concurrency=256, timeout=120.0,
+                 stream=False, seed=None):
+        self.base_url = base_url.rstrip('/')
+        self.rps = rps
+        self.duration = duration
+        self.weights = weights
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.stream = stream
+        self.rng = random.Random(seed)
+        self._local = threading.local()
+        self._samples = []
+        self._samples_lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _send(self, endpoint, payload, scheduled_at):
+        started_at = time.monotonic()
+        status = None
+        ok = False
+        error = None
+        try:
+            response = self._session().post(
+                self.base_url + ENDPOINTS[endpoint], json=payload, timeout=self.timeout, stream=self.stream
+            )
+            status = response.status_code
+            if response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                # SSE：读完整个流，出现 error 事件视为失败
+                body = response.content.decode('utf-8', errors='replace')
+                ok = status == 200 and '"type": "error"' not in body
+            else:
+                ok = status == 200 and response.json().get('success', False)
+        except Exception as e:
+            error = type(e).__name__
+            status = error
+        finished_at = time.monotonic()
+        sample = {
+            'endpoint': endpoint,
+            'status': status,
+            'ok': ok,
+            'error': error,
+            'latency_ms': round((finished_at - scheduled_at) * 1000, 1),
+            'lag_ms': round((started_at - scheduled_at) * 1000, 1)
+        }
+        with self._samples_lock:
+            self._samples.append(sample)
+
+    def run(self):
+        names = list(self.weights)
+        weights = [self.weights[name] for name in names]
+        total = max(1, int(self.rps * self.duration))
+        interval = 1.0 / self.rps
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='loadtest')
+        start = time.monotonic()
+        for i in range(total):
+            scheduled_at = start + i * interval
+            delay = scheduled_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint = self.rng.choices(names, weights)[0]
+            payload = build_payload(endpoint, self.rng, self.stream)
+            executor.submit(self._send, endpoint, payload, scheduled_at)
+        executor.shutdown(wait=True)
+        elapsed = time.monotonic() - start
+
+        samples = list(self._samples)
+        lags = sorted(s['lag_ms'] for s in samples)
+        return {
+            'elapsed_s': round(elapsed, 2),
+            'offered_rps': self.rps,
+            'overall': summarize(samples, elapsed),
+            'endpoints': {
+                name: summarize([s for s in samples if s['endpoint'] == name], elapsed)
+                for name in names
+            },
+            'client': {
+                'schedule_lag_ms_p99': percentile(lags, 99),
+                'errors': sorted({s['error'] for s in samples if s['error']})
+            }
+        }
+
+
+# ========== 自动启动后端 ==========
+
+def wait_for_health(base_url, timeout=60.0):
+    """等待后端就绪"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/api/health", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError(f"后端在 {timeout:g} 秒内未就绪: {base_url}")
+
+
+def spawn_backend(mode, port, upstream_url, workdir):
+    """在临时目录中启动后端（flask：app.py 内置服务器；asgi：hypercorn + asgi_app）"""
+    env = dict(os.environ, ZHIPU_API_URL=upstream_url, PYTHONPATH=APP_DIR, PYTHONUNBUFFERED='1')
+    if mode == 'asgi':
+        command = [sys.executable, '-m', 'hypercorn', 'asgi_app:application', '--bind', f'127.0.0.1:{port}']
+    else:
+        command = [sys.executable, '-c',
+                   f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    return subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def fetch_upstream_stats(url):
+    if not url:
+        return None
+    try:
+        return requests.get(url, timeout=5).json()
+    except Exception as e:
+        print(f"警告：获取上游调用统计失败: {e}", file=sys.stderr)
+        return None
+
+
+def upstream_delta(before, after, requests_sent):
+    """压测期间的上游调用次数"""
+    if before is None or after is None:
+        return None
+    delta = {key: after[key] - before.get(key, 0) for key in ('total', 'stream', 'non_stream', 'errors')}
+    delta['by_status'] = {
+        status: count - before.get('by_status', {}).get(status, 0)
+        for status, count in after.get('by_status', {}).items()
+    }
+    delta['max_in_flight'] = after.get('max_in_flight')
+    delta['calls_per_request'] = round(delta['total'] / requests_sent, 3) if requests_sent else None
+    delta['config'] = after.get('config')
+    return delta
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='端到端压测')
+    parser.add_argument('--base-url', type=str, default='http://localhost:5001', help='后端地址（--spawn 时忽略）')
+    parser.add_argument('--rps', type=float, default=10, help='目标每秒请求数')
+    parser.add_argument('--duration', type=float, default=30, help='压测时长（秒）')
+    parser.add_argument('--mix', type=str, default='analyze=1,chat=1,debate=1,physics=1', help='接口权重')
+    parser.add_argument('--concurrency', type=int, default=256, help='客户端最大并发连接数')
+    parser.add_argument('--timeout', type=float, default=120, help='单个请求超时（秒）')
+    parser.add_argument('--stream', action='store_true', help='/api/physics/calculate 使用流式输出')
+    parser.add_argument('--upstream-stats', type=str, default='', help='模拟智谱AI服务的 /stats 地址')
+    parser.add_argument('--spawn', choices=['flask', 'asgi'], default=None, help='自动启动模拟服务和后端')
+    parser.add_argument('--port', type=int, default=5201, help='--spawn 时后端使用的端口')
+    parser.add_argument('--keep-workdir', action='store_true', help='保留 --spawn 的临时目录（含后端日志）')
+    parser.add_argument('--output', type=str, default='', help='结果写入文件（默认输出到标准输出）')
+    # 模拟服务参数（其中 --seed 同时用于生成请求参数）
+    mock_zhipu_server.add_server_arguments(parser)
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    base_url = args.base_url
+    upstream_stats_url = args.upstream_stats
+    mock = backend = workdir = None
+    try:
+        if args.spawn:
+            mock = mock_zhipu_server.server_from_args(args).start()
+            upstream_stats_url = mock.stats_url
+            workdir = tempfile.mkdtemp(prefix='loadtest_')
+            base_url = f"http://127.0.0.1:{args.port}"
+            backend = spawn_backend(args.spawn, args.port, mock.url, workdir)
+            wait_for_health(base_url)
+
+        before = fetch_upstream_stats(upstream_stats_url)
+        test = LoadTest(base_url, args.rps, args.duration, weights, args.concurrency,
+                        args.timeout, args.stream, args.seed)
+        result = test.run()
+        after = fetch_upstream_stats(upstream_stats_url)
+    finally:
+        if backend is not None:
+            backend.terminate()
+            try:
+                backend.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                backend.kill()
+        if mock is not None:
+            mock.stop()
+        if workdir and not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'base_url': base_url,
+            'server': args.spawn or 'external',
+            'rps': args.rps,
+            'duration': args.duration,
+            'mix': weights,
+            'concurrency': args.concurrency,
+            'stream': args.stream,
+            'seed': args.seed
+        },
+        **result,
+        'upstream': upstream_delta(before, after, result['overall']['requests'])
+    }
+    if args.keep_workdir and workdir:
+        report['config']['workdir'] = workdir
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f"结果已写入: {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
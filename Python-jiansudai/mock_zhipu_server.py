@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+本地模拟智谱AI服务
+模拟 chat/completions 接口（普通与流式响应），延迟分布、错误率和流式分块速度均可配置，
+用于离线压测（见 load_test.py）。将后端的 ZHIPU_API_URL 指向本服务即可：
+
+    python mock_zhipu_server.py --port 5101 --latency lognormal:0.8,0.4 --error-rate 0.02
+    ZHIPU_API_URL=http://127.0.0.1:5101/api/paas/v4/chat/completions python app.py
+
+GET /stats 返回上游调用计数，POST /stats/reset 清零
+"""
+import json
+import math
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Dict, List, Optional
+
+# 默认回复：带有辩论轮次标记和 JSON 代码块，各接口的结果解析都能走通
+DEFAULT_REPLY = """【第1轮】从专业角度看，这个选择的风险主要来自速度与地点的组合。
+【第2轮】即使车辆性能较好，减速带带来的冲击仍然可能超出安全范围。
+【第3轮】建议降低速度，并选择远离人群的测试环境。
+```json
+{"maxAcceleration": 12.5, "maxDisplacement": 0.3, "survivalRate": 77, "result": "可能通过"}
+```"""
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # 压测时瞬时连接数较多，加大监听队列
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class LatencyDistribution:
+    """
+    延迟分布（秒），格式为 "类型:参数"：
+    - fixed:0.5
+    - uniform:0.2,1.0
+    - normal:0.8,0.2（均值, 标准差）
+    - lognormal:0.8,0.4（中位数, 对数标准差）
+    - exponential:0.5（均值）
+    """
+
+    def __init__(self, spec: str = 'fixed:0', rng: Optional[random.Random] = None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, _, params = spec.partition(':')
+        self.kind = kind.strip().lower()
+        self.params = [float(p) for p in params.split(',') if p.strip()]
+        if self.kind not in ('fixed', 'uniform', 'normal', 'lognormal', 'exponential'):
+            raise ValueError(f"未知的延迟分布: {spec}")
+
+    def sample(self) -> float:
+        p = self.params
+        if self.kind == 'fixed':
+            value = p[0] if p else 0.0
+        elif self.kind == 'uniform':
+            value = self.rng.uniform(p[0], p[1])
+        elif self.kind == 'normal':
+            value = self.rng.gauss(p[0], p[1])
+        elif self.kind == 'lognormal':
+            value = self.rng.lognormvariate(math.log(p[0]), p[1])
+        else:
+            value = self.rng.expovariate(1 / p[0]) if p[0] > 0 else 0.0
+        return max(0.0, value)
+
+
+class MockZhipuServer:
+    """模拟服务（在后台线程中运行，也可以通过命令行独立启动）"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: str = 'fixed:0',
+                 error_rate: float = 0.0, error_statuses: List[int] = (503,),
+                 retry_after: Optional[float] = None, chunk_chars: int = 8,
+                 chunk_interval: float = 0.02, reply: str = DEFAULT_REPLY, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+        self.latency = LatencyDistribution(latency, self.rng)
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        self.retry_after = retry_after
+        self.chunk_chars = max(1, chunk_chars)
+        self.chunk_interval = chunk_interval
+        self.reply = reply
+        self._lock = threading.Lock()
+        self._rng_lock = threading.Lock()
+        self.reset_stats()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if self.path.rstrip('/') == '/stats':
+                    self._send_json(200, server.stats())
+                else:
+                    self._send_json(404, {'error': {'code': '404', 'message': 'not found'}})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                if self.path.rstrip('/') == '/stats/reset':
+                    server.reset_stats()
+                    self._send_json(200, {'success': True})
+                    return
+                try:
+                    payload = json.loads(body or b'{}')
+                except ValueError:
+                    self._send_json(400, {'error': {'code': '1214', 'message': 'invalid json'}})
+                    return
+                server.handle_completion(self, payload)
+
+            def _send_json(self, status, data, headers=None):
+                raw = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(raw)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = _HTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """chat/completions 接口地址（用作 ZHIPU_API_URL）"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/paas/v4/chat/completions"
+
+    @property
+    def stats_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/stats"
+
+    def start(self) -> 'MockZhipuServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-zhipu', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # ========== 请求处理 ==========
+
+    def handle_completion(self, handler, payload: Dict[str, Any]):
+        model = payload.get('model', 'glm-4-flash')
+        stream = bool(payload.get('stream'))
+        with self._rng_lock:
+            delay = self.latency.sample()
+            fail = self.rng.random() < self.error_rate
+            status = self.rng.choice(self.error_statuses) if fail else 200
+
+        self._record_start(model, stream)
+        try:
+            time.sleep(delay)
+            if fail:
+                headers = {}
+                if status == 429 and self.retry_after is not None:
+                    headers['Retry-After'] = f"{self.retry_after:g}"
+                handler._send_json(status, {'error': {'code': str(status), 'message': 'mock upstream error'}}, headers)
+            elif stream:
+                self._send_stream(handler, model)
+            else:
+                handler._send_json(200, self._completion(model, payload))
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开（如超时）
+            status = 'disconnected'
+        finally:
+            self._record_end(status)
+
+    def _completion(self, model, payload):
+        prompt_chars = sum(len(str(m.get('content', ''))) for m in payload.get('messages', []))
+        return {
+            'id': f"mock-{time.time_ns()}",
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': self.reply}
+            }],
+            'usage': {
+                'prompt_tokens': prompt_chars,
+                'completion_tokens': len(self.reply),
+                'total_tokens': prompt_chars + len(self.reply)
+            }
+        }
+
+    def _send_stream(self, handler, model):
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Cache-Control', 'no-cache')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        handler.close_connection = True
+        for i in range(0, len(self.reply), self.chunk_chars):
+            chunk = {
+                'id': 'mock-stream',
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': self.reply[i:i + self.chunk_chars]}}]
+            }
+            handler.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            handler.wfile.flush()
+            if self.chunk_interval:
+                time.sleep(self.chunk_interval)
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+
+    # ========== 统计 ==========
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {
+                'total': 0, 'stream': 0, 'non_stream': 0, 'errors': 0,
+                'in_flight': 0, 'max_in_flight': 0, 'by_model': {}, 'by_status': {}
+            }
+
+    def _record_start(self, model, stream):
+        with self._lock:
+            s = self._stats
+            s['total'] += 1
+            s['stream' if stream else 'non_stream'] += 1
+            s['by_model'][model] = s['by_model'].get(model, 0) + 1
+            s['in_flight'] += 1
+            s['max_in_flight'] = max(s['max_in_flight'], s['in_flight'])
+
+    def _record_end(self, status):
+        with self._lock:
+            s = self._stats
+            s['in_flight'] -= 1
+            if status != 200:
+                s['errors'] += 1
+            key = str(status)
+            s['by_status'][key] = s['by_status'].get(key, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """上游调用计数"""
+        with self._lock:
+            stats = json.loads(json.dumps(self._stats))
+        stats['config'] = {
+            'latency': self.latency.spec,
+            'error_rate': self.error_rate,
+            'error_statuses': self.error_statuses,
+            'chunk_chars': self.chunk_chars,
+            'chunk_interval': self.chunk_interval
+        }
+        return stats
+
+
+def add_server_arguments(parser):
+    """模拟服务的命令行参数（load_test.py 启动内置模拟服务时复用）"""
+    parser.add_argument('--latency', type=str, default='lognormal:0.8,0.4',
+                        help='延迟分布，如 fixed:0.5 / uniform:0.2,1.0 / normal:0.8,0.2 / lognormal:0.8,0.4 / exponential:0.5')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回错误的比例（0~1）')
+    parser.add_argument('--error-statuses', type=str, default='503', help='错误状态码（逗号分隔，随机选取）')
+    parser.add_argument('--retry-after', type=float, default=None, help='429 响应的 Retry-After 秒数')
+    parser.add_argument('--chunk-chars', type=int, default=8, help='流式响应每个分块的字符数')
+    parser.add_argument('--chunk-interval', type=float, default=0.02, help='流式响应分块间隔（秒）')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子（用于复现）')
+
+
+def server_from_args(args, host='127.0.0.1', port=0) -> MockZhipuServer:
+    return MockZhipuServer(
+        host=host,
+        port=port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_statuses=[int(s) for s in args.error_statuses.split(',') if s.strip()],
+        retry_after=args.retry_after,
+        chunk_chars=args.chunk_chars,
+        chunk_interval=args.chunk_interval,
+        seed=args.seed
+    )
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='本地模拟智谱AI服务')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=5101, help='监听端口')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    mock = server_from_args(args, args.host, args.port)
+    print(f"模拟智谱AI服务: {mock.url}")
+    print(f"调用统计: {mock.stats_url}")
+    try:
+        mock.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.httpd.server_close()
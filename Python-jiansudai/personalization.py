@@ -2,7 +2,7 @@
 个性化模块
 实现用户画像、学习偏好分析和个性化内容调整
 """
-import sqlite3
+import db
 import json
 from typing import Dict, List, Any, Optional
 from datetime import datetime
@@ -25,20 +25,18 @@ class UserProfileManager:
         Returns:
             用户画像数据
         """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        # 获取用户历史选择
-        c.execute('''
-            SELECT vehicle, bump, location, speed, survival_rate
-            FROM user_choices
-            WHERE session_id = ?
-            ORDER BY created_at DESC
-            LIMIT 50
-        ''', (session_id,))
-        
-        choices = c.fetchall()
-        conn.close()
+        with db.connection(self.db_path) as conn:
+            c = conn.cursor()
+            # 获取用户历史选择
+            c.execute('''
+                SELECT vehicle, bump, location, speed, survival_rate
+                FROM user_choices
+                WHERE session_id = ?
+                ORDER BY created_at DESC
+                LIMIT 50
+            ''', (session_id,))
+            
+            choices = c.fetchall()
         
         if not choices:
             return self._get_default_profile()
@@ -122,41 +120,34 @@ class UserProfileManager:
     
     def save_user_profile(self, session_id: str, profile: Dict[str, Any]):
         """保存用户画像到数据库"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            INSERT OR REPLACE INTO user_profiles 
-            (session_id, knowledge_level, interest_areas, learning_preferences, 
-             risk_tolerance, ethical_orientation, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            session_id,
-            profile.get('knowledge_level'),
-            json.dumps(profile.get('interest_areas', []), ensure_ascii=False),
-            json.dumps(profile.get('learning_preferences', {}), ensure_ascii=False),
-            profile.get('risk_tolerance'),
-            profile.get('ethical_orientation'),
-            datetime.now().isoformat()
-        ))
-        
-        conn.commit()
-        conn.close()
+        with db.transaction(self.db_path) as c:
+            c.execute('''
+                INSERT OR REPLACE INTO user_profiles 
+                (session_id, knowledge_level, interest_areas, learning_preferences, 
+                 risk_tolerance, ethical_orientation, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                session_id,
+                profile.get('knowledge_level'),
+                json.dumps(profile.get('interest_areas', []), ensure_ascii=False),
+                json.dumps(profile.get('learning_preferences', {}), ensure_ascii=False),
+                profile.get('risk_tolerance'),
+                profile.get('ethical_orientation'),
+                datetime.now().isoformat()
+            ))
     
     def get_user_profile(self, session_id: str) -> Optional[Dict[str, Any]]:
         """获取用户画像"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT knowledge_level, interest_areas, learning_preferences,
-                   risk_tolerance, ethical_orientation
-            FROM user_profiles
-            WHERE session_id = ?
-        ''', (session_id,))
-        
-        row = c.fetchone()
-        conn.close()
+        with db.connection(self.db_path) as conn:
+            c = conn.cursor()
+            c.execute('''
+                SELECT knowledge_level, interest_areas, learning_preferences,
+                       risk_tolerance, ethical_orientation
+                FROM user_profiles
+                WHERE session_id = ?
+            ''', (session_id,))
+            
+            row = c.fetchone()
         
         if not row:
             return None
@@ -0,0 +1,605 @@
+"""
+物理计算模块
+弹簧-质量-阻尼系统模型的服务器端实现，与 index.html 中的
+calculatePhysicsResponse / calculateSurvivalRate 逐行对应（参数表也保持一致），
+保证前后端对同一组参数给出完全相同的结果
+"""
+import math
+from typing import Dict, Any, List, Optional, Sequence
+
+# 参数扫描（批量计算）依赖 NumPy，单点计算不依赖
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# ========== 数据定义（与 index.html 保持一致） ==========
+
+VEHICLE_PARAMS = {
+    '节能型小型车': {
+        'mass': {'min': 1000, 'max': 1500, 'avg': 1250},
+        'springStiffness': {'min': 5000, 'max': 10000, 'avg': 7500},
+        'dampingCoeff': {'min': 50, 'max': 150, 'avg': 100}
+    },
+    '高性能跑车': {
+        'mass': {'min': 1200, 'max': 1800, 'avg': 1500},
+        'springStiffness': {'min': 10000, 'max': 20000, 'avg': 15000},
+        'dampingCoeff': {'min': 100, 'max': 200, 'avg': 150}
+    },
+    '全尺寸SUV': {
+        'mass': {'min': 2000, 'max': 3000, 'avg': 2500},
+        'springStiffness': {'min': 15000, 'max': 30000, 'avg': 22500},
+        'dampingCoeff': {'min': 150, 'max': 300, 'avg': 225}
+    },
+    '豪华轿车': {
+        'mass': {'min': 1500, 'max': 2000, 'avg': 1750},
+        'springStiffness': {'min': 8000, 'max': 15000, 'avg': 11500},
+        'dampingCoeff': {'min': 100, 'max': 200, 'avg': 150}
+    },
+    '大卡车': {
+        'mass': {'min': 15000, 'max': 40000, 'avg': 27500},
+        'springStiffness': {'min': 10000, 'max': 30000, 'avg': 20000},
+        'dampingCoeff': {'min': 100, 'max': 200, 'avg': 150}
+    }
+}
+
+SPEED_BUMP_PARAMS = {
+    '橡胶减速带': {
+        'forceAmplitude': {'min': 1000, 'max': 5000, 'avg': 3000},
+        'frequency': {'min': 1, 'max': 10, 'avg': 5.5},
+        'length': {'min': 2, 'max': 5, 'avg': 3.5},
+        'height': {'min': 0.05, 'max': 0.20, 'avg': 0.125}
+    },
+    '金属减速带': {
+        'forceAmplitude': {'min': 5000, 'max': 15000, 'avg': 10000},
+        'frequency': {'min': 1, 'max': 10, 'avg': 5.5},
+        'length': {'min': 3, 'max': 6, 'avg': 4.5},
+        'height': {'min': 0.10, 'max': 0.30, 'avg': 0.20}
+    },
+    '泡沫减速带': {
+        'forceAmplitude': {'min': 500, 'max': 2000, 'avg': 1250},
+        'frequency': {'min': 0.5, 'max': 5, 'avg': 2.75},
+        'length': {'min': 2, 'max': 4, 'avg': 3},
+        'height': {'min': 0.02, 'max': 0.10, 'avg': 0.06}
+    },
+    '水压减速带': {
+        'forceAmplitude': {'min': 100, 'max': 1000, 'avg': 550},
+        'frequency': {'min': 0.1, 'max': 1, 'avg': 0.55},
+        'length': {'min': 2, 'max': 5, 'avg': 3.5},
+        'height': {'min': 0.05, 'max': 0.15, 'avg': 0.10}
+    }
+}
+
+LOCATION_FACTORS = {
+    '学校门口': {'safetyFactor': 0.9, 'legalPenalty': 1.2},
+    '森林': {'safetyFactor': 0.85, 'legalPenalty': 1.1},
+    '历史遗迹附近': {'safetyFactor': 0.8, 'legalPenalty': 1.5},
+    '普通跑道': {'safetyFactor': 1.0, 'legalPenalty': 0.8},
+    '山地滑坡': {'safetyFactor': 0.3, 'legalPenalty': 2.0}  # 高风险，大幅降低幸存率
+}
+
+G = 9.81
+# 安全加速度阈值（2g）
+MAX_SAFE_ACCELERATION = 2 * G
+MAX_SAFE_DISPLACEMENT = 0.3
+MAX_SAFE_VELOCITY_CHANGE = 10
+
+# 天气对摩擦系数的影响
+WEATHER_FRICTION_FACTORS = {
+    '晴': 1.0,
+    '多云': 0.95,
+    '阴': 0.85,
+    '雨': 0.6,
+    '雪': 0.3
+}
+
+# 环保评分
+ECO_SCORES = {
+    'vehicle': {
+        '节能型小型车': 10,
+        '高性能跑车': 7,
+        '全尺寸SUV': 4,
+        '豪华轿车': 3,
+        '大卡车': 2
+    },
+    'bump': {
+        '泡沫减速带': 8,
+        '橡胶减速带': 6,
+        '金属减速带': 4,
+        '水压减速带': 3
+    },
+    'location': {
+        '普通跑道': 9,
+        '森林': 7,
+        '学校门口': 6,
+        '历史遗迹附近': 5,
+        '山地滑坡': 3
+    }
+}
+
+# 推荐目标类型及其预览速度（对应 calculateRecommendation，None 表示使用 test_speed）
+RECOMMENDATION_TARGETS = {
+    'max-speed': 60,
+    'safest': 30,
+    'eco-friendly': None,
+    'extreme': 50,
+    'balanced': 40
+}
+
+
+def js_round(value: float) -> int:
+    """与 JavaScript Math.round 一致的取整（.5 向正无穷方向舍入）"""
+    return math.floor(value + 0.5)
+
+
+# ========== 物理计算函数 ==========
+
+def calculate_physics_response(v0: float, vehicle: Dict, speed_bump: Dict) -> Dict[str, float]:
+    """
+    计算车辆通过减速带时的物理响应（对应 calculatePhysicsResponse）
+
+    Args:
+        v0: 初始速度（m/s）
+        vehicle: 车辆参数（VEHICLE_PARAMS 中的一项）
+        speed_bump: 减速带参数（SPEED_BUMP_PARAMS 中的一项）
+
+    Returns:
+        物理响应数据
+    """
+    m = vehicle['mass']['avg']
+    k = vehicle['springStiffness']['avg']
+    c = vehicle['dampingCoeff']['avg']
+    F0 = speed_bump['forceAmplitude']['avg']
+    L = speed_bump['length']['avg']
+    H = speed_bump['height']['avg']
+
+    # 速度为0时 JavaScript 得到 Infinity，这里保持相同语义
+    t_pass = L / v0 if v0 != 0 else math.inf
+    omega_n = math.sqrt(k / m)
+    zeta = c / (2 * math.sqrt(k * m))
+
+    impact_velocity = v0
+    decay = math.exp(-zeta * omega_n * t_pass)
+    max_displacement = (F0 / k) * (1 + decay)
+    max_acceleration = (F0 / m) + (omega_n * omega_n * max_displacement)
+    velocity_change = abs(impact_velocity - v0 * decay)
+    bounce_height = max(0, (max_displacement - H) * 0.5)
+
+    return {
+        'maxDisplacement': max_displacement,
+        'maxAcceleration': max_acceleration,
+        'velocityChange': velocity_change,
+        'bounceHeight': bounce_height,
+        't_pass': t_pass,
+        'omega_n': omega_n,
+        'zeta': zeta
+    }
+
+
+def calculate_speed_risk(speed: float) -> float:
+    """速度风险（对应 calculateSurvivalRate 中的分段惩罚）"""
+    speed_risk = 0
+    if 30 <= speed < 50:
+        speed_risk = 15 + (speed - 30) * 1.5  # 30-50: 15-45
+    elif 50 <= speed < 70:
+        speed_risk = 45 + (speed - 50) * 4  # 50-70: 45-125，但会被限制到100
+    elif speed >= 70:
+        speed_risk = 100  # 70以上直接100%风险
+    return min(100, speed_risk)
+
+
+def calculate_survival_rate(speed: float, vehicle_type: str, speed_bump_type: str,
+                            location: str = '学校门口') -> Dict[str, Any]:
+    """
+    计算幸存率（对应 calculateSurvivalRate）
+
+    Args:
+        speed: 速度（km/h）
+        vehicle_type: 车辆类型
+        speed_bump_type: 减速带类型
+        location: 地点
+
+    Returns:
+        幸存率、结果等级和物理响应；参数无效时返回 {'error': '参数错误'}
+    """
+    v0 = speed / 3.6
+    vehicle = VEHICLE_PARAMS.get(vehicle_type)
+    speed_bump = SPEED_BUMP_PARAMS.get(speed_bump_type)
+    location_factor = LOCATION_FACTORS.get(location) or LOCATION_FACTORS['学校门口']
+
+    if not vehicle or not speed_bump:
+        return {'error': '参数错误'}
+
+    physics = calculate_physics_response(v0, vehicle, speed_bump)
+
+    risks = {
+        'accelerationRisk': min(100, (physics['maxAcceleration'] / MAX_SAFE_ACCELERATION) * 100),
+        'displacementRisk': min(100, (physics['maxDisplacement'] / MAX_SAFE_DISPLACEMENT) * 100),
+        'velocityChangeRisk': min(100, (physics['velocityChange'] / MAX_SAFE_VELOCITY_CHANGE) * 100),
+        'bounceRisk': 80 if physics['bounceHeight'] > 0.1 else (50 if physics['bounceHeight'] > 0.05 else 20)
+    }
+
+    speed_risk = calculate_speed_risk(speed)
+
+    # 速度风险权重随速度提升
+    speed_weight = 0.20
+    if speed >= 70:
+        speed_weight = 0.35
+    elif speed >= 50:
+        speed_weight = 0.28
+
+    total_risk = (
+        risks['accelerationRisk'] * 0.25 +
+        risks['displacementRisk'] * 0.20 +
+        risks['velocityChangeRisk'] * 0.20 +
+        risks['bounceRisk'] * 0.15 +
+        speed_risk * speed_weight
+    ) * location_factor['safetyFactor']
+
+    # 对于极限速度（70以上），额外增加风险惩罚
+    final_risk = total_risk
+    if speed >= 70:
+        extra_risk = (speed - 70) * 2.5
+        final_risk = min(100, total_risk + extra_risk)
+
+    survival_rate = max(0, min(100, 100 - final_risk))
+    result, color, class_name = classify_survival_rate(survival_rate)
+
+    return {
+        'survivalRate': js_round(survival_rate),
+        'result': result,
+        'color': color,
+        'className': class_name,
+        'physics': physics,
+        'risks': risks,
+        'speedRisk': speed_risk
+    }
+
+
+def classify_survival_rate(survival_rate: float):
+    """根据幸存率返回 (结果, 颜色, 样式类名)"""
+    if survival_rate >= 80:
+        return '安全通过', '#28a745', 'survival-safe'
+    if survival_rate >= 60:
+        return '可能通过', '#ffc107', 'survival-warning'
+    if survival_rate >= 40:
+        return '危险', '#fd7e14', 'survival-warning'
+    return '极危险', '#dc3545', 'survival-danger'
+
+
+def _finite_or_none(value: float) -> Optional[float]:
+    """非有限值（如速度为0时的 t_pass）在 JSON 中输出为 null，与 JSON.stringify 一致"""
+    return value if math.isfinite(value) else None
+
+
+def simulate(vehicle_type: str, speed_bump_type: str, location: str, speed: float) -> Optional[Dict[str, Any]]:
+    """
+    计算 /api/physics/calculate 返回的物理结果
+
+    Returns:
+        物理结果字典；车辆或减速带类型无效时返回 None
+    """
+    survival = calculate_survival_rate(speed, vehicle_type, speed_bump_type, location)
+    if 'error' in survival:
+        return None
+
+    physics = survival['physics']
+    steps = (
+        f"ω_n=√(k/m)={physics['omega_n']:.2f} rad/s，ζ=c/(2√(km))={physics['zeta']:.3f}；"
+        f"x_max=(F₀/k)×[1+exp(-ζω_n t_pass)]={physics['maxDisplacement']:.4f} m，"
+        f"a_max=F₀/m+ω_n²×x_max={physics['maxAcceleration']:.2f} m/s²，"
+        f"综合加速度、位移、速度变化、弹跳和速度风险得到幸存率{survival['survivalRate']}%。"
+    )
+
+    return {
+        'maxAcceleration': _finite_or_none(physics['maxAcceleration']),
+        'maxDisplacement': _finite_or_none(physics['maxDisplacement']),
+        'velocityChange': _finite_or_none(physics['velocityChange']),
+        'bounceHeight': _finite_or_none(physics['bounceHeight']),
+        't_pass': _finite_or_none(physics['t_pass']),
+        'omega_n': _finite_or_none(physics['omega_n']),
+        'zeta': _finite_or_none(physics['zeta']),
+        'survivalRate': survival['survivalRate'],
+        'result': survival['result'],
+        'calculation_steps': steps
+    }
+
+
+# ========== 参数扫描（NumPy 向量化） ==========
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError('参数扫描需要安装 NumPy（pip install numpy）')
+
+
+def survival_rate_grid(speeds: Sequence[float],
+                       vehicles: Optional[Sequence[str]] = None,
+                       bumps: Optional[Sequence[str]] = None,
+                       locations: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    一次性计算 车辆 × 减速带 × 地点 × 速度 网格上的幸存率（calculate_survival_rate 的向量化版本）
+
+    Args:
+        speeds: 速度列表（km/h）
+        vehicles: 车辆类型列表，默认全部
+        bumps: 减速带类型列表，默认全部
+        locations: 地点列表，默认全部
+
+    Returns:
+        形状为 (车辆, 减速带, 地点, 速度) 的 NumPy 数组：
+        survivalRate 以及 maxAcceleration、maxDisplacement、velocityChange、bounceHeight
+    """
+    _require_numpy()
+    vehicles = list(vehicles or VEHICLE_PARAMS)
+    bumps = list(bumps or SPEED_BUMP_PARAMS)
+    locations = list(locations or LOCATION_FACTORS)
+
+    # 各维度参数，整理成可广播的形状 (V, B, L, S)
+    m = np.array([VEHICLE_PARAMS[v]['mass']['avg'] for v in vehicles], dtype=float)[:, None, None, None]
+    k = np.array([VEHICLE_PARAMS[v]['springStiffness']['avg'] for v in vehicles], dtype=float)[:, None, None, None]
+    c = np.array([VEHICLE_PARAMS[v]['dampingCoeff']['avg'] for v in vehicles], dtype=float)[:, None, None, None]
+    F0 = np.array([SPEED_BUMP_PARAMS[b]['forceAmplitude']['avg'] for b in bumps], dtype=float)[None, :, None, None]
+    L = np.array([SPEED_BUMP_PARAMS[b]['length']['avg'] for b in bumps], dtype=float)[None, :, None, None]
+    H = np.array([SPEED_BUMP_PARAMS[b]['height']['avg'] for b in bumps], dtype=float)[None, :, None, None]
+    safety = np.array([(LOCATION_FACTORS.get(l) or LOCATION_FACTORS['学校门口'])['safetyFactor']
+                       for l in locations], dtype=float)[None, None, :, None]
+    speed = np.asarray(speeds, dtype=float)[None, None, None, :]
+
+    # 物理响应与地点无关，在 (V, B, 1, S) 上计算
+    v0 = speed / 3.6
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_pass = L / v0  # 速度为0时为 inf，与 JavaScript 一致
+    omega_n = np.sqrt(k / m)
+    zeta = c / (2 * np.sqrt(k * m))
+    decay = np.exp(-zeta * omega_n * t_pass)
+    max_displacement = (F0 / k) * (1 + decay)
+    max_acceleration = (F0 / m) + (omega_n * omega_n * max_displacement)
+    velocity_change = np.abs(v0 - v0 * decay)
+    bounce_height = np.maximum(0, (max_displacement - H) * 0.5)
+
+    acceleration_risk = np.minimum(100, (max_acceleration / MAX_SAFE_ACCELERATION) * 100)
+    displacement_risk = np.minimum(100, (max_displacement / MAX_SAFE_DISPLACEMENT) * 100)
+    velocity_change_risk = np.minimum(100, (velocity_change / MAX_SAFE_VELOCITY_CHANGE) * 100)
+    bounce_risk = np.where(bounce_height > 0.1, 80, np.where(bounce_height > 0.05, 50, 20))
+
+    speed_risk = np.minimum(100, np.select(
+        [(speed >= 30) & (speed < 50), (speed >= 50) & (speed < 70), speed >= 70],
+        [15 + (speed - 30) * 1.5, 45 + (speed - 50) * 4, 100],
+        default=0
+    ))
+    speed_weight = np.select([speed >= 70, speed >= 50], [0.35, 0.28], default=0.20)
+
+    total_risk = (
+        acceleration_risk * 0.25 +
+        displacement_risk * 0.20 +
+        velocity_change_risk * 0.20 +
+        bounce_risk * 0.15 +
+        speed_risk * speed_weight
+    ) * safety
+    final_risk = np.where(speed >= 70, np.minimum(100, total_risk + (speed - 70) * 2.5), total_risk)
+    survival_rate = np.floor(np.clip(100 - final_risk, 0, 100) + 0.5)
+
+    shape = (len(vehicles), len(bumps), len(locations), speed.shape[-1])
+    return {
+        'vehicles': vehicles,
+        'bumps': bumps,
+        'locations': locations,
+        'speeds': speed.ravel(),
+        'survivalRate': survival_rate.astype(int),
+        'maxAcceleration': np.broadcast_to(max_acceleration, shape),
+        'maxDisplacement': np.broadcast_to(max_displacement, shape),
+        'velocityChange': np.broadcast_to(velocity_change, shape),
+        'bounceHeight': np.broadcast_to(bounce_height, shape)
+    }
+
+
+def _max_safe_speed(survival: 'np.ndarray', speeds: 'np.ndarray', default) -> 'np.ndarray':
+    """沿速度轴从低到高连续满足幸存率>=40%的最高速度（对应前端的 for + break 循环）"""
+    reachable = np.cumprod(survival >= 40, axis=-1).astype(bool)
+    return np.where(reachable.any(axis=-1), np.max(np.where(reachable, speeds, -np.inf), axis=-1), default)
+
+
+def recommendation_scores(target_type: str, weathers: Sequence[str]) -> 'np.ndarray':
+    """
+    计算所有 车辆 × 减速带 × 地点 × 天气 组合的推荐评分（calculateRecommendationScore 的向量化版本）
+
+    Returns:
+        形状为 (车辆, 减速带, 地点, 天气) 的评分数组
+    """
+    _require_numpy()
+    vehicles = list(VEHICLE_PARAMS)
+    bumps = list(SPEED_BUMP_PARAMS)
+    locations = list(LOCATION_FACTORS)
+    shape = (len(vehicles), len(bumps), len(locations), len(weathers))
+
+    mass = np.array([VEHICLE_PARAMS[v]['mass']['avg'] for v in vehicles], dtype=float)[:, None, None, None]
+    eco_v = np.array([ECO_SCORES['vehicle'][v] for v in vehicles], dtype=float)[:, None, None, None]
+    eco_b = np.array([ECO_SCORES['bump'][b] for b in bumps], dtype=float)[None, :, None, None]
+    eco_l = np.array([ECO_SCORES['location'][l] for l in locations], dtype=float)[None, None, :, None]
+    safety = np.array([LOCATION_FACTORS[l]['safetyFactor'] for l in locations], dtype=float)[None, None, :, None]
+    weather_factor = np.array([WEATHER_FRICTION_FACTORS.get(w, 1.0) for w in weathers], dtype=float)[None, None, None, :]
+
+    def survival_at(speed):
+        return survival_rate_grid([speed])['survivalRate'][..., 0][..., None].astype(float)
+
+    if target_type == 'max-speed':
+        speeds = np.arange(50, 71, 5, dtype=float)
+        max_safe_speed = _max_safe_speed(survival_rate_grid(speeds)['survivalRate'], speeds, 0)[..., None]
+        score = max_safe_speed * 1.5 + mass / 100
+    elif target_type == 'safest':
+        score = (survival_at(30) * 10 + safety * 20) * weather_factor
+    elif target_type == 'eco-friendly':
+        sunny = np.array([10 if w == '晴' else 0 for w in weathers], dtype=float)[None, None, None, :]
+        score = eco_v * 10 + eco_b * 5 + eco_l * 5 + sunny
+    elif target_type == 'extreme':
+        survival = survival_at(50)
+        bonus = (
+            np.array([30 if l == '山地滑坡' else 0 for l in locations], dtype=float)[None, None, :, None] +
+            np.array([20 if v == '大卡车' else 0 for v in vehicles], dtype=float)[:, None, None, None] +
+            np.array([15 if b == '金属减速带' else 0 for b in bumps], dtype=float)[None, :, None, None]
+        )
+        score = np.where((survival < 20) | (survival > 50), 0, (50 - survival) * 2 + bonus)
+    elif target_type == 'balanced':
+        safety_score = survival_at(40) * 0.4
+        speed_score = np.minimum(100, (mass / 200) * 100) * 0.3
+        eco_score = (eco_v + eco_b + eco_l) / 3 * 0.3
+        score = safety_score + speed_score + eco_score
+    else:
+        raise ValueError(f'未知的推荐类型: {target_type}')
+
+    return np.floor(np.broadcast_to(score, shape) * 100 + 0.5) / 100
+
+
+def recommend(target_type: str, test_speed: float = 50, weathers: Optional[Sequence[str]] = None,
+              top_n: int = 3) -> List[Dict[str, Any]]:
+    """
+    计算推荐组合（calculateRecommendation 的向量化版本）
+
+    Returns:
+        评分最高的 top_n 个组合，格式与前端一致
+    """
+    _require_numpy()
+    weathers = list(weathers or WEATHER_FRICTION_FACTORS)
+    vehicles = list(VEHICLE_PARAMS)
+    bumps = list(SPEED_BUMP_PARAMS)
+    locations = list(LOCATION_FACTORS)
+
+    scores = recommendation_scores(target_type, weathers)
+    preview_speed = RECOMMENDATION_TARGETS.get(target_type) or test_speed
+    preview = survival_rate_grid([preview_speed])['survivalRate'][..., 0]
+    if target_type == 'max-speed':
+        speeds = np.arange(preview_speed, 71, 5, dtype=float)
+        max_speed = _max_safe_speed(survival_rate_grid(speeds)['survivalRate'], speeds, preview_speed)
+    else:
+        max_speed = np.full(preview.shape, preview_speed, dtype=float)
+
+    # 稳定排序：同分时保持 车辆→减速带→地点→天气 的遍历顺序（与 Array.prototype.sort 一致）
+    flat = scores.ravel()
+    order = np.argsort(-flat, kind='stable')
+    recommendations = []
+    for index in order[:top_n]:
+        if flat[index] <= 0:
+            break
+        vi, bi, li, wi = np.unravel_index(index, scores.shape)
+        recommendations.append({
+            'vehicle': vehicles[vi],
+            'bump': bumps[bi],
+            'location': locations[li],
+            'weather': weathers[wi],
+            'score': float(flat[index]),
+            'preview': {
+                'survivalRate': int(preview[vi, bi, li]),
+                'maxSpeed': float(max_speed[vi, bi, li])
+            }
+        })
+    return recommendations
+
+
+# ========== 图表数据（对应 index.html 中的 D3 图表） ==========
+
+def d3_range(start: float, stop: float, step: float) -> List[float]:
+    """与 d3.range 一致的等差序列（元素为 start + i * step，避免累加误差）"""
+    n = max(0, math.ceil((stop - start) / step))
+    return [start + i * step for i in range(n)]
+
+
+def iter_heatmap_rows(vehicle_type: str, speed_bump_type: str, location: str):
+    """风险热力图（对应 updateHeatmap）：10-70 km/h 每个速度的幸存率与风险概率"""
+    for speed in d3_range(10, 71, 1):
+        survival = calculate_survival_rate(speed, vehicle_type, speed_bump_type, location)
+        yield {
+            'speed': speed,
+            'survivalRate': survival['survivalRate'],
+            'risk': 100 - survival['survivalRate']
+        }
+
+
+def iter_impact_rows(vehicle_type: str, speed_bump_type: str):
+    """冲击力时间曲线（对应 updateImpactChart，与速度无关）"""
+    vehicle = VEHICLE_PARAMS[vehicle_type]
+    speed_bump = SPEED_BUMP_PARAMS[speed_bump_type]
+    F0 = speed_bump['forceAmplitude']['avg']
+    omega = speed_bump['frequency']['avg'] * 2 * math.pi
+    m = vehicle['mass']['avg']
+    k = vehicle['springStiffness']['avg']
+    c = vehicle['dampingCoeff']['avg']
+    omega_n = math.sqrt(k / m)
+    zeta = c / (2 * math.sqrt(k * m))
+
+    for t in d3_range(0, 3, 0.02):
+        if t < 0.3:
+            # 接近减速带
+            force = F0 * 0.3 * math.sin(omega * t * 2)
+        elif t < 0.8:
+            # 接触减速带
+            contact_time = t - 0.3
+            force = F0 * math.sin(omega * contact_time) * (1 + math.exp(-zeta * omega_n * contact_time))
+        elif t < 1.5:
+            # 离开减速带
+            leave_time = t - 0.8
+            force = F0 * math.sin(omega * leave_time) * math.exp(-zeta * omega_n * leave_time * 3)
+        else:
+            # 恢复阶段
+            force = 0
+        yield {'t': t, 'force': force}
+
+
+def iter_speed_time_rows(vehicle_type: str, speed_bump_type: str, speed: float):
+    """速度-时间与加速度曲线（对应 updateSpeedTimeChart）"""
+    v0 = speed / 3.6
+    L = SPEED_BUMP_PARAMS[speed_bump_type]['length']['avg']
+    t_pass = L / v0 if v0 != 0 else math.inf
+
+    previous = None
+    for t in d3_range(0, 4, 0.02):
+        if t < 0.5:
+            # 接近阶段，速度基本不变
+            velocity = v0
+        elif t < 0.5 + t_pass:
+            # 通过减速带，速度下降
+            contact_time = t - 0.5
+            velocity = v0 * (1 - (contact_time / t_pass) * 0.4)
+        elif t < 1.5 + t_pass:
+            # 离开减速带，逐渐恢复
+            recovery_time = t - (0.5 + t_pass)
+            velocity = v0 * (0.6 + (recovery_time / 1.0) * 0.3)
+        else:
+            # 稳定阶段
+            velocity = v0 * 0.9
+
+        acceleration = 0 if previous is None else (velocity - previous[1]) / (t - previous[0])
+        previous = (t, velocity)
+        yield {'t': t, 'speed': velocity, 'acceleration': acceleration}
+
+
+# 图表类型 -> (数据生成函数, 依赖的参数, 导出列)
+CHART_SERIES = {
+    'heatmap': (iter_heatmap_rows, ('vehicle', 'bump', 'location'), ('speed', 'survivalRate', 'risk')),
+    'impact': (iter_impact_rows, ('vehicle', 'bump'), ('t', 'force')),
+    'speed-time': (iter_speed_time_rows, ('vehicle', 'bump', 'speed'), ('t', 'speed', 'acceleration'))
+}
+
+
+def analyze_point(vehicle_type: str, speed_bump_type: str, location: str, speed: float) -> Dict[str, Any]:
+    """单个数据点的分析结果（用于批量分析和导出），参数无效时包含 error 字段"""
+    row = {
+        'vehicle': vehicle_type,
+        'bump': speed_bump_type,
+        'location': location,
+        'speed': speed
+    }
+    result = simulate(vehicle_type, speed_bump_type, location, speed)
+    if result is None:
+        row['error'] = '参数错误'
+        return row
+    for key in POINT_FIELDS[4:]:
+        row[key] = result[key]
+    return row
+
+
+POINT_FIELDS = (
+    'vehicle', 'bump', 'location', 'speed',
+    'survivalRate', 'result', 'maxAcceleration', 'maxDisplacement',
+    'velocityChange', 'bounceHeight', 't_pass', 'omega_n', 'zeta'
+)
@@ -0,0 +1,97 @@
+"""
+角色提示词注册表
+启动时为每个角色加载一次人格设定：优先使用 prompt_versions.db 中的活动版本，
+没有注册版本时使用 ren/<模块>.roles() 中的内置提示词。
+查询直接读取不可变映射（MappingProxyType）；通过 PromptVersionManager 切换活动版本
+（set_active_version / register_version）时，对应角色自动重新加载。
+其他进程对数据库的修改需要调用 reload() 或重启服务后生效
+"""
+import os
+import threading
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+import prompt_version_manager
+
+# 未使用数据库版本时记录的版本号
+BUILTIN_VERSION = 'builtin'
+
+
+class PromptRegistry:
+    """角色提示词注册表（role_key -> 提示词）"""
+
+    def __init__(self, roles: Dict[str, Dict[str, Any]],
+                 manager: Optional[prompt_version_manager.PromptVersionManager] = None):
+        """
+        Args:
+            roles: 角色映射，{role_key: {'module': 角色模块, 'name': 角色名称}}
+            manager: 版本管理器，为None时使用 prompt_version_manager.version_manager
+        """
+        self.roles = roles
+        self.manager = manager or prompt_version_manager.version_manager
+        self._lock = threading.Lock()
+        self._prompts = MappingProxyType({})
+        self._versions = MappingProxyType({})
+        prompt_version_manager.add_version_listener(self._on_version_changed)
+
+    def load(self) -> 'PromptRegistry':
+        """加载所有角色的提示词"""
+        with self._lock:
+            prompts = {}
+            versions = {}
+            for role_key in self.roles:
+                prompts[role_key], versions[role_key] = self._resolve(role_key)
+            self._publish(prompts, versions)
+        return self
+
+    def reload(self, role_name: Optional[str] = None):
+        """
+        重新加载提示词
+
+        Args:
+            role_name: 角色名称（如"伦理学家"），为None时重新加载所有角色
+        """
+        if role_name is None:
+            self.load()
+            return
+        with self._lock:
+            prompts = dict(self._prompts)
+            versions = dict(self._versions)
+            for role_key, role in self.roles.items():
+                if role['name'] == role_name:
+                    prompts[role_key], versions[role_key] = self._resolve(role_key)
+            self._publish(prompts, versions)
+
+    def get(self, role_key: str) -> Optional[str]:
+        """获取角色提示词，未知角色返回 None"""
+        return self._prompts.get(role_key)
+
+    def prompts(self) -> Mapping[str, str]:
+        """当前所有提示词（只读映射）"""
+        return self._prompts
+
+    def versions(self) -> Mapping[str, str]:
+        """当前各角色使用的版本号（只读映射）"""
+        return self._versions
+
+    def _resolve(self, role_key):
+        """读取角色的活动版本，失败或没有版本时使用内置提示词"""
+        role = self.roles[role_key]
+        try:
+            version_info = self.manager.get_version(role['name'])
+        except Exception as e:
+            print(f"警告：读取提示词版本失败（{role['name']}），使用内置提示词: {e}")
+            version_info = None
+        if version_info:
+            return version_info['prompt_content'], version_info['version']
+        return role['module'].roles(role['name']), BUILTIN_VERSION
+
+    def _publish(self, prompts, versions):
+        """整体替换映射，读取方总是看到完整的一版（调用方持有锁）"""
+        self._prompts = MappingProxyType(prompts)
+        self._versions = MappingProxyType(versions)
+
+    def _on_version_changed(self, role_name, version, db_path):
+        # 只响应同一个数据库的变更
+        if os.path.abspath(db_path) == os.path.abspath(self.manager.db_path):
+            self.reload(role_name)
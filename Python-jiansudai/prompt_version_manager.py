@@ -15,6 +15,20 @@ from typing import Dict, List, Optional
 import sqlite3
 
 
+# 版本变更监听器：活动版本变化后调用 callback(role_name, version, db_path)
+_version_listeners = []
+
+
+def add_version_listener(callback):
+    """
+    注册版本变更监听器（如 prompt_registry 的热加载）
+    
+    Args:
+        callback: 回调函数，参数为 (角色名称, 版本号, 数据库路径)
+    """
+    _version_listeners.append(callback)
+
+
 class PromptVersionManager:
     """提示词版本管理器"""
     
@@ -103,7 +117,9 @@ class PromptVersionManager:
                 ''', (role_name, version, prompt_content, change_log, created_by))
                 
                 conn.commit()
-                return True
+            # 新注册的版本即为活动版本
+            self._notify_listeners(role_name, version)
+            return True
         except Exception as e:
             print(f"注册版本失败: {e}")
             return False
@@ -232,11 +248,20 @@ class PromptVersionManager:
                     ''', (role_name, old_version, version, 'rollback', f'切换到版本 {version}'))
                 
                 conn.commit()
-                return True
+            self._notify_listeners(role_name, version)
+            return True
         except Exception as e:
             print(f"设置活动版本失败: {e}")
             return False
     
+    def _notify_listeners(self, role_name: str, version: str):
+        """通知版本变更监听器（监听器出错不影响版本操作本身）"""
+        for callback in list(_version_listeners):
+            try:
+                callback(role_name, version, self.db_path)
+            except Exception as e:
+                print(f"版本变更通知失败: {e}")
+    
     def compare_versions(
         self,
         role_name: str,
@@ -0,0 +1,230 @@
+"""
+上游调用限流模块
+按模型限制发往智谱AI的请求：令牌桶控制每秒请求数，另有同时进行中的请求数上限。
+超出预算时可以排队等待（不超过截止时间）或直接拒绝；排队按优先级出队，
+交互类请求（如 /api/chat）先于批量类请求（如 /api/learning/path）
+"""
+import os
+import asyncio
+import json
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from typing import Any, Dict, Optional
+
+# 优先级（数值越小越先出队）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_NORMAL: 'normal',
+    PRIORITY_BATCH: 'batch',
+}
+
+# 默认预算：每秒请求数、令牌桶容量（允许的突发量）、最大并发请求数
+DEFAULT_RPS = float(os.getenv('LLM_RATE_LIMIT_RPS', '10'))
+DEFAULT_BURST = float(os.getenv('LLM_RATE_LIMIT_BURST', '20'))
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', '16'))
+# 按模型覆盖预算，例如 {"glm-4-flash": {"rps": 5, "burst": 10, "max_in_flight": 8}}
+MODEL_LIMITS = json.loads(os.getenv('LLM_RATE_LIMITS', '{}'))
+# 超出预算时的处理方式：queue（排队等待）/ reject（直接拒绝）
+LIMIT_MODE = os.getenv('LLM_LIMIT_MODE', 'queue').lower()
+# 排队的最长等待时间（秒），同时不超过调用的截止时间
+QUEUE_TIMEOUT = float(os.getenv('LLM_LIMIT_QUEUE_TIMEOUT', '30'))
+# 异步调用方排队时的轮询间隔（秒）
+ASYNC_POLL_INTERVAL = float(os.getenv('LLM_LIMIT_ASYNC_POLL', '0.02'))
+
+
+class RateLimitExceededError(Exception):
+    """超出限流预算（直接拒绝或排队超时）"""
+
+
+class ModelLimiter:
+    """单个模型的令牌桶 + 并发上限，等待者按 (优先级, 到达顺序) 出队"""
+
+    def __init__(self, name: str, rps: float = DEFAULT_RPS, burst: float = DEFAULT_BURST,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.name = name
+        self.rps = rps
+        self.burst = max(1.0, burst)
+        self.max_in_flight = max_in_flight
+        self._cond = threading.Condition()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._in_flight = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._stats = {'admitted': 0, 'queued': 0, 'rejected': 0, 'timed_out': 0}
+
+    def acquire(self, priority: int = PRIORITY_NORMAL, deadline: Optional[float] = None,
+                mode: str = LIMIT_MODE):
+        """
+        获取一个令牌和一个并发名额
+
+        Args:
+            priority: 优先级
+            deadline: 排队截止时间（time.monotonic() 时间戳）
+            mode: queue / reject
+        """
+        queue_deadline = self._queue_deadline(deadline)
+        with self._cond:
+            entry = self._enter(priority, mode)
+            if entry is None:
+                return
+            try:
+                while True:
+                    admitted, wait_for = self._try_admit(entry, queue_deadline)
+                    if admitted:
+                        return
+                    self._cond.wait(wait_for)
+            except BaseException:
+                self._leave(entry)
+                raise
+
+    async def acquire_async(self, priority: int = PRIORITY_NORMAL, deadline: Optional[float] = None,
+                            mode: str = LIMIT_MODE):
+        """acquire 的异步版本：与同步调用方共享预算和等待队列，排队期间让出事件循环"""
+        queue_deadline = self._queue_deadline(deadline)
+        with self._cond:
+            entry = self._enter(priority, mode)
+        if entry is None:
+            return
+        try:
+            while True:
+                with self._cond:
+                    admitted, wait_for = self._try_admit(entry, queue_deadline)
+                if admitted:
+                    return
+                await asyncio.sleep(min(wait_for, ASYNC_POLL_INTERVAL))
+        except BaseException:
+            with self._cond:
+                self._leave(entry)
+            raise
+
+    def release(self):
+        """归还并发名额"""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def state(self) -> Dict[str, Any]:
+        """限流状态"""
+        with self._cond:
+            self._refill()
+            waiting = {}
+            for priority, _ in self._waiters:
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                waiting[name] = waiting.get(name, 0) + 1
+            return dict(
+                self._stats,
+                rps=self.rps,
+                burst=self.burst,
+                max_in_flight=self.max_in_flight,
+                in_flight=self._in_flight,
+                tokens=round(self._tokens, 2),
+                waiting=waiting
+            )
+
+    def _queue_deadline(self, deadline):
+        queue_deadline = time.monotonic() + QUEUE_TIMEOUT
+        return queue_deadline if deadline is None else min(queue_deadline, deadline)
+
+    def _enter(self, priority, mode):
+        """尝试立即获取；需要排队时返回排队条目（调用方持有锁）"""
+        self._refill()
+        if not self._waiters and self._available():
+            self._admit()
+            return None
+        if mode == 'reject':
+            self._stats['rejected'] += 1
+            raise RateLimitExceededError(f"请求过多（{self.name} 已达限流上限），请稍后重试")
+        entry = (priority, next(self._seq))
+        heapq.heappush(self._waiters, entry)
+        self._stats['queued'] += 1
+        return entry
+
+    def _try_admit(self, entry, queue_deadline):
+        """
+        排队条目位于队首且有余量时出队（调用方持有锁）
+
+        Returns:
+            (是否已获取, 建议的等待秒数)；超过排队截止时间时抛出 RateLimitExceededError
+        """
+        self._refill()
+        if self._waiters[0] == entry and self._available():
+            heapq.heappop(self._waiters)
+            self._admit()
+            # 唤醒下一个排队者检查是否也能出队
+            self._cond.notify_all()
+            return True, 0
+        left = queue_deadline - time.monotonic()
+        if left <= 0:
+            self._stats['timed_out'] += 1
+            raise RateLimitExceededError(f"请求排队超时（{self.name} 已达限流上限），请稍后重试")
+        if self._tokens < 1 and self.rps > 0:
+            left = min(left, (1 - self._tokens) / self.rps)
+        return False, left
+
+    def _leave(self, entry):
+        """放弃排队（调用方持有锁）"""
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            self._cond.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rps)
+        self._updated = now
+
+    def _available(self) -> bool:
+        return self._tokens >= 1 and self._in_flight < self.max_in_flight
+
+    def _admit(self):
+        self._tokens -= 1
+        self._in_flight += 1
+        self._stats['admitted'] += 1
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(model: str) -> ModelLimiter:
+    """获取模型对应的限流器（每个模型一个）"""
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            limiter = _limiters[model] = ModelLimiter(model, **MODEL_LIMITS.get(model, {}))
+        return limiter
+
+
+@contextmanager
+def limit(model: str, priority: Optional[int] = None, deadline: Optional[float] = None):
+    """在限流预算内执行一次上游调用"""
+    limiter = get_limiter(model)
+    limiter.acquire(PRIORITY_NORMAL if priority is None else priority, deadline)
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+@asynccontextmanager
+async def limit_async(model: str, priority: Optional[int] = None, deadline: Optional[float] = None):
+    """limit 的异步版本"""
+    limiter = get_limiter(model)
+    await limiter.acquire_async(PRIORITY_NORMAL if priority is None else priority, deadline)
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+def limiter_states() -> Dict[str, Dict[str, Any]]:
+    """所有限流器的状态，用于健康检查"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.state() for limiter in limiters}
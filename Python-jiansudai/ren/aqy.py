@@ -1,34 +1,9 @@
-import requests
-from requests.utils import stream_decode_response_unicode
-
-# 统一配置管理：从 config.py 导入 API 密钥
-try:
-    from config import ZHIPU_API_KEY
-except ImportError:
-    # 如果 config.py 不存在，使用默认值（生产环境应使用环境变量）
-    import os
-    ZHIPU_API_KEY = os.getenv('ZHIPU_API_KEY', "ab16c0b7809545e99d60ae7b73023ba4.YwWPxLoEG60CWy6k")
-
-def call_zhipu_api(messages, model="glm-4-flash"):
-    url = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
-
-    headers = {
-        "Authorization": ZHIPU_API_KEY,
-        "Content-Type": "application/json"
-    }
-
-    data = {
-        "model": model,
-        "messages": messages,
-        "temperature": 0.5   
-    }
-
-    response = requests.post(url, headers=headers, json=data)
+import os
+import sys
 
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"API调用失败: {response.status_code}, {response.text}")
+# 共享的智谱AI客户端（连接池）位于上级目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from zhipu_client import call_zhipu_api
 
 
 # ========== 主程序 ==========
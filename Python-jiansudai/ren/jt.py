@@ -1,56 +1,22 @@
-import requests
-from requests.utils import stream_decode_response_unicode
-
-# 统一配置管理：从 config.py 导入 API 密钥
-try:
-    from config import ZHIPU_API_KEY
-except ImportError:
-    # 如果 config.py 不存在，使用默认值（生产环境应使用环境变量）
-    import os
-    ZHIPU_API_KEY = os.getenv('ZHIPU_API_KEY', "ab16c0b7809545e99d60ae7b73023ba4.YwWPxLoEG60CWy6k")
-
-def call_zhipu_api(messages, model="glm-4-flash"):
-    url = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
-
-    headers = {
-        "Authorization": ZHIPU_API_KEY,
-        "Content-Type": "application/json"
-    }
-
-    # 限制对话历史长度，避免超过token限制
-    # 保留system message + 最近10轮对话（20条消息）
-    MAX_HISTORY_MESSAGES = 20  # system(1) + 最近10轮对话(20)
-    
-    if len(messages) > MAX_HISTORY_MESSAGES:
-        # 保留system message和最近的对话
-        system_msg = messages[0]  # 保留system message
-        recent_messages = messages[-(MAX_HISTORY_MESSAGES - 1):]  # 保留最近的对话
-        messages = [system_msg] + recent_messages
-        print(f"⚠ 对话历史过长，已截取最近{MAX_HISTORY_MESSAGES-1}轮对话")
-
-    data = {
-        "model": model,
-        "messages": messages,
-        "temperature": 0.5   
-    }
-
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-
-        if response.status_code == 200:
-            return response.json()
-        else:
-            error_msg = f"API调用失败: {response.status_code}"
-            try:
-                error_detail = response.json()
-                error_msg += f", {error_detail}"
-            except:
-                error_msg += f", {response.text[:200]}"  # 只显示前200字符
-            raise Exception(error_msg)
-    except requests.exceptions.Timeout:
-        raise Exception("API请求超时，请稍后重试")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"网络请求失败: {str(e)}")
+import os
+import sys
+
+# 共享的智谱AI客户端（连接池）位于上级目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import zhipu_client
+import chat_context
+
+def trim_messages(messages):
+    # 限制对话历史的token数，避免超过模型上下文
+    # 保留system message和最近的对话，预算与 /api/chat 相同（CHAT_CONTEXT_BUDGET，见 chat_context.py）；
+    # /api/chat 已按预算组装好的消息不会再被截取
+    trimmed = chat_context.trim_to_budget(messages)
+    if len(trimmed) < len(messages):
+        print(f"⚠ 对话历史过长，已截取最近{len(trimmed) - 1}条消息")
+    return trimmed
+
+def call_zhipu_api(messages, model="glm-4-flash", **kwargs):
+    return zhipu_client.call_zhipu_api(trim_messages(messages), model, **kwargs)
 
 
 # ========== 主程序 ==========
@@ -0,0 +1,169 @@
+"""
+上游调用容错模块
+- 429/5xx/超时/连接错误时按带抖动的指数退避重试，优先遵守 Retry-After
+- 整个调用（含重试）受截止时间约束，截止时间由请求向下传递
+- 按模型熔断：连续失败达到阈值后在冷却期内直接失败，冷却结束后放行一个探测请求
+"""
+import os
+import time
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+# 最大重试次数（不含首次请求）
+MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+# 退避基数与上限（秒）
+RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', '0.5'))
+RETRY_MAX_DELAY = float(os.getenv('LLM_RETRY_MAX_DELAY', '8'))
+# 未指定截止时间时，单次调用（含重试）的总时长上限（秒）
+DEFAULT_DEADLINE = float(os.getenv('LLM_DEFAULT_DEADLINE', '90'))
+# 熔断阈值：连续失败次数
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('LLM_BREAKER_FAILURE_THRESHOLD', '5'))
+# 熔断冷却时间（秒）
+BREAKER_RESET_TIMEOUT = float(os.getenv('LLM_BREAKER_RESET_TIMEOUT', '30'))
+
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，调用被直接拒绝"""
+
+
+class DeadlineExceededError(Exception):
+    """调用超过截止时间"""
+
+
+def make_deadline(seconds: Optional[float] = None) -> float:
+    """计算截止时间（time.monotonic() 时间戳）"""
+    return time.monotonic() + (DEFAULT_DEADLINE if seconds is None else seconds)
+
+
+def remaining(deadline: float) -> float:
+    """距截止时间的剩余秒数"""
+    return deadline - time.monotonic()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头（秒数或 HTTP 日期），无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    第 attempt 次重试前的等待时间（attempt 从 1 开始）
+
+    有 Retry-After 时按其等待；否则使用 full jitter：在 [0, min(上限, 基数 * 2^(attempt-1))] 内随机
+    """
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt - 1))))
+
+
+class CircuitBreaker:
+    """熔断器：closed（正常）→ open（直接失败）→ half_open（放行一个探测请求）"""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe = None
+        self._stats = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    def before_call(self) -> Optional[object]:
+        """
+        调用前检查，熔断时抛出 CircuitOpenError
+
+        Returns:
+            half_open 时返回探测凭据，调用方没有记录结果就退出时须通过 release_probe 归还；否则为 None
+        """
+        with self._lock:
+            if self._state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(f"智谱AI服务暂时不可用（{self.name} 熔断中），请稍后重试")
+                self._state = 'half_open'
+                self._probe = None
+            if self._state == 'half_open':
+                if self._probe is not None:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(f"智谱AI服务暂时不可用（{self.name} 正在探测恢复），请稍后重试")
+                self._probe = object()
+                return self._probe
+            return None
+
+    def release_probe(self, probe: Optional[object]):
+        """归还未记录结果的探测名额（排队超时、截止时间到达、被取消等），不计成功也不计失败；可重复调用"""
+        if probe is None:
+            return
+        with self._lock:
+            if self._probe is probe:
+                self._probe = None
+
+    def record_success(self):
+        with self._lock:
+            self._stats['successes'] += 1
+            self._failures = 0
+            self._state = 'closed'
+            self._probe = None
+
+    def record_failure(self):
+        with self._lock:
+            self._stats['failures'] += 1
+            self._failures += 1
+            self._probe = None
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    self._stats['opened'] += 1
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+
+    def state(self) -> Dict[str, Any]:
+        """熔断器状态"""
+        with self._lock:
+            state = self._state
+            retry_in = None
+            if state == 'open':
+                retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 2)
+                if retry_in == 0:
+                    state = 'half_open'
+                    retry_in = None
+            return dict(self._stats, state=state, consecutive_failures=self._failures, retry_in=retry_in)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(model: str) -> CircuitBreaker:
+    """获取模型对应的熔断器（每个模型一个）"""
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = _breakers[model] = CircuitBreaker(model)
+        return breaker
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    """所有熔断器的状态，用于健康检查"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.state() for breaker in breakers}
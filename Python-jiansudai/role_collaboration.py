@@ -2,18 +2,64 @@
 角色协作模块
 实现深入的角色辩论、相互质疑和观点融合功能
 """
+import os
 import json
-from typing import Dict, List, Any, Optional
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Callable, Iterator, AsyncIterator
 from datetime import datetime
 
+# 辩论模式：parallel（同一轮的角色并发发言，只参考之前各轮）/ sequential（逐个发言，参考本轮已发言的角色）
+DEBATE_MODE = os.getenv('DEBATE_MODE', 'parallel').lower()
+# 并发模式下的线程数上限
+DEBATE_MAX_WORKERS = int(os.getenv('DEBATE_MAX_WORKERS', '16'))
+
+_debate_executor = None
+_debate_executor_lock = threading.Lock()
+
+def get_debate_executor() -> ThreadPoolExecutor:
+    """获取辩论线程池（单例）"""
+    global _debate_executor
+    if _debate_executor is None:
+        with _debate_executor_lock:
+            if _debate_executor is None:
+                _debate_executor = ThreadPoolExecutor(
+                    max_workers=DEBATE_MAX_WORKERS,
+                    thread_name_prefix='debate'
+                )
+    return _debate_executor
+
+# asyncio 版本中进行中的陈述任务（客户端断开后仍需完成）
+_background_tasks = set()
+
+def _call_when_done(futures, callback):
+    """futures（Future 或 asyncio 任务）全部结束后调用一次 callback，没有未结束的 future 时立即调用"""
+    lock = threading.Lock()
+    remaining = [len(futures) + 1]
+
+    def done(_=None):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            callback()
+
+    for future in futures:
+        future.add_done_callback(done)
+    done()
+
 
 class RoleDebateManager:
     """角色辩论管理器"""
     
-    def __init__(self, call_role_api_func, get_role_personality_func, roles_dict):
+    def __init__(self, call_role_api_func, get_role_personality_func, roles_dict, executor=None):
         self.call_role_api = call_role_api_func
         self.get_role_personality = get_role_personality_func
         self.roles_dict = roles_dict
+        # 并发模式使用的线程池，为None时使用模块级线程池
+        self.executor = executor
     
     def generate_debate_round(self, role: str, user_choice: Dict, 
                             previous_statements: List[Dict], round_num: int) -> Dict:
@@ -29,6 +75,14 @@ class RoleDebateManager:
         Returns:
             辩论内容
         """
+        messages = self.build_debate_messages(role, user_choice, previous_statements, round_num)
+        response = self.call_role_api(role, messages)
+        content = response['choices'][0]['message']['content']
+        return self._make_statement(role, round_num, content)
+    
+    def build_debate_messages(self, role: str, user_choice: Dict,
+                              previous_statements: List[Dict], round_num: int) -> List[Dict]:
+        """构建某个角色在某一轮的辩论消息"""
         choice_text = f"""
 - 车辆：{user_choice.get('vehicle', '未知')}
 - 减速带：{user_choice.get('bump', '未知')}
@@ -91,14 +145,12 @@ class RoleDebateManager:
 """
         
         role_personality = self.get_role_personality(role)
-        messages = [
+        return [
             {"role": "system", "content": role_personality},
             {"role": "user", "content": query}
         ]
-        
-        response = self.call_role_api(role, messages)
-        content = response['choices'][0]['message']['content']
-        
+    
+    def _make_statement(self, role: str, round_num: int, content: str) -> Dict:
         return {
             'role': role,
             'role_name': self.roles_dict[role]['name'],
@@ -109,7 +161,8 @@ class RoleDebateManager:
     
     def generate_interactive_debate(self, user_choice: Dict, 
                                    roles: List[str] = None, 
-                                   rounds: int = 3) -> Dict:
+                                   rounds: int = 3,
+                                   mode: Optional[str] = None) -> Dict:
         """
         生成交互式辩论（角色之间真正对话）
         
@@ -117,16 +170,22 @@ class RoleDebateManager:
             user_choice: 用户选择
             roles: 参与辩论的角色列表
             rounds: 辩论轮数
+            mode: parallel（同一轮的角色并发发言，都只参考之前各轮的陈述，耗时约为 轮数 × 最慢角色）
+                  或 sequential（逐个发言，后发言的角色还能看到本轮已发言角色的陈述），为None时使用 DEBATE_MODE
         
         Returns:
             完整的辩论记录
         """
         if roles is None:
-            roles = ['ethicist', 'safety', 'physicist', 'traffic_engineer']
+            roles = ['ethicist', 'safety', 'physicist', 'traffic']
+        mode = (mode or DEBATE_MODE).lower()
+        if mode not in ('parallel', 'sequential'):
+            raise ValueError(f"Invalid debate mode: {mode}")
         
         debate_record = {
             'user_choice': user_choice,
             'participants': [self.roles_dict[r]['name'] for r in roles],
+            'mode': mode,
             'rounds': []
         }
         
@@ -134,22 +193,16 @@ class RoleDebateManager:
         all_statements = []
         
         for round_num in range(1, rounds + 1):
-            round_statements = []
-            
-            for role in roles:
-                try:
-                    statement = self.generate_debate_round(
-                        role, user_choice, all_statements, round_num
-                    )
+            if mode == 'parallel':
+                round_statements = self._run_round_parallel(roles, user_choice, list(all_statements), round_num)
+                all_statements.extend(stmt for stmt in round_statements if 'error' not in stmt)
+            else:
+                round_statements = []
+                for role in roles:
+                    statement = self._run_statement(role, user_choice, all_statements, round_num)
                     round_statements.append(statement)
-                    all_statements.append(statement)
-                except Exception as e:
-                    round_statements.append({
-                        'role': role,
-                        'role_name': self.roles_dict[role]['name'],
-                        'round': round_num,
-                        'error': str(e)
-                    })
+                    if 'error' not in statement:
+                        all_statements.append(statement)
             
             debate_record['rounds'].append({
                 'round_number': round_num,
@@ -158,6 +211,276 @@ class RoleDebateManager:
         
         return debate_record
     
+    def _run_statement(self, role: str, user_choice: Dict,
+                       previous_statements: List[Dict], round_num: int) -> Dict:
+        """生成单个角色的陈述，异常作为该角色的错误结果返回"""
+        try:
+            return self.generate_debate_round(role, user_choice, previous_statements, round_num)
+        except Exception as e:
+            return {
+                'role': role,
+                'role_name': self.roles_dict[role]['name'],
+                'round': round_num,
+                'error': str(e)
+            }
+    
+    def _run_round_parallel(self, roles: List[str], user_choice: Dict,
+                            snapshot: List[Dict], round_num: int) -> List[Dict]:
+        """同一轮的所有角色并发发言（基于之前各轮陈述的快照），结果按角色顺序返回"""
+        executor = self.executor or get_debate_executor()
+        futures = [
+            executor.submit(self._run_statement, role, user_choice, snapshot, round_num)
+            for role in roles
+        ]
+        return [future.result() for future in futures]
+    
+    def stream_interactive_debate(self, user_choice: Dict,
+                                  roles: List[str] = None,
+                                  rounds: int = 3,
+                                  mode: Optional[str] = None,
+                                  completed: Optional[List[Dict]] = None,
+                                  stream_func: Optional[Callable] = None,
+                                  on_statement: Optional[Callable] = None,
+                                  on_finished: Optional[Callable] = None) -> Iterator[Dict]:
+        """
+        以事件流的方式生成交互式辩论，每条陈述（或其token）生成后立即产出
+        
+        Args:
+            user_choice, roles, rounds, mode: 同 generate_interactive_debate
+            completed: 已完成的陈述（断线续传时从数据库读取），不会重新生成，
+                       重放给客户端并作为后续轮次的上下文
+            stream_func: 流式调用函数 (role, messages) -> 文本片段迭代器；
+                         为None时整条陈述生成后一次性产出
+            on_statement: 每条新陈述生成后在工作线程中调用（用于持久化）；
+                          客户端断开后，进行中的陈述仍会完成并调用
+            on_finished: 生成器结束（完成、出错或被关闭）且已开始的陈述全部完成后调用一次，
+                         之后不会再调用 on_statement
+        
+        Yields:
+            {'type': 'statement', ...陈述, 'replayed': 是否为重放}（失败的陈述带 error 字段）
+            {'type': 'token', 'role', 'role_name', 'round', 'content'}
+            {'type': 'round_complete', 'round'}
+            {'type': 'complete', 'debate': 完整的辩论记录（格式同 generate_interactive_debate）}
+        """
+        futures = []
+        try:
+            if roles is None:
+                roles = ['ethicist', 'safety', 'physicist', 'traffic']
+            mode = (mode or DEBATE_MODE).lower()
+            if mode not in ('parallel', 'sequential'):
+                raise ValueError(f"Invalid debate mode: {mode}")
+        
+            done = {(stmt['round'], stmt['role']): stmt for stmt in completed or []}
+            executor = self.executor or get_debate_executor()
+            events = queue.Queue()
+            all_statements = []
+            debate_record = {
+                'user_choice': user_choice,
+                'participants': [self.roles_dict[r]['name'] for r in roles],
+                'mode': mode,
+                'rounds': []
+            }
+        
+            for round_num in range(1, rounds + 1):
+                round_statements = {}
+                for role in roles:
+                    statement = done.get((round_num, role))
+                    if statement is not None:
+                        round_statements[role] = statement
+                        yield dict(statement, type='statement', replayed=True)
+            
+                pending = [role for role in roles if role not in round_statements]
+                # 并发模式一次提交本轮所有角色；顺序模式逐个提交，后发言的角色参考本轮已发言的角色
+                batches = [pending] if mode == 'parallel' else [[role] for role in pending]
+                for batch in batches:
+                    previous = list(all_statements)
+                    if mode == 'sequential':
+                        previous += [
+                            round_statements[r] for r in roles
+                            if r in round_statements and 'error' not in round_statements[r]
+                        ]
+                    for role in batch:
+                        futures.append(executor.submit(
+                            self._produce_statement, role, user_choice, previous, round_num,
+                            stream_func, on_statement, events
+                        ))
+                    remaining = len(batch)
+                    while remaining:
+                        event = events.get()
+                        if event['type'] == 'statement':
+                            remaining -= 1
+                            statement = dict(event)
+                            del statement['type'], statement['replayed']
+                            round_statements[statement['role']] = statement
+                        yield event
+            
+                ordered = [round_statements[role] for role in roles]
+                all_statements.extend(stmt for stmt in ordered if 'error' not in stmt)
+                debate_record['rounds'].append({
+                    'round_number': round_num,
+                    'statements': ordered
+                })
+                yield {'type': 'round_complete', 'round': round_num}
+        
+            yield {'type': 'complete', 'debate': debate_record}
+        finally:
+            if on_finished is not None:
+                _call_when_done(futures, on_finished)
+    
+    def _produce_statement(self, role, user_choice, previous_statements, round_num,
+                           stream_func, on_statement, events):
+        """在工作线程中生成一条陈述，产出的事件放入 events 队列"""
+        try:
+            messages = self.build_debate_messages(role, user_choice, previous_statements, round_num)
+            if stream_func is None:
+                response = self.call_role_api(role, messages)
+                content = response['choices'][0]['message']['content']
+            else:
+                parts = []
+                for delta in stream_func(role, messages):
+                    parts.append(delta)
+                    events.put({
+                        'type': 'token',
+                        'role': role,
+                        'role_name': self.roles_dict[role]['name'],
+                        'round': round_num,
+                        'content': delta
+                    })
+                content = ''.join(parts)
+            statement = self._make_statement(role, round_num, content)
+        except Exception as e:
+            statement = {
+                'role': role,
+                'role_name': self.roles_dict[role]['name'],
+                'round': round_num,
+                'error': str(e)
+            }
+        else:
+            if on_statement is not None:
+                try:
+                    on_statement(statement)
+                except Exception as e:
+                    print(f"警告：保存辩论陈述失败: {e}")
+        events.put(dict(statement, type='statement', replayed=False))
+    
+    async def astream_interactive_debate(self, user_choice: Dict,
+                                         roles: List[str] = None,
+                                         rounds: int = 3,
+                                         mode: Optional[str] = None,
+                                         completed: Optional[List[Dict]] = None,
+                                         stream_func: Optional[Callable] = None,
+                                         on_statement: Optional[Callable] = None,
+                                         on_finished: Optional[Callable] = None) -> AsyncIterator[Dict]:
+        """
+        stream_interactive_debate 的 asyncio 版本，事件格式相同
+        
+        self.call_role_api 为协程函数；stream_func 返回异步迭代器；on_statement 为同步函数（在线程中调用），
+        on_finished 为同步函数（在事件循环线程中调用）。
+        同一批次的角色作为任务并发执行，等待上游时不占用线程；
+        客户端断开（生成器被关闭）后，进行中的陈述仍会完成并调用 on_statement
+        """
+        tasks = []
+        try:
+            if roles is None:
+                roles = ['ethicist', 'safety', 'physicist', 'traffic']
+            mode = (mode or DEBATE_MODE).lower()
+            if mode not in ('parallel', 'sequential'):
+                raise ValueError(f"Invalid debate mode: {mode}")
+        
+            done = {(stmt['round'], stmt['role']): stmt for stmt in completed or []}
+            events = asyncio.Queue()
+            all_statements = []
+            debate_record = {
+                'user_choice': user_choice,
+                'participants': [self.roles_dict[r]['name'] for r in roles],
+                'mode': mode,
+                'rounds': []
+            }
+        
+            for round_num in range(1, rounds + 1):
+                round_statements = {}
+                for role in roles:
+                    statement = done.get((round_num, role))
+                    if statement is not None:
+                        round_statements[role] = statement
+                        yield dict(statement, type='statement', replayed=True)
+            
+                pending = [role for role in roles if role not in round_statements]
+                batches = [pending] if mode == 'parallel' else [[role] for role in pending]
+                for batch in batches:
+                    previous = list(all_statements)
+                    if mode == 'sequential':
+                        previous += [
+                            round_statements[r] for r in roles
+                            if r in round_statements and 'error' not in round_statements[r]
+                        ]
+                    for role in batch:
+                        task = asyncio.create_task(self._aproduce_statement(
+                            role, user_choice, previous, round_num, stream_func, on_statement, events
+                        ))
+                        # 保留任务引用，生成器关闭后任务继续完成
+                        _background_tasks.add(task)
+                        task.add_done_callback(_background_tasks.discard)
+                        tasks.append(task)
+                    remaining = len(batch)
+                    while remaining:
+                        event = await events.get()
+                        if event['type'] == 'statement':
+                            remaining -= 1
+                            statement = dict(event)
+                            del statement['type'], statement['replayed']
+                            round_statements[statement['role']] = statement
+                        yield event
+            
+                ordered = [round_statements[role] for role in roles]
+                all_statements.extend(stmt for stmt in ordered if 'error' not in stmt)
+                debate_record['rounds'].append({
+                    'round_number': round_num,
+                    'statements': ordered
+                })
+                yield {'type': 'round_complete', 'round': round_num}
+        
+            yield {'type': 'complete', 'debate': debate_record}
+        finally:
+            if on_finished is not None:
+                _call_when_done(tasks, on_finished)
+    
+    async def _aproduce_statement(self, role, user_choice, previous_statements, round_num,
+                                  stream_func, on_statement, events):
+        """_produce_statement 的 asyncio 版本"""
+        try:
+            messages = self.build_debate_messages(role, user_choice, previous_statements, round_num)
+            if stream_func is None:
+                response = await self.call_role_api(role, messages)
+                content = response['choices'][0]['message']['content']
+            else:
+                parts = []
+                async for delta in stream_func(role, messages):
+                    parts.append(delta)
+                    events.put_nowait({
+                        'type': 'token',
+                        'role': role,
+                        'role_name': self.roles_dict[role]['name'],
+                        'round': round_num,
+                        'content': delta
+                    })
+                content = ''.join(parts)
+            statement = self._make_statement(role, round_num, content)
+        except Exception as e:
+            statement = {
+                'role': role,
+                'role_name': self.roles_dict[role]['name'],
+                'round': round_num,
+                'error': str(e)
+            }
+        else:
+            if on_statement is not None:
+                try:
+                    await asyncio.to_thread(on_statement, statement)
+                except Exception as e:
+                    print(f"警告：保存辩论陈述失败: {e}")
+        events.put_nowait(dict(statement, type='statement', replayed=False))
+    
     def extract_conflict_points(self, debate_record: Dict) -> List[Dict]:
         """
         提取观点冲突点
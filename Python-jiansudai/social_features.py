@@ -2,7 +2,7 @@
 社交功能模块
 实现评论、分享和协作学习功能
 """
-import sqlite3
+import db
 import json
 import hashlib
 import secrets
@@ -32,17 +32,13 @@ class SocialFeaturesManager:
         Returns:
             评论信息
         """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            INSERT INTO comments (session_id, parent_id, user_id, content)
-            VALUES (?, ?, ?, ?)
-        ''', (session_id, parent_id, user_id, content))
-        
-        comment_id = c.lastrowid
-        conn.commit()
-        conn.close()
+        with db.transaction(self.db_path) as c:
+            c.execute('''
+                INSERT INTO comments (session_id, parent_id, user_id, content)
+                VALUES (?, ?, ?, ?)
+            ''', (session_id, parent_id, user_id, content))
+            
+            comment_id = c.lastrowid
         
         return {
             'id': comment_id,
@@ -65,19 +61,17 @@ class SocialFeaturesManager:
         Returns:
             评论列表
         """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT id, parent_id, user_id, content, likes, created_at
-            FROM comments
-            WHERE session_id = ?
-            ORDER BY created_at DESC
-            LIMIT ?
-        ''', (session_id, limit))
-        
-        rows = c.fetchall()
-        conn.close()
+        with db.connection(self.db_path) as conn:
+            c = conn.cursor()
+            c.execute('''
+                SELECT id, parent_id, user_id, content, likes, created_at
+                FROM comments
+                WHERE session_id = ?
+                ORDER BY created_at DESC
+                LIMIT ?
+            ''', (session_id, limit))
+            
+            rows = c.fetchall()
         
         comments = []
         for row in rows:
@@ -102,17 +96,12 @@ class SocialFeaturesManager:
         Returns:
             是否成功
         """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            UPDATE comments
-            SET likes = likes + 1
-            WHERE id = ?
-        ''', (comment_id,))
-        
-        conn.commit()
-        conn.close()
+        with db.transaction(self.db_path) as c:
+            c.execute('''
+                UPDATE comments
+                SET likes = likes + 1
+                WHERE id = ?
+            ''', (comment_id,))
         return True
     
     # ========== 分享功能 ==========
@@ -133,22 +122,18 @@ class SocialFeaturesManager:
         # 生成唯一分享码
         share_code = self._generate_share_code(session_id, share_type)
         
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            INSERT INTO shares (session_id, share_code, share_type, share_data)
-            VALUES (?, ?, ?, ?)
-        ''', (
-            session_id,
-            share_code,
-            share_type,
-            json.dumps(share_data or {}, ensure_ascii=False)
-        ))
-        
-        share_id = c.lastrowid
-        conn.commit()
-        conn.close()
+        with db.transaction(self.db_path) as c:
+            c.execute('''
+                INSERT INTO shares (session_id, share_code, share_type, share_data)
+                VALUES (?, ?, ?, ?)
+            ''', (
+                session_id,
+                share_code,
+                share_type,
+                json.dumps(share_data or {}, ensure_ascii=False)
+            ))
+            
+            share_id = c.lastrowid
         
         return {
             'id': share_id,
@@ -168,27 +153,22 @@ class SocialFeaturesManager:
         Returns:
             分享内容
         """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT id, session_id, share_type, share_data, view_count, created_at
-            FROM shares
-            WHERE share_code = ?
-        ''', (share_code,))
-        
-        row = c.fetchone()
-        
-        if row:
-            # 增加查看次数
+        with db.transaction(self.db_path) as c:
             c.execute('''
-                UPDATE shares
-                SET view_count = view_count + 1
-                WHERE id = ?
-            ''', (row[0],))
-            conn.commit()
-        
-        conn.close()
+                SELECT id, session_id, share_type, share_data, view_count, created_at
+                FROM shares
+                WHERE share_code = ?
+            ''', (share_code,))
+            
+            row = c.fetchone()
+            
+            if row:
+                # 增加查看次数
+                c.execute('''
+                    UPDATE shares
+                    SET view_count = view_count + 1
+                    WHERE id = ?
+                ''', (row[0],))
         
         if not row:
             return None
@@ -225,17 +205,13 @@ class SocialFeaturesManager:
         Returns:
             协作记录
         """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            INSERT INTO collaborations (session_id, collaborator_id, collaboration_type, content)
-            VALUES (?, ?, ?, ?)
-        ''', (session_id, collaborator_id, collaboration_type, content))
-        
-        collab_id = c.lastrowid
-        conn.commit()
-        conn.close()
+        with db.transaction(self.db_path) as c:
+            c.execute('''
+                INSERT INTO collaborations (session_id, collaborator_id, collaboration_type, content)
+                VALUES (?, ?, ?, ?)
+            ''', (session_id, collaborator_id, collaboration_type, content))
+            
+            collab_id = c.lastrowid
         
         return {
             'id': collab_id,
@@ -256,18 +232,16 @@ class SocialFeaturesManager:
         Returns:
             协作记录列表
         """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT id, collaborator_id, collaboration_type, content, created_at
-            FROM collaborations
-            WHERE session_id = ?
-            ORDER BY created_at DESC
-        ''', (session_id,))
-        
-        rows = c.fetchall()
-        conn.close()
+        with db.connection(self.db_path) as conn:
+            c = conn.cursor()
+            c.execute('''
+                SELECT id, collaborator_id, collaboration_type, content, created_at
+                FROM collaborations
+                WHERE session_id = ?
+                ORDER BY created_at DESC
+            ''', (session_id,))
+            
+            rows = c.fetchall()
         
         collaborations = []
         for row in rows:
@@ -292,29 +266,26 @@ class SocialFeaturesManager:
         Returns:
             比较结果
         """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        # 获取两个会话的选择
-        c.execute('''
-            SELECT vehicle, bump, location, speed, survival_rate
-            FROM user_choices
-            WHERE session_id = ?
-            ORDER BY created_at DESC
-            LIMIT 1
-        ''', (session_id1,))
-        choice1 = c.fetchone()
-        
-        c.execute('''
-            SELECT vehicle, bump, location, speed, survival_rate
-            FROM user_choices
-            WHERE session_id = ?
-            ORDER BY created_at DESC
-            LIMIT 1
-        ''', (session_id2,))
-        choice2 = c.fetchone()
-        
-        conn.close()
+        with db.connection(self.db_path) as conn:
+            c = conn.cursor()
+            # 获取两个会话的选择
+            c.execute('''
+                SELECT vehicle, bump, location, speed, survival_rate
+                FROM user_choices
+                WHERE session_id = ?
+                ORDER BY created_at DESC
+                LIMIT 1
+            ''', (session_id1,))
+            choice1 = c.fetchone()
+            
+            c.execute('''
+                SELECT vehicle, bump, location, speed, survival_rate
+                FROM user_choices
+                WHERE session_id = ?
+                ORDER BY created_at DESC
+                LIMIT 1
+            ''', (session_id2,))
+            choice2 = c.fetchone()
         
         if not choice1 or not choice2:
             return {'error': '无法找到会话数据'}
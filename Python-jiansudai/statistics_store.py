@@ -0,0 +1,127 @@
+"""
+统计数据物化模块
+在内存中维护 user_choices 的聚合值（总数、速度/幸存率的累加和、车辆/地点计数），
+启动时从基表重建一次，之后随每条 user_choices 插入增量更新，/api/statistics 读取为 O(1)
+"""
+import threading
+from typing import Any, Dict, Optional
+
+import db
+
+
+def _as_number(value) -> Optional[float]:
+    """转换为数值，无法转换时返回 None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Counter:
+    """分组计数，并随增量更新维护计数最多的键"""
+
+    def __init__(self):
+        self.counts = {}
+        self.leader = None
+
+    def add(self, key, n: int = 1):
+        count = self.counts.get(key, 0) + n
+        self.counts[key] = count
+        # 计数只增不减，只需与当前领先者比较
+        if self.leader is None or count > self.counts[self.leader]:
+            self.leader = key
+
+    def top(self):
+        return self.leader
+
+
+class StatisticsStore:
+    """user_choices 统计数据的物化视图"""
+
+    def __init__(self, db_path: str = db.DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.total = 0
+        self.speed_sum = 0.0
+        self.speed_count = 0
+        self.survival_sum = 0.0
+        self.survival_count = 0
+        self.vehicles = _Counter()
+        self.locations = _Counter()
+
+    def rebuild(self):
+        """从 user_choices 全量重建"""
+        with db.connection(self.db_path) as conn:
+            c = conn.cursor()
+            c.execute('''
+                SELECT COUNT(*),
+                       SUM(CASE WHEN speed > 0 THEN speed END),
+                       COUNT(CASE WHEN speed > 0 THEN 1 END),
+                       SUM(CASE WHEN survival_rate > 0 THEN survival_rate END),
+                       COUNT(CASE WHEN survival_rate > 0 THEN 1 END)
+                FROM user_choices
+            ''')
+            total, speed_sum, speed_count, survival_sum, survival_count = c.fetchone()
+            c.execute('SELECT vehicle, COUNT(*) FROM user_choices GROUP BY vehicle')
+            vehicle_counts = c.fetchall()
+            c.execute('SELECT location, COUNT(*) FROM user_choices GROUP BY location')
+            location_counts = c.fetchall()
+
+        with self._lock:
+            self._reset()
+            self.total = total
+            self.speed_sum = speed_sum or 0.0
+            self.speed_count = speed_count
+            self.survival_sum = survival_sum or 0.0
+            self.survival_count = survival_count
+            for vehicle, count in vehicle_counts:
+                self.vehicles.add(vehicle, count)
+            for location, count in location_counts:
+                self.locations.add(location, count)
+
+    def record_choice(self, vehicle, location, speed, survival_rate):
+        """user_choices 插入成功后调用，增量更新聚合值（与 AVG ... WHERE x > 0 的口径一致）"""
+        speed = _as_number(speed)
+        survival_rate = _as_number(survival_rate)
+        with self._lock:
+            self.total += 1
+            if speed is not None and speed > 0:
+                self.speed_sum += speed
+                self.speed_count += 1
+            if survival_rate is not None and survival_rate > 0:
+                self.survival_sum += survival_rate
+                self.survival_count += 1
+            self.vehicles.add(vehicle)
+            self.locations.add(location)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前统计数据（字段与 /api/statistics 一致）"""
+        with self._lock:
+            avg_speed = self.speed_sum / self.speed_count if self.speed_count else 0
+            avg_survival = self.survival_sum / self.survival_count if self.survival_count else 0
+            return {
+                'total_simulations': self.total,
+                'average_speed': round(avg_speed, 2),
+                'average_survival_rate': round(avg_survival, 2),
+                'popular_vehicle': self.vehicles.top(),
+                'popular_location': self.locations.top()
+            }
+
+
+# 全局实例
+_statistics_store = None
+_statistics_store_lock = threading.Lock()
+
+def get_statistics_store() -> StatisticsStore:
+    """获取统计数据实例（单例，首次获取时从基表重建）"""
+    global _statistics_store
+    if _statistics_store is None:
+        with _statistics_store_lock:
+            if _statistics_store is None:
+                store = StatisticsStore()
+                store.rebuild()
+                _statistics_store = store
+    return _statistics_store
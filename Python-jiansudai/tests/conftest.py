@@ -0,0 +1,9 @@
+"""
+单元测试公共配置
+在 Python-jiansudai 目录下运行：python -m pytest -q tests
+"""
+import os
+import sys
+
+# 被测模块位于上级目录（与 app.py 同级）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
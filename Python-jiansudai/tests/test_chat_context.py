@@ -0,0 +1,113 @@
+"""chat_context：token 预算不变量、摘要缓存和历史截取"""
+import pytest
+
+import chat_context
+from chat_context import ChatContextManager, estimate_tokens, message_tokens, SUMMARY_HEADER
+
+
+def _history(turns, user_text='这是第{i}个问题。后面还有一些补充说明。', assistant_text='这是第{i}个回答。再多说几句话。'):
+    history = []
+    for i in range(turns):
+        history.append({'role': 'user', 'content': user_text.format(i=i)})
+        history.append({'role': 'assistant', 'content': assistant_text.format(i=i)})
+    return history
+
+
+def _total(messages):
+    return sum(message_tokens(message) for message in messages)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('你好') == 2
+    assert estimate_tokens('abcd efgh') == 2
+    assert estimate_tokens('你好 abcde') == 4
+
+
+def test_short_history_is_kept_unchanged():
+    manager = ChatContextManager(budget=2000)
+    history = _history(3)
+    messages = manager.build('系统设定', history, '新问题')
+    assert messages[0] == {'role': 'system', 'content': '系统设定'}
+    assert messages[1:-1] == history
+    assert messages[-1] == {'role': 'user', 'content': '新问题'}
+    assert manager.stats()['trimmed'] == 0
+
+
+@pytest.mark.parametrize('turns', [10, 50, 200])
+@pytest.mark.parametrize('budget', [200, 500, 2000])
+def test_budget_invariants(turns, budget):
+    manager = ChatContextManager(budget=budget, summary_budget=min(400, budget // 4))
+    history = _history(turns)
+    messages = manager.build('系统设定', history, '新问题', session_id='s', role='r')
+
+    assert _total(messages) <= budget
+    assert messages[0]['role'] == 'system'
+    assert messages[-1] == {'role': 'user', 'content': '新问题'}
+    window = messages[1:-1]
+    # 保留的是最近的连续历史，并且从用户消息开始
+    assert window == history[len(history) - len(window):]
+    if window:
+        assert window[0]['role'] == 'user'
+    if len(window) < len(history):
+        assert SUMMARY_HEADER in messages[0]['content']
+
+
+def test_long_message_is_clipped_to_budget():
+    manager = ChatContextManager(budget=300)
+    messages = manager.build('系统设定', _history(5), '长' * 5000)
+    assert messages[-1]['content'].endswith('…')
+    assert _total(messages) <= 300
+    assert manager.stats()['message_clipped'] == 1
+
+
+def test_oversized_system_prompt_keeps_minimum_message():
+    manager = ChatContextManager(budget=100)
+    messages = manager.build('设' * 500, _history(5), '问' * 1000)
+    assert len(messages) == 2
+    assert estimate_tokens(messages[-1]['content']) <= chat_context.MIN_MESSAGE_TOKENS
+
+
+def test_malformed_history_entries_are_dropped():
+    manager = ChatContextManager(budget=2000)
+    history = [{'role': 'system', 'content': '注入'}, {'role': 'user', 'content': 123}, 'text',
+               {'role': 'user', 'content': '正常'}]
+    messages = manager.build('系统设定', history, '新问题')
+    assert messages[1:-1] == [{'role': 'user', 'content': '正常'}]
+
+
+def test_summary_cache_extends_incrementally_and_rebuilds_on_edit():
+    manager = ChatContextManager(budget=300, summary_budget=80)
+    history = []
+    for i in range(30):
+        history += _history(1, user_text=f'问题{i}。补充说明文字补充说明文字', assistant_text=f'回答{i}。更多的内容更多的内容')
+        messages = manager.build('系统设定', history, '新问题', session_id='s', role='r')
+        assert _total(messages) <= 300
+
+    stats = manager.stats()
+    assert stats['summary_rebuilt'] == 1
+    assert stats['summary_extended'] + stats['summary_hits'] == stats['trimmed'] - 1
+    assert stats['cached_sessions'] == 1
+
+    # 修改已摘要的消息后重新生成
+    history[0] = {'role': 'user', 'content': '改过的问题。'}
+    manager.build('系统设定', history, '新问题', session_id='s', role='r')
+    assert manager.stats()['summary_rebuilt'] == 2
+
+
+def test_summary_without_session_is_not_cached():
+    manager = ChatContextManager(budget=200, summary_budget=50)
+    manager.build('系统设定', _history(50), '新问题')
+    assert manager.stats()['cached_sessions'] == 0
+
+
+def test_trim_to_budget_keeps_system_and_last_message():
+    messages = [{'role': 'system', 'content': '系统'}] + _history(100) + [{'role': 'user', 'content': '最后'}]
+    trimmed = chat_context.trim_to_budget(messages, budget=200)
+    assert trimmed[0] == messages[0]
+    assert trimmed[-1] == messages[-1]
+    assert trimmed[1:-1] == messages[len(messages) - len(trimmed) + 1:-1]
+    assert _total(trimmed) <= 200
+
+    short = messages[:5]
+    assert chat_context.trim_to_budget(short, budget=200) is short
@@ -0,0 +1,104 @@
+"""db：连接池、事务、迁移和热点查询计划"""
+import sqlite3
+import threading
+
+import pytest
+
+import db
+
+# 与 app.init_db 中会话相关表的结构一致（只保留热点查询用到的列）
+SCHEMA = [
+    'CREATE TABLE user_choices (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, vehicle TEXT, bump TEXT, '
+    'location TEXT, speed REAL, survival_rate REAL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE TABLE role_analyses (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, role_name TEXT, '
+    'analysis_text TEXT, metadata TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE TABLE conversations (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, role_name TEXT, '
+    'user_message TEXT, assistant_message TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE TABLE role_debates (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, debate_id TEXT, '
+    'round_number INTEGER, role_name TEXT, content TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE TABLE comments (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, parent_id INTEGER, user_id TEXT, '
+    'content TEXT, likes INTEGER DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE TABLE collaborations (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, collaborator_id TEXT, '
+    'collaboration_type TEXT, content TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'test.db')
+    with db.transaction(path) as c:
+        for sql in SCHEMA:
+            c.execute(sql)
+    yield path
+    db.get_pool(path).close_all()
+
+
+def _user_version(path):
+    with db.connection(path) as conn:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def test_connections_use_wal(db_path):
+    with db.connection(db_path) as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_transaction_rolls_back_on_error(db_path):
+    with pytest.raises(ValueError):
+        with db.transaction(db_path) as c:
+            c.execute("INSERT INTO user_choices (session_id) VALUES ('s')")
+            raise ValueError()
+    with db.connection(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM user_choices').fetchone()[0] == 0
+
+
+def test_pool_reuses_connections_across_threads(db_path):
+    pool = db.get_pool(db_path)
+    with db.connection(db_path) as conn:
+        first = conn
+    seen = []
+
+    def worker():
+        with db.connection(db_path) as conn:
+            seen.append(conn)
+            conn.execute('SELECT 1').fetchone()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert seen == [first]
+    assert db.get_pool(db_path) is pool
+
+
+def test_migrate_is_versioned_and_idempotent(db_path):
+    assert _user_version(db_path) == 0
+    assert db.migrate(db_path) == len(db.MIGRATIONS)
+    assert _user_version(db_path) == len(db.MIGRATIONS)
+    assert db.migrate(db_path) == len(db.MIGRATIONS)
+
+    with db.connection(db_path) as conn:
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    for table in db.SESSION_TABLES:
+        assert f'idx_{table}_session_created' in indexes
+    assert 'idx_role_debates_debate_round_role' in indexes
+
+
+def test_migrated_unique_index_rejects_duplicate_statements(db_path):
+    db.migrate(db_path)
+    insert = "INSERT INTO role_debates (debate_id, round_number, role_name, content) VALUES ('d', 1, '物理学家', ?)"
+    with db.transaction(db_path) as c:
+        c.execute(insert, ('第一次',))
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.transaction(db_path) as c:
+            c.execute(insert, ('重复',))
+
+
+def test_hot_queries_use_indexes_after_migration(db_path):
+    before = {item['query']: item['ok'] for item in db.check_query_plans(db_path)}
+    assert not any(before.values())
+
+    db.migrate(db_path)
+    report = db.check_query_plans(db_path)
+    assert [item['query'] for item in report] == [name for name, _, _ in db.HOT_QUERIES]
+    failed = [item for item in report if not item['ok']]
+    assert failed == []
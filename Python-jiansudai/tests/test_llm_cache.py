@@ -0,0 +1,201 @@
+"""llm_cache.SingleFlight / AsyncSingleFlight 请求合并"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+import resilience
+from llm_cache import SingleFlight, AsyncSingleFlight
+
+
+def _run_concurrently(count, target):
+    results = [None] * count
+    errors = [None] * count
+
+    def worker(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def test_single_flight_collapses_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def func():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return {'choices': ['ok']}
+
+    results, errors = _run_concurrently(5, lambda: flight.do('k', func))
+
+    assert len(calls) == 1
+    assert errors == [None] * 5
+    assert all(result == {'choices': ['ok']} for result in results)
+    # 等待方拿到的是副本，修改不影响其他调用方
+    assert len({id(result) for result in results}) == 5
+    stats = flight.stats()
+    assert stats['calls'] == 1
+    assert stats['collapsed'] == 4
+    assert stats['in_flight'] == 0
+
+
+def test_single_flight_shares_errors():
+    flight = SingleFlight()
+    calls = []
+
+    def func():
+        calls.append(1)
+        time.sleep(0.1)
+        raise ValueError('upstream down')
+
+    results, errors = _run_concurrently(3, lambda: flight.do('k', func))
+
+    assert len(calls) == 1
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flight.stats()['errors_shared'] == 2
+    # 失败后不保留，下一次调用重新发起
+    assert flight.do('k', lambda: 'again') == 'again'
+
+
+def test_single_flight_leader_result_is_not_shared():
+    flight = SingleFlight()
+    release = threading.Event()
+    results = {}
+
+    def leader():
+        results['leader'] = flight.do('k', lambda: release.wait(5) and {'choices': ['ok']})
+        # 发起方修改自己的结果，不影响等待的调用方
+        results['leader']['choices'].append('changed')
+
+    def follower():
+        results['follower'] = flight.do('k', lambda: None)
+
+    threads = [threading.Thread(target=leader)]
+    threads[0].start()
+    while flight.stats()['in_flight'] == 0:
+        time.sleep(0.005)
+    threads.append(threading.Thread(target=follower))
+    threads[1].start()
+    while flight.stats()['collapsed'] == 0:
+        time.sleep(0.005)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results['follower'] == {'choices': ['ok']}
+
+
+def test_single_flight_follower_wait_is_bounded_by_deadline():
+    flight = SingleFlight()
+    release = threading.Event()
+    thread = threading.Thread(target=lambda: flight.do('k', lambda: release.wait(5)))
+    thread.start()
+    while flight.stats()['in_flight'] == 0:
+        time.sleep(0.005)
+
+    started = time.monotonic()
+    with pytest.raises(resilience.DeadlineExceededError):
+        flight.do('k', lambda: None, deadline=time.monotonic() + 0.1)
+    assert time.monotonic() - started < 1
+    release.set()
+    thread.join(5)
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_single_flight_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == 1
+    assert flight.do('b', lambda: 2) == 2
+    assert flight.stats()['calls'] == 2
+
+
+def _slow(calls, value, delay=0.1):
+    async def func():
+        calls.append(value)
+        await asyncio.sleep(delay)
+        return {'value': value}
+    return func
+
+
+def test_async_single_flight_collapses_concurrent_calls():
+    async def main():
+        flight = AsyncSingleFlight()
+        calls = []
+        results = await asyncio.gather(*(flight.do('k', _slow(calls, 1)) for _ in range(4)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(main())
+    assert calls == [1]
+    assert results == [{'value': 1}] * 4
+    assert flight.stats()['collapsed'] == 3
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_async_single_flight_shares_errors():
+    async def main():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def func():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            raise ValueError('upstream down')
+
+        results = await asyncio.gather(*(flight.do('k', func) for _ in range(3)), return_exceptions=True)
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(main())
+    assert calls == [1]
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.stats()['errors_shared'] == 2
+
+
+def test_async_single_flight_follower_takes_over_when_leader_cancelled():
+    async def main():
+        flight = AsyncSingleFlight()
+        calls = []
+        leader = asyncio.create_task(flight.do('k', _slow(calls, 'leader')))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(flight.do('k', _slow(calls, 'follower'))) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(leader, *followers, return_exceptions=True)
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(main())
+    assert isinstance(results[0], asyncio.CancelledError)
+    # 两个等待方共享接替者的一次调用，不继承 leader 的取消
+    assert results[1:] == [{'value': 'follower'}] * 2
+    assert calls == ['leader', 'follower']
+    stats = flight.stats()
+    assert stats['takeovers'] == 1
+    assert stats['in_flight'] == 0
+
+
+def test_async_single_flight_cancelled_follower_does_not_affect_leader():
+    async def main():
+        flight = AsyncSingleFlight()
+        calls = []
+        leader = asyncio.create_task(flight.do('k', _slow(calls, 1)))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do('k', _slow(calls, 2)))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return calls, await leader
+
+    calls, result = asyncio.run(main())
+    assert calls == [1]
+    assert result == {'value': 1}
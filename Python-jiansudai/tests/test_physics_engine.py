@@ -0,0 +1,72 @@
+"""physics_engine：单点计算与向量化网格计算结果一致"""
+import itertools
+import math
+
+import pytest
+
+import physics_engine
+from physics_engine import (
+    VEHICLE_PARAMS, SPEED_BUMP_PARAMS, LOCATION_FACTORS,
+    calculate_survival_rate, simulate, survival_rate_grid
+)
+
+np = pytest.importorskip('numpy')
+
+# 覆盖各速度风险分段的边界（30 / 50 / 70 km/h）以及速度为0
+SPEEDS = [0, 5, 29.9, 30, 42.5, 49.9, 50, 63, 69.9, 70, 85, 120]
+GRID_FIELDS = ['maxAcceleration', 'maxDisplacement', 'velocityChange', 'bounceHeight']
+
+
+def test_simulate_matches_scalar_model():
+    result = simulate('豪华轿车', '橡胶减速带', '学校门口', 40)
+    survival = calculate_survival_rate(40, '豪华轿车', '橡胶减速带', '学校门口')
+    assert result['survivalRate'] == survival['survivalRate']
+    assert result['result'] == survival['result']
+    assert result['maxAcceleration'] == survival['physics']['maxAcceleration']
+    assert 'calculation_steps' in result
+
+
+def test_simulate_invalid_parameters():
+    assert simulate('不存在的车', '橡胶减速带', '学校门口', 40) is None
+    assert simulate('豪华轿车', '不存在的减速带', '学校门口', 40) is None
+
+
+def test_simulate_zero_speed_outputs_null_t_pass():
+    result = simulate('豪华轿车', '橡胶减速带', '学校门口', 0)
+    assert result['t_pass'] is None
+    assert 0 <= result['survivalRate'] <= 100
+
+
+def test_grid_matches_scalar_model_everywhere():
+    grid = survival_rate_grid(SPEEDS)
+    assert grid['survivalRate'].shape == (len(VEHICLE_PARAMS), len(SPEED_BUMP_PARAMS), len(LOCATION_FACTORS), len(SPEEDS))
+
+    combos = itertools.product(enumerate(grid['vehicles']), enumerate(grid['bumps']),
+                               enumerate(grid['locations']), enumerate(SPEEDS))
+    for (vi, vehicle), (bi, bump), (li, location), (si, speed) in combos:
+        scalar = calculate_survival_rate(speed, vehicle, bump, location)
+        index = (vi, bi, li, si)
+        assert grid['survivalRate'][index] == scalar['survivalRate'], (vehicle, bump, location, speed)
+        for field in GRID_FIELDS:
+            assert math.isclose(grid[field][index], scalar['physics'][field], rel_tol=1e-12, abs_tol=1e-12)
+
+
+def test_grid_subset_axes_and_unknown_location_fallback():
+    grid = survival_rate_grid([30, 60], ['大卡车'], ['金属减速带'], ['未知地点'])
+    assert grid['survivalRate'].shape == (1, 1, 1, 2)
+    for si, speed in enumerate([30, 60]):
+        # 未知地点按“学校门口”计算（与单点计算一致）
+        assert grid['survivalRate'][0, 0, 0, si] == calculate_survival_rate(speed, '大卡车', '金属减速带', '未知地点')['survivalRate']
+
+
+def test_recommend_returns_ranked_combinations():
+    for target in physics_engine.RECOMMENDATION_TARGETS:
+        recommendations = physics_engine.recommend(target, 50, ['晴'])
+        assert len(recommendations) <= 3
+        scores = [item['score'] for item in recommendations]
+        assert scores == sorted(scores, reverse=True)
+        for item in recommendations:
+            assert item['weather'] == '晴'
+            assert item['preview']['survivalRate'] == calculate_survival_rate(
+                physics_engine.RECOMMENDATION_TARGETS.get(target) or 50,
+                item['vehicle'], item['bump'], item['location'])['survivalRate']
@@ -0,0 +1,88 @@
+"""rate_limiter：令牌桶、并发上限、优先级排队和拒绝模式"""
+import threading
+import time
+
+import pytest
+
+import rate_limiter
+from rate_limiter import (
+    ModelLimiter, RateLimitExceededError,
+    PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BATCH
+)
+
+
+def _wait_until(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError('等待超时')
+        time.sleep(0.005)
+
+
+def test_reject_mode_when_over_concurrency():
+    limiter = ModelLimiter('m', rps=100, burst=100, max_in_flight=1)
+    limiter.acquire(mode='reject')
+    with pytest.raises(RateLimitExceededError):
+        limiter.acquire(mode='reject')
+    assert limiter.state()['rejected'] == 1
+
+    limiter.release()
+    limiter.acquire(mode='reject')
+    assert limiter.state()['admitted'] == 2
+
+
+def test_reject_mode_when_out_of_tokens():
+    limiter = ModelLimiter('m', rps=0.001, burst=2, max_in_flight=10)
+    limiter.acquire(mode='reject')
+    limiter.acquire(mode='reject')
+    with pytest.raises(RateLimitExceededError):
+        limiter.acquire(mode='reject')
+
+
+def test_queue_times_out_at_deadline():
+    limiter = ModelLimiter('m', rps=100, burst=100, max_in_flight=1)
+    limiter.acquire()
+    started = time.monotonic()
+    with pytest.raises(RateLimitExceededError):
+        limiter.acquire(deadline=time.monotonic() + 0.1, mode='queue')
+    assert time.monotonic() - started < 1
+    state = limiter.state()
+    assert state['timed_out'] == 1
+    assert state['waiting'] == {}
+
+
+def test_queue_admits_by_priority_then_arrival():
+    limiter = ModelLimiter('m', rps=1000, burst=1000, max_in_flight=1)
+    limiter.acquire()
+    order = []
+    order_lock = threading.Lock()
+
+    def worker(name, priority):
+        limiter.acquire(priority, mode='queue')
+        with order_lock:
+            order.append(name)
+        limiter.release()
+
+    threads = []
+    for name, priority in [('batch', PRIORITY_BATCH), ('normal-1', PRIORITY_NORMAL),
+                           ('interactive', PRIORITY_INTERACTIVE), ('normal-2', PRIORITY_NORMAL)]:
+        thread = threading.Thread(target=worker, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        # 保证到达顺序
+        _wait_until(lambda: limiter.state()['queued'] == len(threads))
+
+    assert limiter.state()['waiting'] == {'batch': 1, 'normal': 2, 'interactive': 1}
+    limiter.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ['interactive', 'normal-1', 'normal-2', 'batch']
+
+
+def test_limit_context_manager_releases_on_error():
+    limiter = rate_limiter.get_limiter('test-limit-context')
+    with pytest.raises(ValueError):
+        with rate_limiter.limit('test-limit-context'):
+            assert limiter.state()['in_flight'] == 1
+            raise ValueError()
+    assert limiter.state()['in_flight'] == 0
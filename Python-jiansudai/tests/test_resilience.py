@@ -0,0 +1,122 @@
+"""resilience：熔断器状态转换、退避时间、Retry-After 解析"""
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('m', failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state()['state'] == 'closed'
+
+    breaker.before_call()
+    breaker.record_failure()
+    state = breaker.state()
+    assert state['state'] == 'open'
+    assert state['opened'] == 1
+    assert state['retry_in'] > 0
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.state()['rejected'] == 1
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker('m', failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state()['state'] == 'closed'
+    assert breaker.state()['consecutive_failures'] == 1
+
+
+def test_breaker_half_open_allows_single_probe():
+    breaker = CircuitBreaker('m', failure_threshold=1, reset_timeout=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    assert breaker.state()['state'] == 'half_open'
+
+    breaker.before_call()  # 探测请求
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # 探测进行中，其他请求仍被拒绝
+
+    breaker.record_success()
+    assert breaker.state()['state'] == 'closed'
+    breaker.before_call()
+
+
+def test_breaker_failed_probe_reopens():
+    breaker = CircuitBreaker('m', failure_threshold=2, reset_timeout=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    state = breaker.state()
+    assert state['state'] == 'open'
+    assert state['opened'] == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_released_probe_allows_next_probe():
+    breaker = CircuitBreaker('m', failure_threshold=1, reset_timeout=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    probe = breaker.before_call()
+    assert probe is not None
+    # 探测请求没有发出就退出（排队超时、被取消），不计成功也不计失败
+    breaker.release_probe(probe)
+    state = breaker.state()
+    assert state['state'] == 'half_open'
+    assert (state['successes'], state['failures']) == (0, 1)
+
+    second = breaker.before_call()
+    breaker.release_probe(probe)  # 旧凭据不会释放新的探测
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    breaker.release_probe(second)
+    assert breaker.before_call() is None
+
+
+def test_backoff_delay_prefers_retry_after():
+    assert resilience.backoff_delay(1, 2.5) == 2.5
+    assert resilience.backoff_delay(5, 0) == 0
+
+
+def test_backoff_delay_full_jitter_bounds(monkeypatch):
+    monkeypatch.setattr(resilience, 'RETRY_BASE_DELAY', 0.5)
+    monkeypatch.setattr(resilience, 'RETRY_MAX_DELAY', 3)
+    bounds = []
+    monkeypatch.setattr(resilience.random, 'uniform', lambda low, high: bounds.append((low, high)) or high)
+    delays = [resilience.backoff_delay(attempt) for attempt in range(1, 6)]
+    assert bounds == [(0, 0.5), (0, 1.0), (0, 2.0), (0, 3), (0, 3)]
+    assert delays == [0.5, 1.0, 2.0, 3, 3]
+
+
+def test_backoff_delay_is_random_within_cap():
+    for attempt in range(1, 8):
+        delay = resilience.backoff_delay(attempt)
+        assert 0 <= delay <= min(resilience.RETRY_MAX_DELAY, resilience.RETRY_BASE_DELAY * 2 ** (attempt - 1))
+
+
+def test_parse_retry_after():
+    assert resilience.parse_retry_after(None) is None
+    assert resilience.parse_retry_after('3') == 3.0
+    assert resilience.parse_retry_after('-1') == 0.0
+    assert resilience.parse_retry_after('soon') is None
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < resilience.parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 30
@@ -0,0 +1,64 @@
+"""role_collaboration：流式辩论的 on_finished 回调（续传前等待进行中的陈述结束）"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from role_collaboration import RoleDebateManager
+
+ROLES = {'a': {'name': '甲'}, 'b': {'name': '乙'}}
+
+
+def _manager(delays, calls):
+    def call_role_api(role, messages):
+        calls.append(role)
+        time.sleep(delays[role])
+        return {'choices': [{'message': {'content': f'{role}的观点'}}]}
+
+    return RoleDebateManager(call_role_api, lambda role: '', ROLES, executor=ThreadPoolExecutor(4))
+
+
+def test_on_finished_waits_for_in_flight_statements_after_close():
+    finished = threading.Event()
+    saved = []
+    manager = _manager({'a': 0.01, 'b': 0.3}, [])
+    events = manager.stream_interactive_debate(
+        {}, ['a', 'b'], rounds=2, mode='parallel',
+        on_statement=saved.append, on_finished=finished.set
+    )
+    assert next(events)['role'] == 'a'
+    # 客户端断开：乙的陈述仍在生成，结束前不调用 on_finished
+    events.close()
+    assert not finished.is_set()
+    assert finished.wait(2)
+    assert sorted(stmt['role'] for stmt in saved) == ['a', 'b']
+
+
+def test_on_finished_called_once_on_completion():
+    calls = []
+    finished = []
+    manager = _manager({'a': 0, 'b': 0}, calls)
+    completed = [{'role': 'a', 'role_name': '甲', 'round': 1, 'content': '已有'}]
+    events = list(manager.stream_interactive_debate(
+        {}, ['a', 'b'], rounds=1, completed=completed, on_finished=lambda: finished.append(1)
+    ))
+    assert events[-1]['type'] == 'complete'
+    assert calls == ['b']
+    assert finished == [1]
+
+
+def test_async_on_finished_waits_for_in_flight_statements_after_close():
+    async def call_role_api(role, messages):
+        await asyncio.sleep({'a': 0.01, 'b': 0.2}[role])
+        return {'choices': [{'message': {'content': f'{role}的观点'}}]}
+
+    async def main():
+        finished = asyncio.Event()
+        manager = RoleDebateManager(call_role_api, lambda role: '', ROLES)
+        events = manager.astream_interactive_debate({}, ['a', 'b'], rounds=1, on_finished=finished.set)
+        assert (await events.__anext__())['role'] == 'a'
+        await events.aclose()
+        assert not finished.is_set()
+        await asyncio.wait_for(finished.wait(), 2)
+
+    asyncio.run(main())
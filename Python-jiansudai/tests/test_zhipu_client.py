@@ -0,0 +1,122 @@
+"""zhipu_client：对本地模拟服务（mock_zhipu_server）的重试、限流和熔断"""
+import threading
+import time
+
+import pytest
+
+import rate_limiter
+import resilience
+import zhipu_client
+from mock_zhipu_server import MockZhipuServer
+
+MESSAGES = [{'role': 'user', 'content': '你好'}]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = MockZhipuServer(seed=1).start()
+    monkeypatch.setattr(zhipu_client, 'ZHIPU_API_URL', server.url)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def model(request, monkeypatch):
+    """每个测试使用独立的模型名，限流器和熔断器互不影响"""
+    name = f'test-{request.node.name}'
+    monkeypatch.setitem(rate_limiter._limiters, name, rate_limiter.ModelLimiter(name, rps=100, burst=100, max_in_flight=1))
+    monkeypatch.setitem(resilience._breakers, name, resilience.CircuitBreaker(name, failure_threshold=3, reset_timeout=60))
+    return name
+
+
+def test_call_and_stream(server, model):
+    result = zhipu_client.call_zhipu_api(MESSAGES, model=model)
+    assert result['choices'][0]['message']['content'].startswith('【第1轮】')
+
+    text = ''.join(zhipu_client.stream_zhipu_api(MESSAGES, model=model))
+    assert text == result['choices'][0]['message']['content']
+    assert rate_limiter.get_limiter(model).state()['in_flight'] == 0
+
+
+def test_retries_retryable_status_with_a_token_per_attempt(server, model):
+    server.error_rate = 1.0
+    server.error_statuses = [429]
+    server.retry_after = 0.2
+    limiter = rate_limiter.get_limiter(model)
+    result = {}
+
+    def call():
+        result['value'] = zhipu_client.call_zhipu_api(MESSAGES, model=model)
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    deadline = time.monotonic() + 2
+    while server.stats()['by_status'].get('429', 0) < 1 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    time.sleep(0.05)
+    # 退避等待期间不占用并发名额（max_in_flight=1），其他调用可以进行
+    assert limiter.state()['in_flight'] == 0
+    server.error_rate = 0.0
+    assert 'choices' in zhipu_client.call_zhipu_api(MESSAGES, model=model)
+
+    thread.join(5)
+    assert 'choices' in result['value']
+    # 首次尝试 + 重试 + 另一个调用，各自获取令牌
+    assert limiter.state()['admitted'] == 3
+    assert limiter.state()['in_flight'] == 0
+
+
+def test_non_retryable_status_raises_immediately(server, model):
+    server.error_rate = 1.0
+    server.error_statuses = [400]
+    with pytest.raises(Exception, match='400'):
+        zhipu_client.call_zhipu_api(MESSAGES, model=model)
+    assert server.stats()['total'] == 1
+    # 4xx 说明上游可用，不计入熔断
+    assert resilience.get_breaker(model).state()['state'] == 'closed'
+
+
+def test_breaker_opens_after_repeated_failures(server, model, monkeypatch):
+    monkeypatch.setattr(resilience, 'RETRY_BASE_DELAY', 0.001)
+    monkeypatch.setattr(resilience, 'MAX_RETRIES', 1)
+    server.error_rate = 1.0
+    server.error_statuses = [503]
+    for _ in range(2):
+        with pytest.raises(Exception):
+            zhipu_client.call_zhipu_api(MESSAGES, model=model)
+    assert resilience.get_breaker(model).state()['state'] == 'open'
+
+    calls = server.stats()['total']
+    with pytest.raises(resilience.CircuitOpenError):
+        zhipu_client.call_zhipu_api(MESSAGES, model=model)
+    assert server.stats()['total'] == calls
+    assert rate_limiter.get_limiter(model).state()['in_flight'] == 0
+
+
+def test_half_open_probe_is_released_when_limiter_rejects(server, model, monkeypatch):
+    breaker = resilience.CircuitBreaker(model, failure_threshold=1, reset_timeout=0.05)
+    monkeypatch.setitem(resilience._breakers, model, breaker)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state()['state'] == 'half_open'
+
+    # 并发名额被占满，探测请求排队到截止时间被拒绝
+    limiter = rate_limiter.get_limiter(model)
+    limiter.acquire()
+    with pytest.raises(rate_limiter.RateLimitExceededError):
+        zhipu_client.call_zhipu_api(MESSAGES, model=model, deadline=time.monotonic() + 0.1)
+    limiter.release()
+    assert server.stats()['total'] == 0
+
+    # 熔断器没有卡在 half_open，下一次调用可以探测并恢复
+    assert 'choices' in zhipu_client.call_zhipu_api(MESSAGES, model=model)
+    assert breaker.state()['state'] == 'closed'
+
+
+def test_stream_releases_slot_when_closed_early(server, model):
+    limiter = rate_limiter.get_limiter(model)
+    stream = zhipu_client.stream_zhipu_api(MESSAGES, model=model)
+    next(stream)
+    assert limiter.state()['in_flight'] == 1
+    stream.close()
+    assert limiter.state()['in_flight'] == 0
@@ -0,0 +1,188 @@
+"""
+异步持久化模块
+审计类记录（role_analyses / conversations）先进入有界队列，由后台线程批量写入：
+每满 BATCH_SIZE 条或每隔 FLUSH_INTERVAL_MS 毫秒在一个事务中提交一次，进程退出时刷新剩余记录。
+PERSISTENCE_MODE=sync 时退回到请求内同步写入
+"""
+import os
+import queue
+import atexit
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import db
+
+# 每批最多写入的记录数
+BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '100'))
+# 批次最长等待时间（毫秒）
+FLUSH_INTERVAL_MS = int(os.getenv('WRITE_BEHIND_FLUSH_MS', '200'))
+# 队列中最多积压的记录数，超出后由调用线程同步写入（反压）
+MAX_PENDING = int(os.getenv('WRITE_BEHIND_MAX_PENDING', '10000'))
+# 持久化模式：async（批量异步写入）/ sync（请求返回前同步写入）
+PERSISTENCE_MODE = os.getenv('PERSISTENCE_MODE', 'async').lower()
+
+INSERT_SQL = {
+    'role_analyses': '''
+        INSERT INTO role_analyses (session_id, role_name, analysis_text, metadata)
+        VALUES (?, ?, ?, ?)
+    ''',
+    'conversations': '''
+        INSERT INTO conversations (session_id, role_name, user_message, assistant_message)
+        VALUES (?, ?, ?, ?)
+    ''',
+}
+
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """批量异步写入器"""
+
+    def __init__(self, db_path: str = db.DB_PATH, batch_size: int = BATCH_SIZE,
+                 flush_interval_ms: int = FLUSH_INTERVAL_MS, max_pending: int = MAX_PENDING,
+                 mode: str = PERSISTENCE_MODE):
+        if mode not in ('async', 'sync'):
+            raise ValueError(f'未知的持久化模式: {mode}')
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.mode = mode
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'written': 0, 'failed': 0, 'batches': 0, 'overflow': 0}
+
+    def submit(self, table: str, params: Tuple):
+        """
+        提交一条记录
+
+        sync 模式下立即写入并向调用方抛出数据库异常；
+        async 模式下入队即返回，队列已满时由调用线程直接写入
+        """
+        if table not in INSERT_SQL:
+            raise ValueError(f'不支持异步写入的表: {table}')
+        item = (table, params)
+
+        if self.mode == 'sync':
+            self._write([item], raise_errors=True)
+            return
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._stats['overflow'] += 1
+            self._write([item])
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待队列中已提交的记录全部落盘，返回是否在超时前完成"""
+        if self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10):
+        """刷新剩余记录并停止后台线程"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """写入统计"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['mode'] = self.mode
+        stats['pending'] = self._queue.qsize()
+        return stats
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """后台线程：攒批并写入"""
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, batch, raise_errors: bool = False):
+        """在一个事务中写入一批记录"""
+        grouped = {}
+        for table, params in batch:
+            grouped.setdefault(table, []).append(params)
+        try:
+            with db.transaction(self.db_path) as c:
+                for table, rows in grouped.items():
+                    c.executemany(INSERT_SQL[table], rows)
+        except Exception as e:
+            with self._lock:
+                self._stats['failed'] += len(batch)
+            if raise_errors:
+                raise
+            print(f"警告：批量保存 {len(batch)} 条记录到数据库失败: {e}")
+            return
+        with self._lock:
+            self._stats['written'] += len(batch)
+            self._stats['batches'] += 1
+
+
+# 全局实例
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer() -> WriteBehindWriter:
+    """获取写入器实例（单例）"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = WriteBehindWriter()
+                atexit.register(_writer.close)
+    return _writer
+
+
+def record_role_analysis(session_id: str, role_name: str, analysis_text: str, metadata: str):
+    """记录一条角色分析结果（role_analyses）"""
+    get_writer().submit('role_analyses', (session_id, role_name, analysis_text, metadata))
+
+
+def record_conversation(session_id: str, role_name: str, user_message: str, assistant_message: str):
+    """记录一条对话（conversations）"""
+    get_writer().submit('conversations', (session_id, role_name, user_message, assistant_message))
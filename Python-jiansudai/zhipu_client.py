@@ -0,0 +1,231 @@
+"""
+智谱AI 客户端模块
+所有角色模块（ren/*.py）和 app.call_role_api 共享的 HTTP 客户端：
+使用 keep-alive 连接池复用到 open.bigmodel.cn 的 TCP+TLS 连接，
+并统一设置连接/读取超时和单主机连接数上限；
+按模型限流（见 rate_limiter.py），429/5xx/超时按退避重试，整个调用受截止时间约束，并按模型熔断（见 resilience.py）
+"""
+import os
+import json
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+import resilience
+import rate_limiter
+
+# 统一配置管理：从 config.py 导入 API 密钥
+try:
+    from config import ZHIPU_API_KEY
+except ImportError:
+    # 如果 config.py 不存在，使用默认值（生产环境应使用环境变量）
+    ZHIPU_API_KEY = os.getenv('ZHIPU_API_KEY', "ab16c0b7809545e99d60ae7b73023ba4.YwWPxLoEG60CWy6k")
+
+ZHIPU_API_URL = os.getenv('ZHIPU_API_URL', "https://open.bigmodel.cn/api/paas/v4/chat/completions")
+
+# 超时配置（秒）：连接超时 / 读取超时
+CONNECT_TIMEOUT = float(os.getenv('ZHIPU_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.getenv('ZHIPU_READ_TIMEOUT', '60'))
+
+# 连接池配置：单主机保留的连接数，应与服务器线程数一致
+POOL_MAXSIZE = int(os.getenv('ZHIPU_POOL_MAXSIZE', '32'))
+# 缓存连接池的主机数量
+POOL_CONNECTIONS = int(os.getenv('ZHIPU_POOL_CONNECTIONS', '4'))
+
+
+def _create_session():
+    """创建带连接池的 Session"""
+    session = requests.Session()
+    # 不使用 pool_block：requests 等待空闲连接时没有超时，会绕过请求的截止时间。
+    # 并发由 rate_limiter 按模型限制，超出 POOL_MAXSIZE 的连接临时新建、用完即关闭
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        "Authorization": ZHIPU_API_KEY,
+        "Content-Type": "application/json"
+    })
+    return session
+
+
+# 进程内共享的 Session（urllib3 连接池是线程安全的）
+_session = _create_session()
+
+
+def get_session():
+    """获取共享的 Session"""
+    return _session
+
+
+def call_zhipu_api(messages, model="glm-4-flash", temperature=0.5, timeout=None, deadline=None, priority=None):
+    """
+    调用智谱AI对话补全接口
+
+    Args:
+        messages: 消息列表
+        model: 模型名称
+        temperature: 采样温度
+        timeout: (连接超时, 读取超时)，为None时使用默认配置
+        deadline: 截止时间（time.monotonic() 时间戳，含限流排队和重试），为None时使用默认时长
+        priority: 限流排队优先级（见 rate_limiter），为None时为普通优先级
+
+    Returns:
+        API返回的JSON数据
+    """
+    data = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature
+    }
+
+    if deadline is None:
+        deadline = resilience.make_deadline()
+    response = _post_with_retry(data, timeout, deadline, priority=priority)
+    return response.json()
+
+
+def stream_zhipu_api(messages, model="glm-4-flash", temperature=0.5, timeout=None, deadline=None, priority=None):
+    """
+    以流式方式调用智谱AI对话补全接口（stream: true，SSE）
+
+    只在收到响应头之前重试；开始输出后的中断直接抛出异常
+
+    Args:
+        messages: 消息列表
+        model: 模型名称
+        temperature: 采样温度
+        timeout: (连接超时, 读取超时)，为None时使用默认配置
+        deadline: 截止时间（time.monotonic() 时间戳，含限流排队和重试），为None时使用默认时长
+        priority: 限流排队优先级（见 rate_limiter），为None时为普通优先级
+
+    Yields:
+        模型逐步生成的文本片段
+    """
+    data = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "stream": True
+    }
+
+    if deadline is None:
+        deadline = resilience.make_deadline()
+    response = _post_with_retry(data, timeout, deadline, stream=True, priority=priority)
+    breaker = resilience.get_breaker(model)
+
+    # 并发名额一直占用到流式输出结束
+    try:
+        with response:
+            # SSE 响应通常不带 charset，requests 会按 ISO-8859-1 解码，这里显式指定
+            response.encoding = 'utf-8'
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    payload = line[len('data:'):].strip()
+                    if payload == '[DONE]':
+                        break
+                    chunk = json.loads(payload)
+                    choices = chunk.get('choices') or []
+                    if not choices:
+                        continue
+                    content = choices[0].get('delta', {}).get('content')
+                    if content:
+                        yield content
+            except requests.exceptions.Timeout:
+                breaker.record_failure()
+                raise Exception("API请求超时，请稍后重试")
+            except requests.exceptions.RequestException as e:
+                breaker.record_failure()
+                raise Exception(f"网络请求失败: {str(e)}")
+    finally:
+        rate_limiter.get_limiter(model).release()
+
+
+def _post_with_retry(data, timeout=None, deadline=None, stream=False, priority=None):
+    """
+    发送请求：429/5xx/超时/连接错误时退避重试，直到成功、重试次数用完或到达截止时间
+    每次尝试前按模型获取一个限流令牌和并发名额（见 rate_limiter），退避等待期间不占用并发名额
+
+    Returns:
+        状态码为200的响应；stream=True 时响应体尚未读取，并发名额由调用方在读完后
+        通过 rate_limiter.get_limiter(model).release() 归还
+    """
+    breaker = resilience.get_breaker(data["model"])
+    limiter = rate_limiter.get_limiter(data["model"])
+    priority = rate_limiter.PRIORITY_NORMAL if priority is None else priority
+    connect_timeout, read_timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    if deadline is None:
+        deadline = resilience.make_deadline()
+
+    attempt = 0
+    while True:
+        if resilience.remaining(deadline) <= 0:
+            raise resilience.DeadlineExceededError("API请求超时，请稍后重试")
+
+        limiter.acquire(priority, deadline)
+        keep_slot = False
+        probe = None
+        try:
+            # 先取得限流名额再占用熔断器的探测名额，排队被拒绝时不会占住 half_open
+            probe = breaker.before_call()
+            # 排队也计入截止时间
+            left = resilience.remaining(deadline)
+            if left <= 0:
+                raise resilience.DeadlineExceededError("API请求超时，请稍后重试")
+            retry_after = None
+            try:
+                response = _session.post(
+                    ZHIPU_API_URL,
+                    json=data,
+                    timeout=(min(connect_timeout, left), min(read_timeout, left)),
+                    stream=stream
+                )
+            except requests.exceptions.Timeout:
+                breaker.record_failure()
+                error = Exception("API请求超时，请稍后重试")
+            except requests.exceptions.RequestException as e:
+                breaker.record_failure()
+                error = Exception(f"网络请求失败: {str(e)}")
+            else:
+                if response.status_code == 200:
+                    breaker.record_success()
+                    keep_slot = stream
+                    return response
+                if response.status_code not in resilience.RETRYABLE_STATUS:
+                    # 其他 4xx 是请求本身的问题，说明上游可用
+                    breaker.record_success()
+                    with response:
+                        _raise_api_error(response)
+                breaker.record_failure()
+                retry_after = resilience.parse_retry_after(response.headers.get('Retry-After'))
+                with response:
+                    try:
+                        _raise_api_error(response)
+                    except Exception as e:
+                        error = e
+        finally:
+            # 截止时间到达、被取消等没有记录结果的退出，归还探测名额
+            breaker.release_probe(probe)
+            if not keep_slot:
+                limiter.release()
+
+        attempt += 1
+        delay = resilience.backoff_delay(attempt, retry_after)
+        if attempt > resilience.MAX_RETRIES or delay >= resilience.remaining(deadline):
+            raise error
+        time.sleep(delay)
+
+
+def _raise_api_error(response):
+    """将非200响应转换为异常"""
+    error_msg = f"API调用失败: {response.status_code}"
+    try:
+        error_detail = response.json()
+        error_msg += f", {error_detail}"
+    except ValueError:
+        error_msg += f", {response.text[:200]}"  # 只显示前200字符
+    raise Exception(error_msg)
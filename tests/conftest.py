@@ -0,0 +1,118 @@
+"""
+xunfei_tts 单元测试公共配置
+在仓库根目录运行：python -m pytest -q tests
+
+测试不连接讯飞服务：websocket.create_connection 被替换为 FakeSocket，按请求内容返回假的音频帧。
+未安装 websocket-client 时注册一个只含 xunfei_tts 用到的名字的模块
+（否则 xunfei_tts 在导入时会尝试 pip install）
+"""
+import base64
+import json
+import os
+import sys
+import threading
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import websocket  # noqa: F401
+except ImportError:
+    websocket = types.ModuleType('websocket')
+
+    class WebSocketException(Exception):
+        pass
+
+    class WebSocketConnectionClosedException(WebSocketException):
+        pass
+
+    class WebSocketTimeoutException(WebSocketException):
+        pass
+
+    class WebSocketApp(object):
+        def __init__(self, *args, **kwargs):
+            raise RuntimeError('测试中不使用 WebSocketApp')
+
+    def create_connection(*args, **kwargs):
+        raise RuntimeError('测试应使用 fake_ws 夹具')
+
+    websocket.WebSocketException = WebSocketException
+    websocket.WebSocketConnectionClosedException = WebSocketConnectionClosedException
+    websocket.WebSocketTimeoutException = WebSocketTimeoutException
+    websocket.WebSocketApp = WebSocketApp
+    websocket.create_connection = create_connection
+    sys.modules['websocket'] = websocket
+
+
+class FakeSocket(object):
+    """
+    假的讯飞TTS连接：收到合成请求后把 FakeServer.audio(text) 分成两帧返回
+    文本以 ERR 开头时返回错误码；以 DROP 开头时在返回音频之前断开
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.connected = True
+        self.timeout = None
+        self._frames = []
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def send(self, data):
+        if not self.connected:
+            raise websocket.WebSocketConnectionClosedException('连接已关闭')
+        request = json.loads(data)
+        text = base64.b64decode(request['payload']['text']['text']).decode('utf-8')
+        with self.server.lock:
+            self.server.requests.append(text)
+        if text.startswith('ERR'):
+            self._frames = [{'header': {'code': 10001, 'message': 'bad'}}]
+            return
+        if text.startswith('DROP'):
+            self._frames = []
+            return
+        audio = FakeServer.audio(text)
+        half = len(audio) // 2
+        self._frames = [
+            {'header': {'code': 0}, 'payload': {'audio': {'audio': base64.b64encode(part).decode(), 'status': status}}}
+            for part, status in ((audio[:half], 1), (audio[half:], 2))
+        ]
+
+    def recv(self):
+        if not self._frames:
+            self.connected = False
+            raise websocket.WebSocketConnectionClosedException('连接已被服务端关闭')
+        return json.dumps(self._frames.pop(0))
+
+    def close(self, **kwargs):
+        self.connected = False
+
+
+class FakeServer(object):
+    """记录建立的连接和收到的合成文本"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.requests = []
+
+    @staticmethod
+    def audio(text):
+        """为一段文本返回的音频内容"""
+        return f'AUDIO[{text}]'.encode('utf-8')
+
+    def create_connection(self, url, timeout=None, **kwargs):
+        with self.lock:
+            self.connects += 1
+        return FakeSocket(self)
+
+
+@pytest.fixture
+def fake_ws(monkeypatch):
+    import xunfei_tts
+    server = FakeServer()
+    monkeypatch.setattr(xunfei_tts.websocket, 'create_connection', server.create_connection)
+    return server
@@ -0,0 +1,281 @@
+"""xunfei_tts：句子切分、MP3时长、音频缓存、合成客户端和批量合成"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import xunfei_tts
+from xunfei_tts import (
+    AudioCache, SentenceSplitter, TTSConnectionPool, TTSError, XunfeiTTSClient, mp3_duration
+)
+
+
+# ========== SentenceSplitter ==========
+
+def test_splitter_splits_on_sentence_endings():
+    splitter = SentenceSplitter(min_chars=2, max_chars=60)
+    assert splitter.feed('第一句话。第二') == ['第一句话。']
+    assert splitter.feed('句话！第三句') == ['第二句话！']
+    assert splitter.flush() == ['第三句']
+    assert splitter.flush() == []
+
+
+def test_splitter_keeps_closing_quotes_with_sentence():
+    splitter = SentenceSplitter(min_chars=2, max_chars=60)
+    # 句末标点在缓冲区末尾时等待下一段（可能还有引号）
+    assert splitter.feed('他说：“走吧。') == []
+    assert splitter.feed('”然后离开了。接着') == ['他说：“走吧。”', '然后离开了。']
+
+
+def test_splitter_merges_short_sentences():
+    splitter = SentenceSplitter(min_chars=4, max_chars=60)
+    assert splitter.feed('好。是的。我们出发吧！下') == ['好。是的。', '我们出发吧！']
+
+
+def test_splitter_cuts_long_text_at_clause_breaks():
+    splitter = SentenceSplitter(min_chars=2, max_chars=10)
+    sentences = splitter.feed('一二三四五，六七八九十一二三四五六七八九十一二三')
+    assert sentences[0] == '一二三四五，'
+    assert all(len(sentence) <= 10 for sentence in sentences)
+    assert ''.join(sentences + splitter.flush()) == '一二三四五，六七八九十一二三四五六七八九十一二三'
+
+
+# ========== mp3_duration ==========
+
+# MPEG-1 Layer III，128kbps，44.1kHz：帧长 417 字节，每帧 1152 个采样
+MPEG1_HEADER = bytes.fromhex('fffb9000')
+MPEG1_FRAME = MPEG1_HEADER + b'\x00' * (417 - 4)
+# MPEG-2 Layer III，64kbps，24kHz（讯飞 lame 输出）：帧长 192 字节，每帧 576 个采样
+MPEG2_HEADER = bytes.fromhex('fff38400')
+MPEG2_FRAME = MPEG2_HEADER + b'\x00' * (192 - 4)
+
+
+def test_mp3_duration_mpeg1(tmp_path):
+    path = tmp_path / 'a.mp3'
+    path.write_bytes(MPEG1_FRAME * 100)
+    assert mp3_duration(str(path)) == round(100 * 1152 / 44100, 3)
+
+
+def test_mp3_duration_mpeg2_with_id3_tag(tmp_path):
+    path = tmp_path / 'b.mp3'
+    tag_body = b'\x00' * 20
+    id3 = b'ID3\x04\x00\x00' + bytes([0, 0, 0, len(tag_body)]) + tag_body
+    path.write_bytes(id3 + MPEG2_FRAME * 50)
+    assert mp3_duration(str(path)) == round(50 * 576 / 24000, 3)
+
+
+def test_mp3_duration_skips_garbage_and_rejects_non_mp3(tmp_path):
+    path = tmp_path / 'c.mp3'
+    path.write_bytes(b'junk' + MPEG2_FRAME * 10)
+    assert mp3_duration(str(path)) == round(10 * 576 / 24000, 3)
+    path.write_bytes(b'not an mp3 file at all')
+    assert mp3_duration(str(path)) is None
+
+
+# ========== AudioCache ==========
+
+def _audio_file(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(name.encode('utf-8')[:1] * size)
+    return str(path)
+
+
+def test_cache_put_and_get(tmp_path):
+    cache = AudioCache(str(tmp_path / 'cache'))
+    assert cache.get('k1') is None
+    path = cache.put('k1', _audio_file(tmp_path, 'a', 10))
+    assert path == cache.path_for('k1')
+    assert cache.get('k1') == b'a' * 10
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['hits'], stats['misses']) == (1, 10, 1, 1)
+
+
+def test_cache_put_links_instead_of_copying(tmp_path):
+    cache = AudioCache(str(tmp_path / 'cache'))
+    source = _audio_file(tmp_path, 'a', 10)
+    path = cache.put('k1', source)
+    assert os.path.samefile(path, source)
+    # 删除原文件或淘汰缓存条目都不影响另一方
+    os.remove(source)
+    assert cache.get('k1') == b'a' * 10
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = AudioCache(str(tmp_path / 'cache'), max_bytes=25)
+    cache.put('a', _audio_file(tmp_path, 'a', 10))
+    time.sleep(0.01)
+    cache.put('b', _audio_file(tmp_path, 'b', 10))
+    time.sleep(0.01)
+    assert cache.get('a') is not None  # a 最近被使用，淘汰 b
+    time.sleep(0.01)
+    cache.put('c', _audio_file(tmp_path, 'c', 10))
+    assert cache.get('b') is None
+    assert not os.path.exists(cache.path_for('b'))
+    assert cache.get('a') == b'a' * 10
+    assert cache.get('c') == b'c' * 10
+
+
+def test_cache_never_evicts_inserted_entry(tmp_path):
+    cache = AudioCache(str(tmp_path / 'cache'), max_bytes=2)
+    first = cache.put('k1', _audio_file(tmp_path, 'a', 6))
+    assert os.path.exists(first)
+    second = cache.put('k2', _audio_file(tmp_path, 'b', 6))
+    assert os.path.exists(second)
+    assert not os.path.exists(first)
+    assert cache.stats()['entries'] == 1
+
+
+def test_cache_returned_audio_survives_eviction(tmp_path):
+    cache = AudioCache(str(tmp_path / 'cache'), max_bytes=2)
+    cache.put('k1', _audio_file(tmp_path, 'a', 6))
+    audio = cache.get('k1')
+    cache.put('k2', _audio_file(tmp_path, 'b', 6))
+    assert audio == b'a' * 6
+    assert cache.get('k1') is None
+
+
+def test_cache_expires_old_entries(tmp_path):
+    cache = AudioCache(str(tmp_path / 'cache'), max_age=0.05)
+    cache.put('k1', _audio_file(tmp_path, 'a', 4))
+    time.sleep(0.06)
+    assert cache.get('k1') is None
+    assert not os.path.exists(cache.path_for('k1'))
+    assert cache.stats()['entries'] == 0
+
+
+def test_cache_treats_missing_file_as_miss(tmp_path):
+    cache = AudioCache(str(tmp_path / 'cache'))
+    os.remove(cache.put('k1', _audio_file(tmp_path, 'a', 4)))
+    assert cache.get('k1') is None
+    assert cache.stats()['entries'] == 0
+
+
+# ========== XunfeiTTSClient ==========
+
+@pytest.fixture
+def client(tmp_path, fake_ws):
+    client = XunfeiTTSClient(audio_dir=str(tmp_path / 'audio'), cache=AudioCache(str(tmp_path / 'cache')),
+                             pool=TTSConnectionPool(size=0), timeout=5)
+    yield client
+    client.close()
+
+
+def test_client_synthesizes_to_file(client, fake_ws, tmp_path):
+    chunks = []
+    path = client.synthesize('你好', on_chunk=chunks.append)
+    assert open(path, 'rb').read() == fake_ws.audio('你好')
+    assert b''.join(chunks) == fake_ws.audio('你好')
+    assert len(chunks) == 2
+    assert fake_ws.connects == 1
+    assert not [name for name in os.listdir(tmp_path / 'audio') if name.endswith('.part')]
+
+
+def test_client_cache_hit_skips_connection(client, fake_ws, tmp_path):
+    first = client.synthesize('你好')
+    chunks = []
+    second = client.synthesize('你好', output_path=str(tmp_path / 'copy.mp3'), on_chunk=chunks.append)
+    assert second == str(tmp_path / 'copy.mp3')
+    assert open(second, 'rb').read() == open(first, 'rb').read()
+    assert chunks == [fake_ws.audio('你好')]
+    assert fake_ws.connects == 1
+    # 不同的合成参数是不同的缓存条目
+    client.synthesize('你好', tts_args={'speed': 70})
+    assert fake_ws.connects == 2
+
+
+def test_client_cache_miss_writes_audio_once(client):
+    path = client.synthesize('你好')
+    assert os.path.samefile(path, client.cache.path_for(xunfei_tts.audio_cache_key(xunfei_tts.Ws_Param(
+        client.appid, client.api_key, client.api_secret, '你好'))))
+
+
+def test_client_cache_hit_with_bad_output_path_fails_future(client, tmp_path):
+    client.synthesize('你好')
+    future = client.submit('你好', output_path=str(tmp_path / 'missing' / 'out.mp3'))
+    with pytest.raises(FileNotFoundError):
+        future.result(5)
+
+
+def test_client_rename_failure_fails_future(client, fake_ws, tmp_path, monkeypatch):
+    def fail(src, dst):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(xunfei_tts.os, 'replace', fail)
+    future = client.submit('你好')
+    with pytest.raises(TTSError, match='disk full'):
+        future.result(5)
+    assert not [name for name in os.listdir(tmp_path / 'audio') if name.endswith('.part')]
+
+
+def test_client_on_complete_error_does_not_block_result(client, monkeypatch):
+    def fail(key, path):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(client, '_store', fail)
+    assert os.path.exists(client.submit('你好').result(5))
+
+
+def test_client_cache_lookup_runs_on_worker_thread(client, monkeypatch):
+    client.synthesize('你好')
+    threads = []
+    get = client.cache.get
+    monkeypatch.setattr(client.cache, 'get', lambda key: threads.append(threading.current_thread()) or get(key))
+
+    async def main():
+        return await client.synthesize_async('你好')
+
+    assert asyncio.run(main())
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_client_reports_server_errors(client):
+    with pytest.raises(TTSError, match='10001'):
+        client.synthesize('ERR 错误')
+
+
+def test_client_retries_connection_closed_before_audio(client, fake_ws):
+    with pytest.raises(TTSError):
+        client.synthesize('DROP 断开')
+    assert fake_ws.connects == xunfei_tts.TTS_CONNECT_RETRIES + 1
+
+
+def test_client_concurrent_requests_get_their_own_audio(client, fake_ws):
+    futures = {text: client.submit(text) for text in (f'第{i}句' for i in range(12))}
+    for text, future in futures.items():
+        assert open(future.result(5), 'rb').read() == fake_ws.audio(text)
+
+
+# ========== render_batch ==========
+
+def _write_input(path, items):
+    with open(path, 'w', encoding='utf-8') as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+
+def test_render_batch_resumes_and_rerenders_changed_text(tmp_path, fake_ws):
+    input_path = str(tmp_path / 'in.jsonl')
+    out_dir = str(tmp_path / 'out')
+    _write_input(input_path, [{'id': 'a', 'text': '第一条'}, {'id': 'b', 'text': '第二条'}, {'id': 'e', 'text': 'ERR'}])
+    with open(input_path, 'a', encoding='utf-8') as f:
+        f.write('{bad json\n')
+
+    summary = xunfei_tts.render_batch(input_path, out_dir, workers=2, use_cache=False)
+    assert summary == {'total': 3, 'skipped': 0, 'succeeded': 2, 'failed': 2}
+    records = xunfei_tts.load_manifest(os.path.join(out_dir, 'manifest.jsonl'))
+    assert records['a']['status'] == 'ok'
+    assert records['a']['cache_key']
+    assert open(records['a']['file'], 'rb').read() == fake_ws.audio('第一条')
+    assert records['e']['status'] == 'failed'
+
+    # 再次运行：跳过已完成的条目，重试失败的条目，文本改变的条目重新合成
+    _write_input(input_path, [{'id': 'a', 'text': '第一条（修改）'}, {'id': 'b', 'text': '第二条'}, {'id': 'e', 'text': 'ERR'}])
+    fake_ws.requests.clear()
+    summary = xunfei_tts.render_batch(input_path, out_dir, workers=2, use_cache=False)
+    assert summary['skipped'] == 1
+    assert sorted(fake_ws.requests) == sorted(['第一条（修改）', 'ERR'])
+    records = xunfei_tts.load_manifest(os.path.join(out_dir, 'manifest.jsonl'))
+    assert open(records['a']['file'], 'rb').read() == fake_ws.audio('第一条（修改）')
@@ -1,6 +1,7 @@
 # -*- coding:utf-8 -*-
 
 # 科大讯飞TTS模块
+# 批量合成（不播放）: python xunfei_tts.py batch texts.jsonl 输出文件夹 -w 8
 
 
 
@@ -32,6 +33,8 @@ import ssl
 
 import os
 
+import sys
+
 import platform
 
 from wsgiref.handlers import format_date_time
@@ -40,7 +43,23 @@ from datetime import datetime
 
 from time import mktime
 
-import _thread as thread
+import threading
+
+import uuid
+
+import asyncio
+
+import traceback
+
+import queue
+
+import tempfile
+
+import shutil
+
+import sqlite3
+
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 
 
 
@@ -78,6 +97,37 @@ AUDIO_SAVE_DIR = 'tts_audio'  # 音频保存文件夹
 
 SAVE_AUDIO = True  # 是否保存音频文件到本地（True=保存，False=不保存）
 
+# ========== 音频缓存配置 ==========
+
+TTS_CACHE_ENABLED = True  # 是否缓存合成结果（相同文本和参数不再请求讯飞）
+
+TTS_CACHE_DIR = 'tts_cache'  # 缓存文件夹（音频文件和索引）
+
+TTS_CACHE_MAX_BYTES = 500 * 1024 * 1024  # 缓存总大小上限（字节），超出时淘汰最久未使用的音频
+
+TTS_CACHE_MAX_AGE = 30 * 24 * 3600  # 缓存保存期限（秒）
+
+# ========== 合成并发配置 ==========
+
+TTS_MAX_WORKERS = 4  # 同时进行的合成请求数上限
+
+TTS_TIMEOUT = 15  # 单次合成的超时时间（秒）
+
+# ========== 连接池配置 ==========
+
+TTS_POOL_SIZE = 2  # 有请求时预先建立的空闲连接数（0=不预先建立）
+
+TTS_POOL_MAX_IDLE = 8  # 空闲连接的最长保留时间（秒），讯飞服务端会断开长时间没有数据的连接
+
+TTS_URL_TTL = 240  # 签名URL的复用时间（秒），讯飞要求签名时间与服务器时间相差不超过300秒
+
+TTS_CONNECT_RETRIES = 1  # 连接失效且尚未收到音频时，换新连接重试的次数
+
+TTS_MIN_SENTENCE_CHARS = 4  # 边生成边朗读时，短于该长度的句子与下一句合并
+
+TTS_MAX_SENTENCE_CHARS = 60  # 边生成边朗读时，超过该长度仍没有句末标点则在逗号处切分
+
+
 # ============================================================
 
 
@@ -218,102 +268,550 @@ def assemble_ws_auth_url(requset_url, method="GET", api_key="", api_secret=""):
 
 
 
-# TTS全局变量
-
-tts_audio_file = None
-
-tts_complete = False
-
-
-
-def on_message(ws, message):
-
-    global tts_audio_file, tts_complete
-
-    try:
-
-        message = json.loads(message)
-
-        code = message["header"]["code"]
-
-        
-
-        if code != 0:
-
-            tts_complete = True
-
+class TTSError(Exception):
+    """语音合成失败（服务端返回错误码、连接中断或超时）"""
+    pass
+
+
+def audio_cache_key(wsParam):
+    """音频缓存键：文本 + 全部合成参数（发音人、语速、语调、音量、音频格式等）的 SHA-256"""
+    payload = json.dumps({"text": wsParam.Text, "tts": wsParam.BusinessArgs["tts"]},
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AudioCache(object):
+    """
+    合成音频的磁盘缓存（按内容寻址）
+    音频保存为 <cache_dir>/<键前2位>/<键>.mp3，索引保存在 <cache_dir>/index.db（SQLite），
+    查询只按主键读取索引，不扫描目录。
+    写入后按总大小淘汰最久未使用的条目（不会淘汰刚写入的条目），超过保存期限的条目视为未命中并删除。
+    命中时在锁内读出音频内容，由调用方写到自己的文件，之后的淘汰不影响已返回的结果
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES, max_age=TTS_CACHE_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(cache_dir, 'index.db'), timeout=10, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS audio_cache (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_audio_cache_last_access ON audio_cache(last_access)')
+        self._conn.commit()
+
+    def path_for(self, key):
+        """缓存键对应的音频文件路径"""
+        return os.path.join(self.cache_dir, key[:2], key + '.mp3')
+
+    def get(self, key):
+        """查询缓存，命中时返回音频内容（bytes），否则返回None"""
+        now = time.time()
+        path = self.path_for(key)
+        with self._lock:
+            row = self._conn.execute('SELECT created FROM audio_cache WHERE key = ?', (key,)).fetchone()
+            if row is not None and (now - row[0] > self.max_age or not os.path.exists(path)):
+                self._delete(key)
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            with open(path, 'rb') as f:
+                audio = f.read()
+            self._conn.execute('UPDATE audio_cache SET last_access = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return audio
+
+    def put(self, key, audio_file):
+        """
+        把合成好的音频加入缓存，返回缓存中的路径
+        audio_file 不是缓存路径时建立硬链接（不再写一遍音频数据，淘汰缓存条目也不影响 audio_file），
+        跨文件系统等无法链接时复制一份
+        """
+        path = self.path_for(key)
+        if os.path.abspath(audio_file) != os.path.abspath(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            part_path = f'{path}.{uuid.uuid4().hex[:8]}.part'
+            try:
+                os.link(audio_file, part_path)
+            except OSError:
+                shutil.copyfile(audio_file, part_path)
+            os.replace(part_path, path)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO audio_cache (key, size, created, last_access) VALUES (?, ?, ?, ?)',
+                (key, os.path.getsize(path), now, now)
+            )
+            self._evict(now, keep=key)
+            self._conn.commit()
+        return path
+
+    def stats(self):
+        """统计信息"""
+        with self._lock:
+            entries, total = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM audio_cache').fetchone()
+            return {'entries': entries, 'bytes': total, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+    def _evict(self, now, keep=None):
+        """删除过期条目，再按最久未使用淘汰到总大小不超过上限，keep 指定的条目除外（调用方持有锁）"""
+        expired = self._conn.execute('SELECT key FROM audio_cache WHERE created < ?', (now - self.max_age,)).fetchall()
+        for (key,) in expired:
+            self._delete(key)
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM audio_cache').fetchone()[0]
+        if total <= self.max_bytes:
             return
+        rows = self._conn.execute('SELECT key, size FROM audio_cache WHERE key IS NOT ? ORDER BY last_access',
+                                  (keep,)).fetchall()
+        for key, size in rows:
+            self._delete(key)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _delete(self, key):
+        self._conn.execute('DELETE FROM audio_cache WHERE key = ?', (key,))
+        try:
+            os.remove(self.path_for(key))
+        except OSError:
+            pass
 
-        
-
-        if "payload" in message and "audio" in message["payload"]:
-
-            audio = message["payload"]["audio"].get('audio', '')
-
-            if audio:
-
-                audio = base64.b64decode(audio)
-
-                status = message["payload"]['audio']["status"]
-
-                
-
-                with open(tts_audio_file, 'ab') as f:
-
-                    f.write(audio)
-
-                
-
-                if status == 2:
-
-                    ws.close()
-
-                    tts_complete = True
-
-    except Exception as e:
-
-        print(f"❌ on_message 错误: {e}")
-
-        import traceback
-
-        traceback.print_exc()
-
-        tts_complete = True
-
-
-
-def on_error(ws, error):
-
-    global tts_complete
-
-    print(f"❌ WebSocket 错误: {error}")
-
-    tts_complete = True
-
-
-
-def on_close(ws, close_status_code, close_msg):
-
-    global tts_complete
-
-    tts_complete = True
-
-
-
-def on_open(ws, wsParam):
-
-    def run(*args):
-
-        d = {"header": wsParam.CommonArgs,
-
-             "parameter": wsParam.BusinessArgs,
 
-             "payload": wsParam.Data}
+# 全局音频缓存
+_audio_cache = None
+_audio_cache_lock = threading.Lock()
+
+def get_audio_cache():
+    """获取全局音频缓存（单例）"""
+    global _audio_cache
+    if _audio_cache is None:
+        with _audio_cache_lock:
+            if _audio_cache is None:
+                _audio_cache = AudioCache()
+    return _audio_cache
+
+
+class TTSConnectionPool(object):
+    """
+    讯飞TTS WebSocket 连接池
+    签名URL在有效期内复用，不再每次请求计算HMAC；有请求时在后台预先建立 size 个连接（完成TLS和WebSocket握手），
+    取用时直接发送合成请求。讯飞服务端在合成结束后关闭连接，因此连接只使用一次，
+    取走后由后台线程补充；一段时间没有请求时空闲连接过期关闭，不再补充
+    """
+
+    def __init__(self, url=REQURL, api_key=APIKEY, api_secret=APISECRET, size=TTS_POOL_SIZE,
+                 max_idle=TTS_POOL_MAX_IDLE, url_ttl=TTS_URL_TTL, connect_timeout=TTS_TIMEOUT):
+        self.url = url
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.size = size
+        self.max_idle = max_idle
+        self.url_ttl = url_ttl
+        self.connect_timeout = connect_timeout
+        self._idle = []  # [(连接, 建立时间)]
+        self._signed = None  # (签名URL, 签名时间)
+        self._last_demand = float('-inf')
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats = {'warm': 0, 'cold': 0, 'expired': 0, 'signed': 0, 'connect_errors': 0}
+
+    def signed_url(self):
+        """带鉴权参数的URL，在 url_ttl 内复用同一个签名"""
+        now = time.monotonic()
+        with self._cond:
+            if self._signed is None or now - self._signed[1] > self.url_ttl:
+                self._signed = (assemble_ws_auth_url(self.url, "GET", self.api_key, self.api_secret), now)
+                self._stats['signed'] += 1
+            return self._signed[0]
+
+    def connect(self):
+        """建立一个新连接"""
+        return websocket.create_connection(self.signed_url(), timeout=self.connect_timeout,
+                                           sslopt={"cert_reqs": ssl.CERT_NONE})
+
+    def acquire(self):
+        """取一个可用连接：优先使用预先建立的连接，没有时当场建立"""
+        with self._cond:
+            self._last_demand = time.monotonic()
+            ws, stale = self._pop_idle()
+            self._stats['warm' if ws is not None else 'cold'] += 1
+            if self.size > 0:
+                self._start_refill()
+                self._cond.notify()
+        for stale_ws in stale:
+            self.release(stale_ws)
+        if ws is not None:
+            return ws
+        try:
+            return self.connect()
+        except Exception:
+            with self._cond:
+                self._stats['connect_errors'] += 1
+            raise
+
+    def release(self, ws):
+        """用完的连接直接关闭（服务端不支持在同一连接上再次合成）"""
+        try:
+            ws.close()
+        except Exception:
+            pass
 
+    def warm(self):
+        """标记即将有请求（如批量合成开始前），让后台线程立即建立连接"""
+        if self.size <= 0:
+            return
+        with self._cond:
+            self._last_demand = time.monotonic()
+            self._start_refill()
+            self._cond.notify()
+
+    def stats(self):
+        """统计信息"""
+        with self._cond:
+            return dict(self._stats, idle=len(self._idle), size=self.size)
+
+    def close(self):
+        """关闭所有空闲连接并停止后台线程"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for ws, _ in idle:
+            self.release(ws)
+
+    def _pop_idle(self):
+        """
+        取出最新的未过期连接（调用方持有锁）
+
+        返回：
+            (连接或None, 待关闭的失效连接列表)；失效连接由调用方在释放锁之后关闭
+        """
+        stale = self._expire_idle()
+        while self._idle:
+            ws, _ = self._idle.pop()
+            if ws.connected:
+                return ws, stale
+            self._stats['expired'] += 1
+            stale.append(ws)
+        return None, stale
+
+    def _expire_idle(self):
+        """取出空闲超过 max_idle 的连接（调用方持有锁），返回待关闭的连接列表"""
+        now = time.monotonic()
+        expired = []
+        while self._idle and now - self._idle[0][1] > self.max_idle:
+            ws, _ = self._idle.pop(0)
+            self._stats['expired'] += 1
+            expired.append(ws)
+        return expired
+
+    def _start_refill(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refill_loop, name='xunfei-tts-pool', daemon=True)
+            self._thread.start()
+
+    def _refill_loop(self):
+        """后台补充连接：最近 max_idle 秒内有请求时保持 size 个空闲连接"""
+        failures = 0
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                stale = self._expire_idle()
+                now = time.monotonic()
+                busy = now - self._last_demand < self.max_idle
+                refill = busy and len(self._idle) < self.size
+                if not refill and not stale:
+                    # 等到下一个空闲连接过期，或有新的请求
+                    wait = self.max_idle - (now - self._idle[0][1]) if self._idle else None
+                    self._cond.wait(wait)
+            # 关闭连接可能阻塞（网络往返），不在持有锁时进行
+            for ws in stale:
+                self.release(ws)
+            if not refill:
+                continue
+            try:
+                ws = self.connect()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                print(f"⚠️ 预建立讯飞TTS连接失败: {e}")
+                with self._cond:
+                    self._stats['connect_errors'] += 1
+                    # 退避等待期间 close() 可以立即结束线程
+                    self._cond.wait_for(lambda: self._closed, timeout=min(2 ** failures, 30))
+                continue
+            with self._cond:
+                if self._closed:
+                    self.release(ws)
+                    return
+                self._idle.append((ws, time.monotonic()))
+
+
+# 全局连接池
+_tts_pool = None
+_tts_pool_lock = threading.Lock()
+
+def get_tts_pool():
+    """获取全局连接池（单例）"""
+    global _tts_pool
+    if _tts_pool is None:
+        with _tts_pool_lock:
+            if _tts_pool is None:
+                _tts_pool = TTSConnectionPool()
+    return _tts_pool
+
+
+class SynthesisRequest(object):
+    """
+    单次合成请求的状态：输出文件、已接收的音频字节数、完成事件和结果 Future。
+    WebSocket 回调只修改本请求自己的状态，多个请求可以同时进行
+    """
+
+    def __init__(self, wsParam, output_path, on_chunk=None, on_complete=None):
+        self.wsParam = wsParam
+        self.output_path = output_path
+        self.on_chunk = on_chunk  # 每收到一段音频时调用 on_chunk(bytes)
+        self.on_complete = on_complete  # 输出文件写好后、设置 Future 结果之前调用 on_complete(output_path)
+        self.future = Future()
+        self.done = threading.Event()
+        self.bytes_received = 0
+        self._part_path = f'{output_path}.{uuid.uuid4().hex[:8]}.part'
+        self._file = None
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def on_open(self, ws):
+        d = {"header": self.wsParam.CommonArgs,
+             "parameter": self.wsParam.BusinessArgs,
+             "payload": self.wsParam.Data}
         ws.send(json.dumps(d))
 
-    thread.start_new_thread(run, ())
+    def on_message(self, ws, message):
+        try:
+            message = json.loads(message)
+            code = message["header"]["code"]
+            if code != 0:
+                self.finish(TTSError(f"讯飞TTS返回错误码 {code}: {message['header'].get('message', '')}"))
+                ws.close()
+                return
+            if "payload" in message and "audio" in message["payload"]:
+                audio = message["payload"]["audio"].get('audio', '')
+                if audio:
+                    self.write(base64.b64decode(audio))
+                if message["payload"]['audio']["status"] == 2:
+                    self.finish()
+                    ws.close()
+        except Exception as e:
+            self.finish(e)
+            ws.close()
 
+    def write(self, audio):
+        """追加一段音频到临时文件"""
+        with self._lock:
+            if self._finished:
+                return
+            if self._file is None:
+                self._file = open(self._part_path, 'wb')
+            self._file.write(audio)
+            self.bytes_received += len(audio)
+        if self.on_chunk is not None:
+            self.on_chunk(audio)
+
+    def finish(self, error=None):
+        """
+        结束请求，只有第一次调用生效
+        成功时把临时文件改名为输出文件并设置 Future 结果，失败时删除临时文件并设置异常；
+        保存文件失败时 Future 也会以异常结束，不会一直处于运行状态
+        """
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+            try:
+                if self._file is not None:
+                    self._file.close()
+                if error is None and self.bytes_received == 0:
+                    error = TTSError("未收到音频数据")
+                if error is None:
+                    os.replace(self._part_path, self.output_path)
+            except Exception as e:
+                error = TTSError(f"保存音频文件失败: {e}")
+            if error is not None:
+                try:
+                    if os.path.exists(self._part_path):
+                        os.remove(self._part_path)
+                except OSError:
+                    pass
+        if error is None and self.on_complete is not None:
+            try:
+                self.on_complete(self.output_path)
+            except Exception as e:
+                print(f"⚠️ 合成完成回调失败: {e}")
+        if error is None:
+            self.future.set_result(self.output_path)
+        else:
+            self.future.set_exception(error)
+        self.done.set()
+
+
+class XunfeiTTSClient(object):
+    """
+    科大讯飞TTS客户端
+    每次合成使用独立的 SynthesisRequest，在线程池中通过连接池（TTSConnectionPool）的连接完成，结束时通过 Future 通知；
+    submit() 返回 concurrent.futures.Future，synthesize() 阻塞等待，synthesize_async() 供 asyncio 代码使用
+    """
+
+    def __init__(self, appid=APPID, api_key=APIKEY, api_secret=APISECRET, url=REQURL,
+                 audio_dir=AUDIO_SAVE_DIR, max_workers=TTS_MAX_WORKERS, timeout=TTS_TIMEOUT,
+                 use_cache=TTS_CACHE_ENABLED, cache=None, pool=None):
+        self.appid = appid
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.url = url
+        self.audio_dir = audio_dir
+        self.timeout = timeout
+        self.cache = (cache or get_audio_cache()) if use_cache else None
+        if pool is None:
+            # 使用默认配置时共享全局连接池
+            default_account = (appid, api_key, api_secret, url) == (APPID, APIKEY, APISECRET, REQURL)
+            pool = get_tts_pool() if default_account else TTSConnectionPool(url, api_key, api_secret)
+        self.pool = pool
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='xunfei-tts')
+
+    def new_audio_path(self):
+        """生成不重复的音频文件路径（同一秒内的多个请求也不会冲突）"""
+        os.makedirs(self.audio_dir, exist_ok=True)
+        audio_filename = f'tts_{int(time.time())}_{uuid.uuid4().hex[:8]}.mp3'
+        return os.path.join(self.audio_dir, audio_filename)
+
+    def submit(self, text, output_path=None, on_chunk=None, tts_args=None):
+        """
+        提交合成请求，立即返回
+
+        参数：
+            text: 要合成的文本
+            output_path: 输出文件路径，为None时在 audio_dir 中生成
+            on_chunk: 收到每段音频时的回调（在工作线程中调用；缓存命中时以整个文件调用一次）
+            tts_args: 覆盖默认合成参数（Ws_Param.BusinessArgs["tts"]），如 {"vcn": ..., "speed": 60}
+
+        返回：
+            Future，结果为音频文件路径；失败时为 TTSError 等异常
+        """
+        wsParam = Ws_Param(self.appid, self.api_key, self.api_secret, text)
+        if tts_args:
+            wsParam.BusinessArgs["tts"].update(tts_args)
+        request = SynthesisRequest(wsParam, output_path or self.new_audio_path(), on_chunk)
+        key = None
+        if self.cache is not None:
+            key = audio_cache_key(wsParam)
+            # 在调用方拿到结果（并可能删除文件）之前写入缓存
+            request.on_complete = lambda path: self._store(key, path)
+        # 缓存查询也在工作线程中进行（SQLite 读写不阻塞调用方，包括 synthesize_async 所在的事件循环）
+        self._executor.submit(self._run, request, key)
+        return request.future
+
+    def synthesize(self, text, output_path=None, on_chunk=None, tts_args=None):
+        """合成文本并等待完成，返回音频文件路径"""
+        return self.submit(text, output_path, on_chunk, tts_args).result()
+
+    async def synthesize_async(self, text, output_path=None, on_chunk=None, tts_args=None):
+        """synthesize 的 asyncio 版本，等待期间不占用事件循环"""
+        return await asyncio.wrap_future(self.submit(text, output_path, on_chunk, tts_args))
+
+    def close(self, cancel_pending=False):
+        """不再接受新请求；cancel_pending 为 True 时丢弃尚未开始的请求，否则已提交的请求继续完成"""
+        self._executor.shutdown(wait=False, cancel_futures=cancel_pending)
+
+    def _store(self, key, audio_file):
+        try:
+            self.cache.put(key, audio_file)
+        except Exception as e:
+            print(f"⚠️ 写入音频缓存失败: {e}")
+
+    def _run(self, request, cache_key=None):
+        """在工作线程中完成一次合成；任何未处理的异常都会结束请求，Future 不会一直处于运行状态"""
+        # 排队期间被取消的请求不再发起连接
+        if not request.future.set_running_or_notify_cancel():
+            return
+        try:
+            self._synthesize(request, cache_key)
+        except Exception as e:
+            request.finish(e)
+
+    def _synthesize(self, request, cache_key=None):
+        """
+        先查缓存（给出 cache_key 时），未命中时从连接池取连接、发送请求、接收音频直到最后一帧或超时。
+        连接在收到任何音频之前失效时（如预先建立的连接已被服务端关闭），换一个新连接重试
+        """
+        if cache_key is not None:
+            try:
+                audio = self.cache.get(cache_key)
+            except Exception as e:
+                print(f"⚠️ 读取音频缓存失败: {e}")
+                audio = None
+            if audio is not None:
+                # 缓存命中：不建立WebSocket连接，也不再写回缓存
+                request.on_complete = None
+                request.write(audio)
+                request.finish()
+                return
+        deadline = time.monotonic() + self.timeout
+        for attempt in range(TTS_CONNECT_RETRIES + 1):
+            try:
+                ws = self.pool.acquire()
+            except Exception as e:
+                request.finish(TTSError(f"连接讯飞TTS失败: {e}"))
+                return
+            try:
+                request.on_open(ws)
+                while not request.done.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise websocket.WebSocketTimeoutException()
+                    ws.settimeout(remaining)
+                    message = ws.recv()
+                    if not message:
+                        raise websocket.WebSocketConnectionClosedException("连接已被服务端关闭")
+                    request.on_message(ws, message)
+                return
+            except websocket.WebSocketTimeoutException:
+                request.finish(TTSError(f"合成超时（{self.timeout}秒）"))
+                return
+            except Exception as e:
+                if request.bytes_received == 0 and attempt < TTS_CONNECT_RETRIES and not request.done.is_set():
+                    continue
+                request.finish(TTSError(f"连接在合成完成前关闭: {e}"))
+                return
+            finally:
+                self.pool.release(ws)
+
+
+# 全局客户端
+_tts_client = None
+_tts_client_lock = threading.Lock()
+
+def get_tts_client():
+    """获取全局TTS客户端（单例）"""
+    global _tts_client
+    if _tts_client is None:
+        with _tts_client_lock:
+            if _tts_client is None:
+                _tts_client = XunfeiTTSClient()
+    return _tts_client
 
 
 def play_audio(file_path):
@@ -383,140 +881,396 @@ def play_audio(file_path):
 
 
 def text_to_speech(text):
-
-    """科大讯飞TTS函数 - 主入口"""
-
-    global tts_audio_file, tts_complete
-
+    """科大讯飞TTS函数 - 主入口（合成并播放，返回音频文件路径，失败时返回None）"""
     try:
-
         if SAVE_AUDIO:
-
-            if not os.path.exists(AUDIO_SAVE_DIR):
-
-                os.makedirs(AUDIO_SAVE_DIR)
-
-        
-
-        timestamp = int(time.time())
-
-        if SAVE_AUDIO:
-
-            audio_filename = f'tts_{timestamp}.mp3'
-
-            tts_audio_file = os.path.join(AUDIO_SAVE_DIR, audio_filename)
-
+            tts_audio_file = None
         else:
+            tts_audio_file = f'tts_temp_{int(time.time())}_{uuid.uuid4().hex[:8]}.mp3'
 
-            tts_audio_file = f'tts_temp_{timestamp}.mp3'
-
-        
-
-        if os.path.exists(tts_audio_file):
-
-            os.remove(tts_audio_file)
-
-        
-
-        tts_complete = False
-
-        wsParam = Ws_Param(APPID, APIKEY, APISECRET, text)
-
-        wsUrl = assemble_ws_auth_url(REQURL, "GET", APIKEY, APISECRET)
-
-        
-
-        ws = WebSocketApp(wsUrl, 
-
-                                   on_message=on_message, 
-
-                                   on_error=on_error, 
-
-                                   on_close=on_close)
-
-        ws.on_open = lambda ws: on_open(ws, wsParam)
-
-        
-
-        def run_ws():
-
-            try:
-
-                ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
-
-            except:
-
-                global tts_complete
-
-                tts_complete = True
-
-        
-
-        thread.start_new_thread(run_ws, ())
-
-        time.sleep(0.5)
-
-        
-
-        timeout = 15
-
-        start_time = time.time()
-
-        while not tts_complete and (time.time() - start_time) < timeout:
-
-            time.sleep(0.1)
-
-        
-
+        tts_audio_file = get_tts_client().synthesize(text, tts_audio_file)
+        print(f"✅ 音频文件已生成: {tts_audio_file}")
+        play_audio(tts_audio_file)
+        print("✅ 音频播放完成")
+        return tts_audio_file
+    except Exception as e:
+        print(f"❌ TTS错误: {e}")
+        traceback.print_exc()
+        return None
+
+
+# ========== 边生成边朗读 ==========
+
+# 句末标点（遇到时切分句子）
+SENTENCE_ENDINGS = '。！？!?；;…\n'
+
+# 紧跟在句末标点后、应归入同一句的字符
+SENTENCE_TRAILERS = '。！？!?；;…”’）)」』'
+
+# 句子过长时的次级切分点
+CLAUSE_BREAKS = '，,、：:'
+
+# 支持从标准输入播放MP3数据流的播放器（按顺序尝试）
+STREAM_PLAYER_COMMANDS = [
+    ['mpg123', '-q', '-'],
+    ['ffplay', '-nodisp', '-autoexit', '-loglevel', 'quiet', '-i', '-'],
+]
+
+
+class SentenceSplitter(object):
+    """把逐段到达的文本切分成句子，供逐句合成"""
+
+    def __init__(self, min_chars=TTS_MIN_SENTENCE_CHARS, max_chars=TTS_MAX_SENTENCE_CHARS):
+        self.min_chars = min_chars  # 短于该长度的句子与下一句合并
+        self.max_chars = max_chars  # 超过该长度仍无句末标点时在逗号处切分
+        self._buffer = ''
+
+    def feed(self, text):
+        """追加文本，返回已完整的句子列表"""
+        self._buffer += text
+        sentences = []
+        start = 0
+        i = 0
+        while i < len(self._buffer):
+            if self._buffer[i] in SENTENCE_ENDINGS:
+                end = i + 1
+                while end < len(self._buffer) and self._buffer[end] in SENTENCE_TRAILERS:
+                    end += 1
+                # 标点在缓冲区末尾时，后续文本可能还有引号等结尾字符，等下一段再切
+                if end == len(self._buffer):
+                    break
+                if len(self._buffer[start:end].strip()) >= self.min_chars:
+                    sentences.append(self._buffer[start:end].strip())
+                    start = end
+                i = end
+            else:
+                i += 1
+        self._buffer = self._buffer[start:]
+        while len(self._buffer) >= self.max_chars:
+            cut = max(self._buffer.rfind(c, 0, self.max_chars) for c in CLAUSE_BREAKS) + 1
+            if cut <= 0:
+                cut = self.max_chars
+            sentences.append(self._buffer[:cut].strip())
+            self._buffer = self._buffer[cut:]
+        return [s for s in sentences if s]
+
+    def flush(self):
+        """文本结束，返回剩余内容"""
+        rest = self._buffer.strip()
+        self._buffer = ''
+        return [rest] if rest else []
+
+
+class AudioStreamPlayer(object):
+    """通过外部播放器的标准输入播放MP3数据流，收到数据即开始发声"""
+
+    def __init__(self, command):
+        import subprocess
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def feed(self, audio):
         try:
-
-            ws.close()
-
-        except:
-
+            self._process.stdin.write(audio)
+            self._process.stdin.flush()
+        except (BrokenPipeError, OSError):
             pass
 
-        
-
-        if os.path.exists(tts_audio_file) and os.path.getsize(tts_audio_file) > 0:
-
-            print(f"✅ 音频文件已生成: {tts_audio_file}")
-
-            play_audio(tts_audio_file)
+    def close(self):
+        """数据结束，等待播放完成"""
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.wait()
 
-            print("✅ 音频播放完成")
 
+def open_stream_player():
+    """打开流式播放器；系统中没有可用的播放器时返回None（改为逐句播放文件）"""
+    import shutil
+    for command in STREAM_PLAYER_COMMANDS:
+        if shutil.which(command[0]):
+            try:
+                return AudioStreamPlayer(command)
+            except OSError:
+                continue
+    return None
+
+
+class SpeechPipeline(object):
+    """
+    边生成边朗读：文本增量 -> 切分句子 -> 并发合成 -> 按顺序播放
+    每个句子切出后立即提交合成，播放线程按句子顺序播放，因此播放第N句时后面的句子已在合成；
+    有流式播放器时音频片段一到达就送入播放器，否则每句合成完成后播放其文件
+
+    用法：
+        pipeline = SpeechPipeline()
+        for delta in stream:
+            pipeline.feed(delta)
+        pipeline.close()  # 等待全部播放完成
+    """
+
+    def __init__(self, client=None, player=None):
+        self.client = client or get_tts_client()
+        self.splitter = SentenceSplitter()
+        self.player = player if player is not None else open_stream_player()
+        self.errors = []  # 合成失败的句子 (句子, 异常)
+        self._sentences = queue.Queue()
+        self._thread = threading.Thread(target=self._play_loop, name='tts-playback', daemon=True)
+        self._thread.start()
+
+    def feed(self, text):
+        """追加文本（如LLM流式输出的片段）"""
+        for sentence in self.splitter.feed(text):
+            self._speak(sentence)
+
+    def close(self):
+        """文本结束：合成剩余内容，并等待全部播放完成"""
+        for sentence in self.splitter.flush():
+            self._speak(sentence)
+        self._sentences.put(None)
+        self._thread.join()
+
+    def _speak(self, sentence):
+        chunks = queue.Queue()
+        if SAVE_AUDIO:
+            output_path = None
         else:
-
-            print(f"❌ 音频文件未生成或为空: {tts_audio_file}")
-
-            
-
+            output_path = os.path.join(tempfile.gettempdir(), f'tts_temp_{uuid.uuid4().hex}.mp3')
+        future = self.client.submit(sentence, output_path, on_chunk=chunks.put)
+        future.add_done_callback(lambda f: chunks.put(None))
+        self._sentences.put((sentence, chunks, future))
+
+    def _play_loop(self):
+        while True:
+            item = self._sentences.get()
+            if item is None:
+                break
+            sentence, chunks, future = item
+            if self.player is not None:
+                # 合成过程中逐段送入播放器
+                while True:
+                    chunk = chunks.get()
+                    if chunk is None:
+                        break
+                    self.player.feed(chunk)
+            error = future.exception()
+            if error is not None:
+                print(f"⚠️ 句子合成失败，已跳过: {sentence[:20]} ({error})")
+                self.errors.append((sentence, error))
+                continue
+            audio_file = future.result()
+            if self.player is None:
+                play_audio(audio_file)
             if not SAVE_AUDIO:
-
-                time.sleep(1)
-
                 try:
-
-                    if os.path.exists(tts_audio_file):
-
-                        os.remove(tts_audio_file)
-
-                except:
-
+                    os.remove(audio_file)
+                except OSError:
                     pass
-
-    except Exception as e:
-
-        print(f"❌ TTS错误: {e}")
-
-        import traceback
-
-        traceback.print_exc()
+        if self.player is not None:
+            self.player.close()
+
+
+# ========== 批量合成 ==========
+
+# MPEG 音频帧头解析表：比特率（kbps），按 [MPEG-1, MPEG-2/2.5] 区分（仅 Layer III）
+_MP3_BITRATES = (
+    (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+)
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def mp3_duration(file_path):
+    """逐帧解析MP3帧头计算时长（秒），兼容可变比特率；无法解析时返回None"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    pos = 0
+    # 跳过 ID3v2 标签
+    if data[:3] == b'ID3' and len(data) >= 10:
+        pos = 10 + ((data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9])
+    seconds = 0.0
+    frames = 0
+    while pos + 4 <= len(data):
+        header = int.from_bytes(data[pos:pos + 4], 'big')
+        version = (header >> 19) & 0x3
+        layer = (header >> 17) & 0x3
+        bitrate_index = (header >> 12) & 0xF
+        sample_rate_index = (header >> 10) & 0x3
+        if ((header >> 21) & 0x7FF) != 0x7FF or version == 1 or layer != 1 \
+                or bitrate_index in (0, 15) or sample_rate_index == 3:
+            # 不是 Layer III 帧头，向后查找同步字
+            pos += 1
+            continue
+        sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+        bitrate = _MP3_BITRATES[0 if version == 3 else 1][bitrate_index] * 1000
+        samples = 1152 if version == 3 else 576
+        padding = (header >> 9) & 0x1
+        pos += samples // 8 * bitrate // sample_rate + padding
+        seconds += samples / sample_rate
+        frames += 1
+    return round(seconds, 3) if frames else None
+
+
+def load_manifest(manifest_path):
+    """读取清单，返回 {id: 最后一条记录}（清单不存在时为空）"""
+    records = {}
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 上次中断时可能留下不完整的最后一行
+                continue
+            records[record['id']] = record
+    return records
+
+
+def read_batch_items(input_path):
+    """
+    读取批量合成的输入（JSONL），每行一个条目：
+        {"id": "ll_intro", "text": "要合成的文本", "tts": {"vcn": "...", "speed": 60}, "output": "ll_intro.mp3"}
+    只有 text 必填；也可以直接写一个JSON字符串。未给出 id 时使用文本和合成参数的哈希。
+    每个条目附带 cache_key（文本和合成参数的完整哈希），用于判断上次的结果是否仍然有效
+
+    返回：
+        (条目列表, 无法解析的行 [(行号, 错误)])
+    """
+    items = []
+    invalid = []
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                if isinstance(item, str):
+                    item = {'text': item}
+                if not isinstance(item, dict) or not isinstance(item.get('text'), str) or not item['text'].strip():
+                    raise ValueError("缺少 text 字段")
+            except ValueError as e:
+                invalid.append((line_number, str(e)))
+                continue
+            tts_args = item.get('tts') or {}
+            wsParam = Ws_Param(APPID, APIKEY, APISECRET, item['text'])
+            wsParam.BusinessArgs['tts'].update(tts_args)
+            item['cache_key'] = audio_cache_key(wsParam)
+            if 'id' not in item:
+                item['id'] = item['cache_key'][:16]
+            item['id'] = str(item['id'])
+            item['tts'] = tts_args
+            item['line'] = line_number
+            items.append(item)
+    return items, invalid
+
+
+def render_batch(input_path, out_dir, workers=TTS_MAX_WORKERS, manifest_path=None, use_cache=TTS_CACHE_ENABLED):
+    """
+    批量合成（不播放）
+    每个条目完成后立即追加一条记录到清单（JSONL）：输出文件、字节数、时长、cache_key 或失败原因。
+    再次运行时跳过清单中已成功、文件仍存在且文本和合成参数（cache_key）、输出路径都没有变化的条目，
+    因此中断后可以直接重新运行继续；修改了文本或参数的条目会重新合成
+
+    参数：
+        input_path: 输入JSONL文件，格式见 read_batch_items
+        out_dir: 输出文件夹
+        workers: 同时进行的合成请求数
+        manifest_path: 清单路径，默认为 <out_dir>/manifest.jsonl
+        use_cache: 是否使用音频缓存
+
+    返回：
+        统计信息 {'total', 'skipped', 'succeeded', 'failed'}
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(out_dir, 'manifest.jsonl')
+    items, invalid = read_batch_items(input_path)
+    previous = load_manifest(manifest_path)
+
+    pending = []
+    seen = set()
+    for item in items:
+        if item['id'] in seen:
+            print(f"⚠️ 第{item['line']}行的 id 重复，已跳过: {item['id']}")
+            continue
+        seen.add(item['id'])
+        item['output'] = os.path.join(out_dir, item.get('output') or f"{item['id']}.mp3")
+        record = previous.get(item['id'])
+        if (record and record['status'] == 'ok' and record.get('cache_key') == item['cache_key']
+                and record['file'] == item['output'] and os.path.exists(record['file'])):
+            continue
+        pending.append(item)
+
+    summary = {'total': len(seen), 'skipped': len(seen) - len(pending), 'succeeded': 0, 'failed': len(invalid)}
+    print(f"共 {len(seen)} 条，已完成 {summary['skipped']} 条，待合成 {len(pending)} 条，并发数 {workers}")
+
+    pool = TTSConnectionPool(size=workers)
+    client = XunfeiTTSClient(max_workers=workers, use_cache=use_cache, pool=pool)
+    futures = {}
+    try:
+        with open(manifest_path, 'a', encoding='utf-8') as manifest:
+            def write_record(record):
+                manifest.write(json.dumps(record, ensure_ascii=False) + '\n')
+                manifest.flush()
+                os.fsync(manifest.fileno())
+
+            for line_number, error in invalid:
+                write_record({'id': f'line-{line_number}', 'line': line_number, 'status': 'failed', 'error': error})
+
+            pool.warm()
+            for item in pending:
+                futures[client.submit(item['text'], item['output'], tts_args=item['tts'])] = item
+
+            for done, future in enumerate(as_completed(futures), 1):
+                item = futures[future]
+                record = {'id': item['id'], 'line': item['line'], 'text': item['text'], 'cache_key': item['cache_key']}
+                try:
+                    audio_file = future.result()
+                    record.update(status='ok', file=audio_file, bytes=os.path.getsize(audio_file),
+                                  duration=mp3_duration(audio_file))
+                    summary['succeeded'] += 1
+                    print(f"[{done}/{len(futures)}] ✅ {item['id']} ({record['duration']}秒)")
+                except Exception as e:
+                    record.update(status='failed', error=str(e))
+                    summary['failed'] += 1
+                    print(f"[{done}/{len(futures)}] ❌ {item['id']}: {e}")
+                write_record(record)
+    finally:
+        # 中断（如 Ctrl+C）时取消还没开始的合成，不再占用工作线程；正在进行的合成最多再持续 timeout 秒
+        for future in futures:
+            future.cancel()
+        client.close(cancel_pending=True)
+        pool.close()
+
+    print(f"完成：成功 {summary['succeeded']} 条，失败 {summary['failed']} 条，跳过 {summary['skipped']} 条；清单: {manifest_path}")
+    return summary
+
+
+def main(argv=None):
+    """命令行入口：python xunfei_tts.py batch 输入.jsonl 输出文件夹 [-w 并发数]"""
+    import argparse
+    parser = argparse.ArgumentParser(description='科大讯飞TTS')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    batch_parser = subparsers.add_parser('batch', help='批量合成JSONL中的文本（不播放，可中断后继续）')
+    batch_parser.add_argument('input', help='输入JSONL文件，每行 {"id": ..., "text": ..., "tts": {...}}')
+    batch_parser.add_argument('out_dir', help='输出文件夹')
+    batch_parser.add_argument('-w', '--workers', type=int, default=TTS_MAX_WORKERS, help='同时进行的合成请求数')
+    batch_parser.add_argument('--manifest', help='清单文件路径（默认 <输出文件夹>/manifest.jsonl）')
+    batch_parser.add_argument('--no-cache', action='store_true', help='不使用音频缓存')
+    args = parser.parse_args(argv)
+
+    summary = render_batch(args.input, args.out_dir, workers=args.workers,
+                           manifest_path=args.manifest, use_cache=not args.no_cache)
+    return 1 if summary['failed'] else 0
 
 
 # 测试代码
 if __name__ == "__main__":
+    # 带参数运行时为命令行模式，如: python xunfei_tts.py batch texts.jsonl narration/ -w 8
+    if len(sys.argv) > 1:
+        sys.exit(main())
+
     # 检查API配置
     if APPID == 'APPID' or APIKEY == 'APIKEY' or APISECRET == 'APISECRET':
         print("⚠️  警告：请先配置科大讯飞API信息！")